@@ -7,13 +7,21 @@ le immagini in una cartella sostituendo i nomi con i codici "gemelli".
 """
 
 import typer
+import json
 import logging
 import sys
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
-from renamer.excel_map import build_map
-from renamer.file_ops import process_images
+from renamer.batch import load_manifest, run_batch
+from renamer.file_ops import (TRANSFER_MODES, ProcessOptions, apply_plan, default_workers, process_images,
+                              run_sharded)
+from renamer.log_utils import ProgressBar, start_queue_logging, stop_queue_logging
+from renamer.name_index import DEFAULT_MAX_CONFLICTS
+from renamer.plan import PlanReader, PlanWriter
+from renamer.map_cache import load_map_cached
+from renamer.shards import check_run_id, default_run_id, merge_shards, parse_shard, try_merge
+from renamer.watcher import DEFAULT_DEBOUNCE, DEFAULT_INTERVAL, FolderWatcher
 
 # Configurazione logging
 logging.basicConfig(
@@ -30,20 +38,25 @@ app = typer.Typer(
     no_args_is_help=True
 )
 
+# Sottocomandi; senza sottocomando si esegue `run` (vedi _with_default_command)
+COMMANDS = ('run', 'watch', 'batch', 'apply', 'merge')
 
-@app.command()
+
+@app.command("run")
 def main(
     excel: str = typer.Option(
         ...,
         "--excel",
         "-e",
-        help="Percorso al file Excel (.xlsx) con colonne CodeX e CodeY"
+        help="Percorso al file Excel (.xlsx) con colonne CodeX e CodeY (accettato anche un CSV a 2 colonne)"
     ),
     input_dir: str = typer.Option(
         ...,
         "--input-dir",
         "-i",
-        help="Cartella contenente le immagini da rinominare"
+        help="Cartella contenente le immagini da rinominare (i nomi di ogni cartella vengono "
+             "letti e ordinati prima di processarla: con milioni di immagini in una sola "
+             "cartella, circa 100 byte di memoria per immagine)"
     ),
     output_dir: str = typer.Option(
         ...,
@@ -61,6 +74,124 @@ def main(
         "--dry-run",
         help="Simula le operazioni senza eseguirle realmente"
     ),
+    plan: Optional[str] = typer.Option(
+        None,
+        "--plan",
+        help="Non esegue nulla: salva il piano delle operazioni (JSON Lines, .gz per comprimerlo) "
+             "da rivedere ed eseguire poi con il comando apply"
+    ),
+    recursive: bool = typer.Option(
+        False,
+        "--recursive",
+        "-r",
+        help="Cerca le immagini anche nelle sottocartelle"
+    ),
+    max_depth: Optional[int] = typer.Option(
+        None,
+        "--max-depth",
+        help="Profondità massima della ricerca ricorsiva (0 = solo la cartella di input)"
+    ),
+    include: Optional[List[str]] = typer.Option(
+        None,
+        "--include",
+        help="Pattern glob dei file da includere (ripetibile, es. --include 'estate/*')"
+    ),
+    exclude: Optional[List[str]] = typer.Option(
+        None,
+        "--exclude",
+        help="Pattern glob di file o cartelle da escludere (ripetibile)"
+    ),
+    mirror: bool = typer.Option(
+        False,
+        "--mirror",
+        help="Riproduce in output la struttura delle sottocartelle di input"
+    ),
+    mode: str = typer.Option(
+        "copy",
+        "--mode",
+        "-m",
+        help="Come scrivere l'output: copy, hardlink, reflink, symlink o move "
+             "(ripiego automatico sulla copia se non supportato)"
+    ),
+    workers: int = typer.Option(
+        0,
+        "--workers",
+        "-w",
+        help="Thread usati per copiare i file (0 = automatico in base alle CPU, 1 = sequenziale)"
+    ),
+    max_conflicts: int = typer.Option(
+        DEFAULT_MAX_CONFLICTS,
+        "--max-conflicts",
+        help="Suffissi _1, _2, ... massimi per lo stesso nome di output (0 = nessun limite)"
+    ),
+    journal: bool = typer.Option(
+        False,
+        "--journal",
+        help="Registra le operazioni in un journal nella cartella di output: "
+             "rieseguendo si saltano i file invariati e si riprendono le esecuzioni interrotte"
+    ),
+    shard: Optional[str] = typer.Option(
+        None,
+        "--shard",
+        help="Processa solo lo shard i di N (es. 1/4), per dividere il lavoro tra macchine "
+             "con output condiviso; l'ultimo shard che termina unisce i risultati"
+    ),
+    run_id: Optional[str] = typer.Option(
+        None,
+        "--run-id",
+        help="Identificativo comune a tutti gli shard di un'esecuzione (es. ID del job di CI); "
+             "default derivato da mapping, cartelle e N. Usane uno nuovo per ripetere "
+             "un'esecuzione interrotta"
+    ),
+    processes: int = typer.Option(
+        1,
+        "--processes",
+        "-p",
+        help="Processi in parallelo su questa macchina (uno shard ciascuno)"
+    ),
+    dedup: bool = typer.Option(
+        False,
+        "--dedup",
+        help="Non riscrive contenuti già presenti: file identici in output restano invariati "
+             "(niente copie _N) e i sorgenti identici diventano hardlink della prima copia"
+    ),
+    report_json: Optional[str] = typer.Option(
+        None,
+        "--report-json",
+        help="Salva il report dettagliato (tempi per fase, byte, errori, operazioni) in un file JSON"
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Legge il file .xlsx in streaming (a blocchi di righe, senza DataFrame)"
+    ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="Non usa la cache delle mappe già costruite"
+    ),
+    rebuild_cache: bool = typer.Option(
+        False,
+        "--rebuild-cache",
+        help="Ricostruisce la mappa e aggiorna la cache"
+    ),
+    quiet: bool = typer.Option(
+        False,
+        "--quiet",
+        "-q",
+        help="Niente riga per ogni file: barra di avanzamento, avvisi campionati e riepilogo"
+    ),
+    max_warnings: Optional[int] = typer.Option(
+        None,
+        "--max-warnings",
+        help="Codici non trovati da segnalare (deduplicati) prima di limitarsi a contarli "
+             "(default: tutti, 20 con --quiet)"
+    ),
+    progress: Optional[bool] = typer.Option(
+        None,
+        "--progress/--no-progress",
+        help="Avanzamento con file esaminati e file/s (default: attiva con --quiet)"
+    ),
     verbose: bool = typer.Option(
         False,
         "--verbose",
@@ -69,7 +200,7 @@ def main(
     )
 ):
     """
-    Rinomina immagini basandosi su mapping Excel.
+    Rinomina immagini basandosi su mapping Excel (comando predefinito).
     
     Il tool legge un file Excel con colonne 'CodeX' e 'CodeY', costruisce
     una mappa bidirezionale e rinomina le immagini il cui nome (senza estensione)
@@ -83,31 +214,37 @@ def main(
     
     try:
         # Valida input
-        excel_path = Path(excel)
-        input_path = Path(input_dir)
-        
-        if not excel_path.exists():
-            typer.echo(f"❌ Errore: File Excel non trovato: {excel}", err=True)
-            raise typer.Exit(1)
-        
-        if not input_path.exists():
-            typer.echo(f"❌ Errore: Cartella di input non trovata: {input_dir}", err=True)
-            raise typer.Exit(1)
-        
-        if not input_path.is_dir():
-            typer.echo(f"❌ Errore: Il percorso di input non è una cartella: {input_dir}", err=True)
-            raise typer.Exit(1)
+        excel_path, input_path = _validate_inputs(excel, input_dir, mode)
         
         # Prepara lista estensioni
         ext_list = [ext.strip() for ext in exts.split(',') if ext.strip()]
         
-        if dry_run:
+        shard_spec = parse_shard(shard) if shard else None
+        if shard_spec and processes > 1:
+            typer.echo("❌ Errore: --shard e --processes non si possono usare insieme", err=True)
+            raise typer.Exit(1)
+        if shard_spec:
+            run_id = check_run_id(run_id) if run_id else \
+                default_run_id(str(excel_path), str(input_path), output_dir, shard_spec[1])
+        
+        if plan:
+            if shard_spec or processes > 1:
+                typer.echo("❌ Errore: --plan non si può usare con --shard o --processes", err=True)
+                raise typer.Exit(1)
+            dry_run = True
+            typer.echo(f"🗺️  Calcolo del piano in {plan} - nessuna operazione verrà eseguita")
+        elif dry_run:
             typer.echo("🔍 Modalità DRY-RUN attivata - nessuna operazione verrà eseguita")
         
         typer.echo("📊 Costruzione mappa da file Excel...")
         
         # 1. Costruisci mappa da Excel
-        mapping = build_map(str(excel_path))
+        mapping = load_map_cached(
+            str(excel_path),
+            streaming=stream,
+            use_cache=not no_cache,
+            rebuild=rebuild_cache
+        ).mapping
         
         if not mapping:
             typer.echo("❌ Errore: Nessun mapping valido trovato nel file Excel", err=True)
@@ -118,21 +255,72 @@ def main(
         # 2. Processa immagini
         typer.echo("🖼️  Inizio processamento immagini...")
         
-        processed, skipped, errors = process_images(
-            mapping=mapping,
-            input_dir=str(input_path),
-            output_dir=output_dir,
-            exts=ext_list,
-            dry_run=dry_run
-        )
+        progress_bar = None
+        show_progress = quiet if progress is None else progress
+        if show_progress and processes <= 1:
+            # Senza conteggio preliminare: una seconda scansione dell'input
+            # raddoppierebbe l'I/O sulle cartelle grandi, quindi la barra
+            # mostra i file esaminati e i file/s, senza percentuale né ETA
+            progress_bar = ProgressBar()
+        operations_log = _operations_log(report_json) if processes <= 1 else None
+        
+        # Gli handler di log girano su un thread separato durante il processamento
+        # (non con più processi: i processi figli scrivono direttamente)
+        listener = start_queue_logging() if processes <= 1 else None
+        try:
+            options = ProcessOptions(
+                exts=ext_list,
+                dry_run=dry_run,
+                workers=workers or default_workers(),
+                mode=mode,
+                max_conflicts=max_conflicts,
+                recursive=recursive,
+                max_depth=max_depth,
+                include=include or (),
+                exclude=exclude or (),
+                mirror=mirror,
+                journal=journal,
+                quiet=quiet,
+                max_warnings=max_warnings,
+                dedup=dedup
+            )
+            if processes > 1:
+                typer.echo(f"🔀 Esecuzione in {processes} processi")
+                report = run_sharded(processes, mapping, str(input_path), output_dir, options)
+            else:
+                plan_writer = PlanWriter(plan, str(input_path), output_dir, mode, mirror=mirror,
+                                         journal=journal, mapping_file=str(excel_path)) if plan else None
+                try:
+                    report = process_images(mapping, str(input_path), output_dir, options,
+                                            progress=progress_bar, shard=shard_spec,
+                                            run_id=run_id if shard_spec else None,
+                                            plan=plan_writer, operations_log=operations_log)
+                except BaseException:
+                    if plan_writer:
+                        plan_writer.abort()
+                    raise
+                if plan_writer:
+                    plan_writer.finish(report)
+                if shard_spec and not dry_run:
+                    merged = try_merge(output_dir, shard_spec[1], run_id)
+                    if merged is None:
+                        typer.echo(f"🧩 Shard {shard} completato: il merge avverrà al termine degli altri shard")
+                    else:
+                        typer.echo(f"🧩 Tutti gli shard completati: risultati uniti in {output_dir}")
+                        report = merged
+        finally:
+            if progress_bar:
+                progress_bar.close()
+            if listener:
+                stop_queue_logging(listener)
+        processed, skipped, errors = report
         
         # 3. Report finale
-        typer.echo("\n📋 REPORT FINALE:")
-        typer.echo(f"  ✅ File processati: {processed}")
-        typer.echo(f"  ⚠️  File saltati: {skipped}")
-        typer.echo(f"  ❌ Errori: {errors}")
+        _echo_report(report, journal or dedup, report_json, operations_log)
         
-        if dry_run:
+        if plan:
+            typer.echo(f"\n💡 Piano salvato in {plan}: eseguilo con `python app.py apply {plan}`")
+        elif dry_run:
             typer.echo("\n💡 Esegui senza --dry-run per applicare le modifiche")
         elif processed > 0:
             typer.echo(f"\n🎉 Operazioni completate! File salvati in: {output_dir}")
@@ -140,10 +328,12 @@ def main(
         # Exit code basato sui risultati
         if errors > 0:
             raise typer.Exit(1)
-        elif processed == 0:
+        elif processed == 0 and report.unchanged == 0:
             typer.echo("\n⚠️  Nessun file è stato processato")
             raise typer.Exit(1)
             
+    except typer.Exit:
+        raise
     except FileNotFoundError as e:
         typer.echo(f"❌ Errore: {str(e)}", err=True)
         raise typer.Exit(1)
@@ -156,5 +346,508 @@ def main(
         raise typer.Exit(1)
 
 
+@app.command("merge")
+def merge(
+    output_dir: str = typer.Argument(
+        ...,
+        help="Cartella di output condivisa dagli shard"
+    ),
+    count: int = typer.Argument(
+        ...,
+        help="Numero di shard (N)"
+    ),
+    run_id: Optional[str] = typer.Option(
+        None,
+        "--run-id",
+        help="Run id atteso nei manifest (default: qualsiasi, purché uguale per tutti)"
+    ),
+    report_json: Optional[str] = typer.Option(
+        None,
+        "--report-json",
+        help="Salva il report dettagliato in un file JSON"
+    ),
+    verbose: bool = typer.Option(
+        False,
+        "--verbose",
+        "-v",
+        help="Abilita output dettagliato (livello DEBUG)"
+    )
+):
+    """
+    Unisce i risultati degli shard di OUTPUT_DIR (es. dopo un merge interrotto).
+    
+    Va eseguito quando nessuno shard né altri merge sono in corso: il lock
+    del merge automatico non viene controllato.
+    """
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    
+    try:
+        report = merge_shards(output_dir, count, run_id=check_run_id(run_id) if run_id else None)
+    except (RuntimeError, ValueError) as e:
+        typer.echo(f"❌ Errore: {str(e)}", err=True)
+        raise typer.Exit(1)
+    
+    typer.echo(f"🧩 Risultati di {count} shard uniti in {output_dir}")
+    _echo_report(report, report.unchanged > 0, report_json)
+    if report.errors > 0:
+        raise typer.Exit(1)
+
+
+@app.command("watch")
+def watch(
+    excel: str = typer.Option(
+        ...,
+        "--excel",
+        "-e",
+        help="File di mapping Excel (.xlsx) o CSV, ricaricato automaticamente quando cambia"
+    ),
+    input_dir: str = typer.Option(
+        ...,
+        "--input-dir",
+        "-i",
+        help="Cartella da osservare"
+    ),
+    output_dir: str = typer.Option(
+        ...,
+        "--output-dir",
+        "-o",
+        help="Cartella di destinazione per le immagini rinominate"
+    ),
+    exts: str = typer.Option(
+        "png,jpg,jpeg,bmp,gif",
+        "--exts",
+        help="Estensioni file supportate (separate da virgola)"
+    ),
+    recursive: bool = typer.Option(
+        False,
+        "--recursive",
+        "-r",
+        help="Osserva anche le sottocartelle"
+    ),
+    max_depth: Optional[int] = typer.Option(
+        None,
+        "--max-depth",
+        help="Profondità massima della ricerca ricorsiva (0 = solo la cartella di input)"
+    ),
+    include: Optional[List[str]] = typer.Option(
+        None,
+        "--include",
+        help="Pattern glob dei file da includere (ripetibile)"
+    ),
+    exclude: Optional[List[str]] = typer.Option(
+        None,
+        "--exclude",
+        help="Pattern glob di file o cartelle da escludere (ripetibile)"
+    ),
+    mirror: bool = typer.Option(
+        False,
+        "--mirror",
+        help="Riproduce in output la struttura delle sottocartelle di input"
+    ),
+    mode: str = typer.Option(
+        "copy",
+        "--mode",
+        "-m",
+        help="Come scrivere l'output: copy, hardlink, reflink, symlink o move"
+    ),
+    workers: int = typer.Option(
+        0,
+        "--workers",
+        "-w",
+        help="Thread usati per copiare i file (0 = automatico in base alle CPU)"
+    ),
+    max_conflicts: int = typer.Option(
+        DEFAULT_MAX_CONFLICTS,
+        "--max-conflicts",
+        help="Suffissi _1, _2, ... massimi per lo stesso nome di output (0 = nessun limite)"
+    ),
+    dedup: bool = typer.Option(
+        False,
+        "--dedup",
+        help="Non riscrive contenuti già presenti in output"
+    ),
+    interval: float = typer.Option(
+        DEFAULT_INTERVAL,
+        "--interval",
+        help="Secondi tra due controlli della cartella e del file di mapping"
+    ),
+    debounce: float = typer.Option(
+        DEFAULT_DEBOUNCE,
+        "--debounce",
+        help="Secondi senza modifiche prima di processare un file (evita i file ancora in copia)"
+    ),
+    polling: bool = typer.Option(
+        False,
+        "--polling",
+        help="Usa sempre il polling invece degli eventi del filesystem "
+             "(necessario su cartelle di rete scritte da altre macchine)"
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Legge il file .xlsx in streaming (a blocchi di righe, senza DataFrame)"
+    ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="Non usa la cache delle mappe già costruite"
+    ),
+    quiet: bool = typer.Option(
+        False,
+        "--quiet",
+        "-q",
+        help="Niente riga per ogni file: avvisi campionati e riepilogo di ogni batch"
+    ),
+    max_warnings: Optional[int] = typer.Option(
+        None,
+        "--max-warnings",
+        help="Codici non trovati da segnalare per batch prima di limitarsi a contarli"
+    ),
+    verbose: bool = typer.Option(
+        False,
+        "--verbose",
+        "-v",
+        help="Abilita output dettagliato (livello DEBUG)"
+    )
+):
+    """
+    Osserva la cartella di input e rinomina le immagini nuove o modificate.
+    
+    La mappa resta in memoria e viene ricaricata quando il file di mapping
+    cambia (riprocessando solo le immagini dei codici cambiati). Le modifiche
+    vengono raccolte in batch; il journal nella cartella di output evita di
+    riscrivere i file già processati, anche dopo un riavvio. Ctrl+C per uscire.
+    """
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    
+    try:
+        _validate_inputs(excel, input_dir, mode)
+        ext_list = [ext.strip() for ext in exts.split(',') if ext.strip()]
+        
+        options = ProcessOptions(
+            exts=ext_list,
+            workers=workers or default_workers(),
+            mode=mode,
+            max_conflicts=max_conflicts,
+            recursive=recursive,
+            max_depth=max_depth,
+            include=include or (),
+            exclude=exclude or (),
+            mirror=mirror,
+            quiet=quiet,
+            max_warnings=max_warnings,
+            dedup=dedup
+        )
+        watcher = FolderWatcher(
+            excel, input_dir, output_dir, options,
+            interval=interval,
+            debounce=debounce,
+            backend='polling' if polling else 'auto',
+            streaming=stream,
+            use_cache=not no_cache
+        )
+        typer.echo(f"👀 Osservazione di {input_dir} (Ctrl+C per uscire)")
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            typer.echo(f"\n🛑 Osservazione terminata dopo {watcher.batches} batch")
+    
+    except typer.Exit:
+        raise
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"❌ Errore: {str(e)}", err=True)
+        raise typer.Exit(1)
+    except Exception as e:
+        logging.error(f"Errore inaspettato: {str(e)}")
+        typer.echo(f"❌ Errore inaspettato: {str(e)}", err=True)
+        raise typer.Exit(1)
+
+
+@app.command("batch")
+def batch(
+    manifest: str = typer.Argument(
+        ...,
+        help="Manifest JSON o YAML con i job (mapping, input_dir, output_dir, exts, mode, ...)"
+    ),
+    workers: int = typer.Option(
+        0,
+        "--workers",
+        "-w",
+        help="Thread di copia complessivi, condivisi da tutti i job (0 = automatico in base alle CPU)"
+    ),
+    parallel_jobs: int = typer.Option(
+        0,
+        "--parallel-jobs",
+        "-j",
+        help="Cartelle di output processate contemporaneamente (0 = automatico, al massimo 4)"
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Simula le operazioni senza eseguirle realmente"
+    ),
+    report_json: Optional[str] = typer.Option(
+        None,
+        "--report-json",
+        help="Salva il report consolidato (totale e dettaglio per job) in un file JSON"
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Legge i file .xlsx in streaming (a blocchi di righe, senza DataFrame)"
+    ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="Non usa la cache delle mappe già costruite"
+    ),
+    quiet: bool = typer.Option(
+        False,
+        "--quiet",
+        "-q",
+        help="Niente riga per ogni file: avvisi campionati e riepilogo di ogni job"
+    ),
+    max_warnings: Optional[int] = typer.Option(
+        None,
+        "--max-warnings",
+        help="Codici non trovati da segnalare per job prima di limitarsi a contarli"
+    ),
+    verbose: bool = typer.Option(
+        False,
+        "--verbose",
+        "-v",
+        help="Abilita output dettagliato (livello DEBUG)"
+    )
+):
+    """
+    Esegue più job (cataloghi e cartelle) descritti in un manifest, in un solo processo.
+    
+    Ogni file di mapping viene caricato una volta sola e le copie di tutti i
+    job condividono lo stesso pool di thread.
+    """
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    
+    try:
+        jobs = load_manifest(manifest)
+        typer.echo(f"📦 {len(jobs)} job dal manifest {manifest}")
+        if dry_run:
+            typer.echo("🔍 Modalità DRY-RUN attivata - nessuna operazione verrà eseguita")
+        
+        listener = start_queue_logging()
+        try:
+            report = run_batch(jobs, workers=workers, parallel_jobs=parallel_jobs, dry_run=dry_run,
+                               streaming=stream, use_cache=not no_cache, quiet=quiet,
+                               max_warnings=max_warnings)
+        finally:
+            stop_queue_logging(listener)
+        
+        typer.echo("\n📋 REPORT BATCH:")
+        for result in report.results:
+            if result.error:
+                typer.echo(f"  ❌ {result.job.name}: {result.error}")
+            else:
+                processed, skipped, errors = result.report
+                typer.echo(f"  {'✅' if not errors else '⚠️ '} {result.job.name}: {processed} processati, "
+                           f"{skipped} saltati, {errors} errori")
+        processed, skipped, errors = report.total
+        typer.echo(f"  Totale: {processed} processati, {skipped} saltati, {errors} errori "
+                   f"({report.mappings_loaded} mappe caricate)")
+        typer.echo(f"  ⏱️  Durata: {report.duration:.2f}s")
+        
+        if report_json:
+            Path(report_json).write_text(json.dumps(report.to_dict(), indent=2), encoding='utf-8')
+            typer.echo(f"  📝 Report salvato in: {report_json}")
+        
+        if errors > 0 or report.failed_jobs:
+            raise typer.Exit(1)
+    
+    except typer.Exit:
+        raise
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"❌ Errore: {str(e)}", err=True)
+        raise typer.Exit(1)
+    except Exception as e:
+        logging.error(f"Errore inaspettato: {str(e)}")
+        typer.echo(f"❌ Errore inaspettato: {str(e)}", err=True)
+        raise typer.Exit(1)
+
+
+@app.command("apply")
+def apply(
+    plan: str = typer.Argument(
+        ...,
+        help="Piano creato con `run --plan`"
+    ),
+    input_dir: Optional[str] = typer.Option(
+        None,
+        "--input-dir",
+        "-i",
+        help="Cartella di input, se diversa da quella del piano (es. montata altrove)"
+    ),
+    output_dir: Optional[str] = typer.Option(
+        None,
+        "--output-dir",
+        "-o",
+        help="Cartella di output, se diversa da quella del piano"
+    ),
+    workers: int = typer.Option(
+        0,
+        "--workers",
+        "-w",
+        help="Thread usati per copiare i file (0 = automatico in base alle CPU, 1 = sequenziale)"
+    ),
+    check_sources: bool = typer.Option(
+        True,
+        "--check-sources/--no-check-sources",
+        help="Segnala come errore i sorgenti modificati dopo la creazione del piano"
+    ),
+    report_json: Optional[str] = typer.Option(
+        None,
+        "--report-json",
+        help="Salva il report dettagliato in un file JSON"
+    ),
+    quiet: bool = typer.Option(
+        False,
+        "--quiet",
+        "-q",
+        help="Niente riga per ogni file: barra di avanzamento, avvisi campionati e riepilogo"
+    ),
+    max_warnings: Optional[int] = typer.Option(
+        None,
+        "--max-warnings",
+        help="Codici non trovati da segnalare prima di limitarsi a contarli"
+    ),
+    progress: Optional[bool] = typer.Option(
+        None,
+        "--progress/--no-progress",
+        help="Barra di avanzamento con file/s e tempo stimato (default: attiva con --quiet)"
+    ),
+    verbose: bool = typer.Option(
+        False,
+        "--verbose",
+        "-v",
+        help="Abilita output dettagliato (livello DEBUG)"
+    )
+):
+    """
+    Esegue un piano creato con `run --plan`, senza rileggere la mappa né scansionare l'input.
+    
+    Le destinazioni (con i suffissi _N) sono quelle del piano; un file il cui
+    sorgente è cambiato o la cui destinazione è stata occupata nel frattempo
+    viene segnalato come errore.
+    """
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    
+    try:
+        reader = PlanReader(plan)
+        header, total = reader.header, reader.total
+        reader.close()
+        typer.echo(f"🗺️  Piano {plan}: {total} immagini, modalità {header['mode']}")
+        
+        show_progress = quiet if progress is None else progress
+        progress_bar = ProgressBar(total) if show_progress else None
+        operations_log = _operations_log(report_json)
+        listener = start_queue_logging()
+        try:
+            report = apply_plan(plan, input_dir=input_dir, output_dir=output_dir,
+                                workers=workers or default_workers(), check_sources=check_sources,
+                                progress=progress_bar, quiet=quiet, max_warnings=max_warnings,
+                                operations_log=operations_log)
+        finally:
+            if progress_bar:
+                progress_bar.close()
+            stop_queue_logging(listener)
+        
+        _echo_report(report, report.unchanged > 0, report_json, operations_log)
+        if report.processed > 0:
+            typer.echo(f"\n🎉 Operazioni completate! File salvati in: {output_dir or header['output_dir']}")
+        if report.errors > 0:
+            raise typer.Exit(1)
+    
+    except typer.Exit:
+        raise
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"❌ Errore: {str(e)}", err=True)
+        raise typer.Exit(1)
+    except Exception as e:
+        logging.error(f"Errore inaspettato: {str(e)}")
+        typer.echo(f"❌ Errore inaspettato: {str(e)}", err=True)
+        raise typer.Exit(1)
+
+
+def _echo_report(report, show_unchanged: bool, report_json: Optional[str],
+                 operations_log: Optional[str] = None) -> None:
+    """
+    Stampa il report finale (e lo salva in JSON se richiesto, con le
+    operazioni lette da operations_log se il report non le tiene in memoria).
+    """
+    processed, skipped, errors = report
+    typer.echo("\n📋 REPORT FINALE:")
+    typer.echo(f"  ✅ File processati: {processed}")
+    typer.echo(f"  ⚠️  File saltati: {skipped}")
+    typer.echo(f"  ❌ Errori: {errors}")
+    if show_unchanged:
+        typer.echo(f"  ♻️  File invariati: {report.unchanged}")
+    if report.modes:
+        modes_used = ', '.join(f"{name} {count}" for name, count in report.mode_counts().items())
+        typer.echo(f"  🔗 Modalità usate: {modes_used}")
+    typer.echo(f"  ⏱️  Durata: {report.duration:.2f}s")
+    
+    if report_json:
+        try:
+            report.write_json(report_json, operations_log)
+        finally:
+            if operations_log:
+                Path(operations_log).unlink(missing_ok=True)
+        typer.echo(f"  📝 Report salvato in: {report_json}")
+
+
+def _operations_log(report_json: Optional[str]) -> Optional[str]:
+    """File temporaneo (accanto al report) per le operazioni del report JSON."""
+    if not report_json:
+        return None
+    path = Path(report_json)
+    return str(path.with_name(f".{path.name}.operations.jsonl"))
+
+
+def _validate_inputs(excel: str, input_dir: str, mode: str) -> Tuple[Path, Path]:
+    """Controlla file di mapping, cartella di input e modalità (esce con codice 1 se non validi)."""
+    excel_path = Path(excel)
+    input_path = Path(input_dir)
+    
+    if not excel_path.exists():
+        typer.echo(f"❌ Errore: File Excel non trovato: {excel}", err=True)
+        raise typer.Exit(1)
+    
+    if not input_path.exists():
+        typer.echo(f"❌ Errore: Cartella di input non trovata: {input_dir}", err=True)
+        raise typer.Exit(1)
+    
+    if not input_path.is_dir():
+        typer.echo(f"❌ Errore: Il percorso di input non è una cartella: {input_dir}", err=True)
+        raise typer.Exit(1)
+    
+    if mode not in TRANSFER_MODES:
+        typer.echo(f"❌ Errore: Modalità non valida: {mode}. Usa una tra: {', '.join(TRANSFER_MODES)}", err=True)
+        raise typer.Exit(1)
+    
+    return excel_path, input_path
+
+
+def _with_default_command(args: List[str]) -> List[str]:
+    """
+    Senza sottocomando (`python app.py --excel ...`, come prima dell'arrivo
+    di `watch`) esegue `run`.
+    """
+    if args and args[0] not in COMMANDS and args[0] not in ('--help', '--install-completion',
+                                                            '--show-completion'):
+        return ['run'] + args
+    return args
+
+
 if __name__ == "__main__":
-    app() 
\ No newline at end of file
+    app(args=_with_default_command(sys.argv[1:])) 
\ No newline at end of file
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark della costruzione della mappa bidirezionale.
+
+Confronta il vecchio ciclo df.iterrows() con il builder a colonne di
+renamer.mapping su cataloghi sintetici (default: 10k, 100k e 1M righe).
+
+Esempio:
+    python benchmarks/bench_build_map.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from renamer.mapping import build_bidirectional_map  # noqa: E402
+
+
+def legacy_build(df: pd.DataFrame, col_a: str, col_b: str) -> dict:
+    """Implementazione originale basata su iterrows (riferimento)."""
+    mapping = {}
+    duplicates = []
+    for _, row in df.iterrows():
+        code_a = str(row[col_a]).strip()
+        code_b = str(row[col_b]).strip()
+        if code_a in mapping or code_b in mapping:
+            duplicates.append(f"{code_a} <-> {code_b}")
+            continue
+        mapping[code_a] = code_b
+        mapping[code_b] = code_a
+    return mapping
+
+
+def make_catalog(rows: int, duplicate_rate: float = 0.01) -> pd.DataFrame:
+    """Genera un catalogo sintetico con una quota di righe duplicate."""
+    codes_x = [f"IMG{i:08d}" for i in range(rows)]
+    codes_y = [f"PRD{i:08d}" for i in range(rows)]
+    step = int(1 / duplicate_rate) if duplicate_rate > 0 else 0
+    if step:
+        for i in range(step, rows, step):
+            codes_x[i] = codes_x[i - 1]
+    return pd.DataFrame({'CodeX': codes_x, 'CodeY': codes_y})
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="Numero di righe da testare (separate da virgola)")
+    parser.add_argument('--legacy-max-rows', type=int, default=1_000_000,
+                        help="Non eseguire iterrows oltre questo numero di righe")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    print(f"{'righe':>10} {'iterrows (s)':>14} {'colonne (s)':>13} {'speedup':>9}")
+    for rows in sizes:
+        df = make_catalog(rows)
+        new_time, result = timed(build_bidirectional_map, df['CodeX'], df['CodeY'])
+
+        if rows <= args.legacy_max_rows:
+            old_time, old_mapping = timed(legacy_build, df, 'CodeX', 'CodeY')
+            if old_mapping != result.mapping:
+                print(f"ERRORE: mappe diverse con {rows} righe", file=sys.stderr)
+                return 1
+            print(f"{rows:>10} {old_time:>14.3f} {new_time:>13.3f} {old_time / new_time:>8.1f}x")
+        else:
+            print(f"{rows:>10} {'-':>14} {new_time:>13.3f} {'-':>9}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
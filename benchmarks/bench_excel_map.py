@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark della lettura Excel: pd.read_excel contro lettura in streaming.
+
+Genera un file .xlsx con CodeX/CodeY e molte colonne inutilizzate, poi esegue
+build_map in entrambe le modalità in processi separati per misurare tempo e
+picco di memoria (RSS massimo del processo figlio).
+
+Esempio:
+    python benchmarks/bench_excel_map.py --rows 50000 --extra-columns 30
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD_SCRIPT = """
+import json, logging, resource, sys, time
+sys.path.insert(0, {root!r})
+logging.disable(logging.WARNING)
+from renamer.excel_map import build_map
+start = time.perf_counter()
+mapping = build_map({path!r}, streaming={streaming!r})
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'max_rss_mb': rss_kb / 1024, 'pairs': len(mapping) // 2}}))
+"""
+
+
+def make_workbook(path: Path, rows: int, extra_columns: int) -> None:
+    """Scrive un catalogo .xlsx con colonne aggiuntive non usate dal tool."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    extra = [f"Extra{i}" for i in range(extra_columns)]
+    sheet.append(['Descrizione', 'CodeX'] + extra[: extra_columns // 2] + ['CodeY'] + extra[extra_columns // 2:])
+    filler = [f"valore {i}" for i in range(extra_columns)]
+    for i in range(rows):
+        sheet.append([f"Prodotto {i}", f"IMG{i:08d}"] + filler[: extra_columns // 2]
+                     + [f"PRD{i:08d}"] + filler[extra_columns // 2:])
+    workbook.save(path)
+
+
+def run_child(path: Path, streaming: bool) -> dict:
+    code = CHILD_SCRIPT.format(root=str(ROOT), path=str(path), streaming=streaming)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50_000, help="Righe del catalogo")
+    parser.add_argument('--extra-columns', type=int, default=30, help="Colonne non usate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'catalogo.xlsx'
+        make_workbook(path, args.rows, args.extra_columns)
+        print(f"File: {args.rows} righe, {args.extra_columns + 3} colonne, "
+              f"{path.stat().st_size / 1e6:.1f} MB")
+
+        print(f"{'modalità':>12} {'tempo (s)':>10} {'RSS max (MB)':>13} {'coppie':>8}")
+        for label, streaming in (('read_excel', False), ('streaming', True)):
+            stats = run_child(path, streaming)
+            print(f"{label:>12} {stats['seconds']:>10.2f} {stats['max_rss_mb']:>13.1f} {stats['pairs']:>8}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
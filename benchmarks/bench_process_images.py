@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark di process_images: copia sequenziale contro pool di thread.
+
+Crea una cartella di immagini sintetiche e misura il tempo di
+process_images con diversi valori di workers. Con --latency-ms ogni copia
+attende il tempo indicato prima di scrivere, per simulare la latenza di
+una cartella su NAS.
+
+Esempio:
+    python benchmarks/bench_process_images.py --files 2000 --workers 1,4,16 --latency-ms 5
+"""
+
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from renamer import file_ops  # noqa: E402
+
+
+def make_images(folder: Path, count: int, size: int) -> dict:
+    """Crea `count` file da `size` byte e restituisce la mappa relativa."""
+    folder.mkdir(parents=True, exist_ok=True)
+    payload = b'\xff\xd8' + b'\x00' * max(0, size - 2)
+    mapping = {}
+    for i in range(count):
+        source = f"IMG{i:07d}"
+        target = f"PRD{i:07d}"
+        (folder / f"{source}.jpg").write_bytes(payload)
+        mapping[source] = target
+        mapping[target] = source
+    return mapping
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=2000, help="Numero di immagini")
+    parser.add_argument('--size', type=int, default=200_000, help="Dimensione di ogni immagine (byte)")
+    parser.add_argument('--workers', default='1,4,16', help="Valori di workers da confrontare")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Latenza simulata per copia")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    if args.latency_ms > 0:
+        real_copy = shutil.copy2
+
+        def slow_copy(src, dst, **kwargs):
+            time.sleep(args.latency_ms / 1000)
+            return real_copy(src, dst, **kwargs)
+
+        file_ops.shutil.copy2 = slow_copy
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = Path(tmp) / 'input'
+        mapping = make_images(input_dir, args.files, args.size)
+        total_mb = args.files * args.size / 1e6
+
+        print(f"{args.files} file, {total_mb:.0f} MB, latenza simulata {args.latency_ms} ms")
+        print(f"{'workers':>8} {'tempo (s)':>10} {'file/s':>9} {'speedup':>9}")
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+            output_dir = Path(tmp) / f'output_{workers}'
+            start = time.perf_counter()
+            options = file_ops.ProcessOptions(exts=['jpg'], workers=workers)
+            processed, _, errors = file_ops.process_images(mapping, str(input_dir), str(output_dir),
+                                                          options)
+            elapsed = time.perf_counter() - start
+            if processed != args.files or errors:
+                print(f"ERRORE: {processed} processati, {errors} errori", file=sys.stderr)
+                return 1
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>10.2f} {processed / elapsed:>9.0f} {baseline / elapsed:>8.1f}x")
+            shutil.rmtree(output_dir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
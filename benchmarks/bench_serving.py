@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Load test della web app: server di sviluppo di Flask (`python web_app.py`,
+ZIP generato in streaming) contro gunicorn (`gunicorn -c gunicorn.conf.py
+wsgi:app`, ZIP scritto a fine job e inviato con sendfile).
+
+Ogni server parte in una cartella di lavoro temporanea; dopo un upload con
+`--files` immagini, più client concorrenti (processi separati, per non
+misurare il GIL del client) ripetono per `--duration` secondi:
+
+- health:   GET /health (overhead per richiesta)
+- status:   GET /jobs/<id> (lettura dello stato da disco)
+- download: GET /jobs/<id>/download (throughput dei risultati)
+
+Per ogni combinazione riporta richieste/s, MB/s e latenze p50/p99.
+
+Esempio:
+    python benchmarks/bench_serving.py --clients 16 --duration 10 --files 50 --size 500000
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from renamer.serving import available_cpus, worker_count  # noqa: E402
+
+
+SERVERS = {
+    'flask dev': [sys.executable, str(ROOT / 'web_app.py')],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', str(ROOT / 'gunicorn.conf.py'), 'wsgi:app'],
+}
+SCENARIOS = ('health', 'status', 'download')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command: List[str], port: int, workdir: Path) -> subprocess.Popen:
+    """Avvia il server e aspetta che /health risponda."""
+    env = dict(os.environ, PORT=str(port), FLASK_ENV='production', ACCESS_LOG='',
+               PYTHONPATH=str(ROOT), GUNICORN_BIND=f"127.0.0.1:{port}")
+    process = subprocess.Popen(command, cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            status, _ = request(port, 'GET', '/health')
+            if status == 200:
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Server non avviato: {' '.join(command)}")
+
+
+def request(port: int, method: str, path: str, body: bytes = b'',
+            headers: Dict[str, str] = None) -> Tuple[int, int]:
+    """Una richiesta su una connessione nuova: (stato, byte ricevuti)."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        connection.request(method, path, body=body or None, headers=headers or {})
+        response = connection.getresponse()
+        received = 0
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+        return response.status, received
+    finally:
+        connection.close()
+
+
+def upload_job(port: int, files: int, size: int) -> str:
+    """Carica mapping e immagini con /upload e aspetta la fine del job."""
+    boundary = uuid.uuid4().hex
+    rows = ['CodeX,CodeY'] + [f"IMG{i:06d},PRD{i:06d}" for i in range(files)]
+    parts = [('mapping_file', 'mapping.csv', ('\n'.join(rows) + '\n').encode())]
+    parts += [('images', f"IMG{i:06d}.jpg", os.urandom(size)) for i in range(files)]
+    body = b''.join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+        for name, filename, content in parts) + f'--{boundary}--\r\n'.encode()
+
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+    connection.request('POST', '/upload', body=body,
+                       headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    job_id = json.loads(connection.getresponse().read())['job_id']
+    connection.close()
+    while True:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        connection.request('GET', f'/jobs/{job_id}')
+        state = json.loads(connection.getresponse().read())
+        connection.close()
+        if state['status'] == 'done':
+            return job_id
+        if state['status'] == 'failed':
+            raise RuntimeError(f"Job fallito: {state['error']}")
+        time.sleep(0.05)
+
+
+def client_loop(port: int, path: str, duration: float) -> Tuple[List[float], int, int]:
+    """Richieste ripetute per `duration` secondi: (latenze, byte ricevuti, errori)."""
+    latencies = []
+    received = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status, size = request(port, 'GET', path)
+        except OSError:
+            errors += 1
+            continue
+        if status != 200:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        received += size
+    return latencies, received, errors
+
+
+def load_test(port: int, path: str, clients: int, duration: float) -> dict:
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client_loop, [port] * clients, [path] * clients, [duration] * clients))
+    latencies = sorted(latency for result in results for latency in result[0])
+    received = sum(result[1] for result in results)
+    return {
+        'requests': len(latencies),
+        'errors': sum(result[2] for result in results),
+        'rps': len(latencies) / duration,
+        'mb_s': received / 1e6 / duration,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help="Client concorrenti")
+    parser.add_argument('--duration', type=float, default=10.0, help="Secondi per ogni scenario")
+    parser.add_argument('--files', type=int, default=50, help="Immagini dell'upload (contenuto dello ZIP)")
+    parser.add_argument('--size', type=int, default=500_000, help="Dimensione di ogni immagine (byte)")
+    parser.add_argument('--server', choices=sorted(SERVERS), action='append',
+                        help="Server da misurare (ripetibile, default tutti)")
+    parser.add_argument('--output', help="Salva i risultati in un file JSON")
+    args = parser.parse_args()
+
+    print(f"{available_cpus()} CPU, gunicorn con {worker_count()} processi; "
+          f"{args.clients} client, ZIP di {args.files} immagini da {args.size / 1e6:.1f} MB")
+    print(f"{'server':<10} {'scenario':<9} {'richieste':>10} {'errori':>7} {'req/s':>9} "
+          f"{'MB/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    results = []
+    for name in args.server or list(SERVERS):
+        with tempfile.TemporaryDirectory(prefix='bench-serving-') as tmp:
+            port = free_port()
+            process = start_server(SERVERS[name], port, Path(tmp))
+            try:
+                job_id = upload_job(port, args.files, args.size)
+                paths = {'health': '/health', 'status': f'/jobs/{job_id}',
+                         'download': f'/jobs/{job_id}/download'}
+                for scenario in SCENARIOS:
+                    stats = load_test(port, paths[scenario], args.clients, args.duration)
+                    results.append(dict(stats, server=name, scenario=scenario))
+                    print(f"{name:<10} {scenario:<9} {stats['requests']:>10} {stats['errors']:>7} "
+                          f"{stats['rps']:>9.1f} {stats['mb_s']:>9.1f} {stats['p50_ms']:>9.1f} "
+                          f"{stats['p99_ms']:>9.1f}")
+            finally:
+                process.terminate()
+                process.wait(timeout=60)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({'python': sys.version.split()[0], 'results': results},
+                                                indent=2), encoding='utf-8')
+        print(f"\nRisultati salvati in {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
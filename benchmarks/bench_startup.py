@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark dell'avvio: tempo di import (python -X importtime) e tempo totale
+dei comandi più comuni, ognuno in un processo nuovo.
+
+Per ogni percorso riporta la mediana del tempo totale, il tempo di import
+complessivo, i moduli più pesanti e se pandas è stato caricato (deve
+succedere solo per i file Excel).
+
+Esempio:
+    python benchmarks/bench_startup.py --repeat 5 --top 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import generators  # noqa: E402
+
+
+def command_paths(data_dir: Path) -> Dict[str, List[str]]:
+    """Comandi misurati: {nome: argomenti dopo `python -X importtime`}."""
+    csv_catalog = generators.make_csv_catalog(data_dir / 'catalog.csv', 100)
+    xlsx_catalog = generators.make_xlsx_catalog(data_dir / 'catalog.xlsx', 100)
+    images = generators.make_image_tree(data_dir / 'images', 10, 100).root
+    run = [str(ROOT / 'app.py'), '--input-dir', str(images), '--output-dir', str(data_dir / 'out'),
+           '--dry-run', '--no-cache', '--quiet', '--no-progress']
+    return {
+        'cli --help': [str(ROOT / 'app.py'), '--help'],
+        'cli run (CSV)': run + ['--excel', str(csv_catalog)],
+        'cli run (XLSX)': run + ['--excel', str(xlsx_catalog)],
+        'web app (import)': ['-c', 'import web_app'],
+    }
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Righe di -X importtime: (modulo, microsecondi propri, microsecondi cumulativi)."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure(args: List[str]) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Esegue il comando in un processo nuovo: (secondi, moduli importati)."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, parse_importtime(completed.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="Esecuzioni per comando (conta la mediana)")
+    parser.add_argument('--top', type=int, default=5, help="Moduli più pesanti da elencare")
+    parser.add_argument('--output', help="Salva i risultati in un file JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as tmp:
+        for name, command in command_paths(Path(tmp)).items():
+            runs = [measure(command) for _ in range(max(1, args.repeat))]
+            wall = statistics.median(elapsed for elapsed, _ in runs)
+            modules = runs[-1][1]
+            imports_ms = sum(self_us for _, self_us, _ in modules) / 1000
+            # Solo i moduli di primo livello: i cumulativi dei sottomoduli sono già inclusi
+            heaviest = sorted((module for module in modules if '.' not in module[0]),
+                              key=lambda module: module[2], reverse=True)[:args.top]
+            results.append({
+                'name': name,
+                'wall_ms': round(wall * 1000, 1),
+                'imports_ms': round(imports_ms, 1),
+                'pandas': any(module == 'pandas' for module, _, _ in modules),
+                'heaviest': [{'module': module, 'cumulative_ms': round(cumulative / 1000, 1)}
+                             for module, _, cumulative in heaviest],
+            })
+
+    print(f"{'comando':<20} {'totale (ms)':>12} {'import (ms)':>12} {'pandas':>7}  moduli più pesanti")
+    for result in results:
+        heaviest = ', '.join(f"{item['module']} {item['cumulative_ms']:.0f}" for item in result['heaviest'])
+        print(f"{result['name']:<20} {result['wall_ms']:>12.1f} {result['imports_ms']:>12.1f} "
+              f"{'sì' if result['pandas'] else 'no':>7}  {heaviest}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({'python': sys.version.split()[0], 'results': results},
+                                                indent=2), encoding='utf-8')
+        print(f"\nRisultati salvati in {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
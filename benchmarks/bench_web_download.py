@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark del download dei risultati della web app: ZIP costruito su disco
+e copiato (vecchio flusso) contro ZIP generato in streaming.
+
+Per ogni flusso misura il tempo dall'upload al termine del job, il tempo al primo
+byte e il tempo totale del download, e il picco di spazio occupato su disco
+dalla cartella di lavoro (campionato ogni pochi millisecondi).
+
+Esempio:
+    python benchmarks/bench_web_download.py --files 300 --size 1000000
+"""
+
+import argparse
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def disk_usage(folder: Path) -> int:
+    """Byte occupati dai file in `folder` (gli hardlink contati una volta)."""
+    total = 0
+    seen = set()
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_blocks * 512
+    return total
+
+
+class PeakDiskSampler:
+    """Campiona in background lo spazio occupato da una cartella."""
+
+    def __init__(self, folder: Path, interval: float = 0.005):
+        self.folder = folder
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, disk_usage(self.folder))
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, disk_usage(self.folder))
+
+
+def make_upload(count: int, size: int) -> tuple:
+    """Contenuto di un upload: CSV di mapping e `count` immagini da `size` byte."""
+    rows = ['CodeX,CodeY'] + [f"IMG{i:06d},PRD{i:06d}" for i in range(count)]
+    mapping = ('\n'.join(rows) + '\n').encode()
+    images = [(f"IMG{i:06d}.jpg", os.urandom(size)) for i in range(count)]
+    return mapping, images
+
+
+def legacy_zip(output_folder: str, token: str) -> None:
+    """Vecchio flusso: ZIP scritto nella cartella di lavoro, poi copiato in output."""
+    run_dir = Path(output_folder) / token
+    zip_path = run_dir / 'immagini_rinominate.zip'
+    with zipfile.ZipFile(zip_path, 'w') as zipf:
+        for file_path in sorted((run_dir / 'output').iterdir()):
+            zipf.write(file_path, file_path.name)
+    shutil.copy2(zip_path, Path(output_folder) / 'immagini_rinominate.zip')
+    shutil.rmtree(run_dir)
+
+
+def wait_for_job(client, status_url: str) -> dict:
+    """Stato finale del job dell'upload."""
+    while True:
+        state = client.get(status_url).get_json()
+        if state['status'] in ('done', 'failed'):
+            return state
+        time.sleep(0.01)
+
+
+def run_flow(web_app, mapping: bytes, images: list, legacy: bool) -> dict:
+    client = web_app.app.test_client()
+    data = {
+        'mapping_file': (io.BytesIO(mapping), 'mapping.csv'),
+        'images': [(io.BytesIO(content), name) for name, content in images],
+    }
+    output_folder = Path(web_app.app.config['OUTPUT_FOLDER'])
+
+    with PeakDiskSampler(output_folder) as sampler:
+        start = time.perf_counter()
+        response = client.post('/upload', data=data, content_type='multipart/form-data')
+        result = wait_for_job(client, response.get_json()['status_url'])
+        if legacy:
+            legacy_zip(str(output_folder), result['id'])
+        upload_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if legacy:
+            download = open(output_folder / 'immagini_rinominate.zip', 'rb')
+            chunks = iter(lambda: download.read(1024 * 1024), b'')
+        else:
+            download = client.get(result['download_url'], buffered=False)
+            chunks = download.response
+        first_byte = None
+        received = 0
+        for chunk in chunks:
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            received += len(chunk)
+        download.close()
+        download_time = time.perf_counter() - start
+
+    return {
+        'upload_s': upload_time,
+        'first_byte_s': first_byte or 0.0,
+        'download_s': download_time,
+        'total_s': upload_time + download_time,
+        'zip_mb': received / 1e6,
+        'peak_disk_mb': sampler.peak / 1e6,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=300, help="Numero di immagini caricate")
+    parser.add_argument('--size', type=int, default=1_000_000, help="Dimensione di ogni immagine (byte)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        import web_app  # noqa: E402  (crea uploads/ e output/ nella cartella corrente)
+
+        logging.disable(logging.WARNING)
+        web_app.app.config['MAX_CONTENT_LENGTH'] = None
+        mapping, images = make_upload(args.files, args.size)
+        print(f"{args.files} immagini, {args.files * args.size / 1e6:.0f} MB caricati")
+        print(f"{'flusso':>10} {'upload (s)':>11} {'1° byte (s)':>12} {'download (s)':>13} "
+              f"{'totale (s)':>11} {'ZIP (MB)':>9} {'picco disco (MB)':>17}")
+        for label, legacy in (('build+copy', True), ('streaming', False)):
+            stats = run_flow(web_app, mapping, images, legacy)
+            print(f"{label:>10} {stats['upload_s']:>11.2f} {stats['first_byte_s']:>12.3f} "
+                  f"{stats['download_s']:>13.2f} {stats['total_s']:>11.2f} {stats['zip_mb']:>9.0f} {stats['peak_disk_mb']:>17.0f}")
+            shutil.rmtree(web_app.app.config['OUTPUT_FOLDER'])
+            os.makedirs(web_app.app.config['OUTPUT_FOLDER'])
+        os.chdir(ROOT)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Generatori di dati sintetici per i benchmark: cataloghi (CSV e XLSX) e
+alberi di immagini.
+
+I codici seguono sempre lo stesso schema: la riga i del catalogo associa
+IMG{i:08d} a PRD{i:08d}, quindi un albero di immagini generato con lo
+stesso numero di righe "colpisce" il catalogo in modo prevedibile.
+"""
+
+import csv
+import random
+import shutil
+from pathlib import Path
+from typing import List, NamedTuple
+
+
+# Combinazioni di separatore e codifica riconosciute da csv_map
+CSV_SEPARATORS = {'comma': ',', 'semicolon': ';', 'tab': '\t'}
+CSV_ENCODINGS = ('utf-8', 'cp1252', 'latin-1')
+
+# Intestazione del JPEG: basta perché il file sembri un'immagine
+JPEG_HEADER = b'\xff\xd8\xff\xe0'
+
+
+def source_code(i: int) -> str:
+    return f"IMG{i:08d}"
+
+
+def target_code(i: int) -> str:
+    return f"PRD{i:08d}"
+
+
+def make_csv_catalog(path: Path, rows: int, separator: str = ',', encoding: str = 'utf-8',
+                     duplicate_rate: float = 0.0, seed: int = 0) -> Path:
+    """
+    Scrive un catalogo CSV (CodeX, CodeY, Descrizione).
+
+    Args:
+        path: File da creare
+        rows: Numero di righe di dati
+        separator: Separatore di colonna
+        encoding: Codifica del file (la descrizione contiene lettere accentate)
+        duplicate_rate: Frazione di righe che ripetono un codice già usato
+        seed: Seme per la scelta delle righe duplicate
+    """
+    rng = random.Random(seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        writer = csv.writer(f, delimiter=separator)
+        writer.writerow(['CodeX', 'CodeY', 'Descrizione'])
+        for i in range(rows):
+            j = rng.randrange(i) if i and rng.random() < duplicate_rate else i
+            writer.writerow([source_code(j), target_code(i), f"Articolo {i} perché è così"])
+    return path
+
+
+def make_xlsx_catalog(path: Path, rows: int, extra_columns: int = 4) -> Path:
+    """Scrive un catalogo .xlsx con CodeX/CodeY e qualche colonna non usata."""
+    from openpyxl import Workbook
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    extra = [f"Extra{i}" for i in range(extra_columns)]
+    sheet.append(['CodeX', 'CodeY'] + extra)
+    filler = [f"valore {i}" for i in range(extra_columns)]
+    for i in range(rows):
+        sheet.append([source_code(i), target_code(i)] + filler)
+    workbook.save(path)
+    return path
+
+
+class ImageTree(NamedTuple):
+    """Albero di immagini generato."""
+
+    root: Path
+    files: int
+    hits: int
+    # Nomi di output da creare in anticipo per provocare conflitti (_N)
+    conflict_names: List[str]
+
+
+def make_image_tree(root: Path, count: int, catalog_rows: int, hit_rate: float = 1.0,
+                    conflict_rate: float = 0.0, nested: bool = False, fanout: int = 10,
+                    depth: int = 2, size: int = 4096, seed: int = 0) -> ImageTree:
+    """
+    Crea `count` immagini sintetiche.
+
+    Args:
+        root: Cartella da creare
+        count: Numero di immagini
+        catalog_rows: Righe del catalogo con cui verrà usato l'albero
+        hit_rate: Frazione di immagini con un codice presente nel catalogo
+        conflict_rate: Frazione di immagini mappate il cui nome di output
+            esisterà già (vedi ImageTree.conflict_names)
+        nested: Se True distribuisce le immagini in sottocartelle
+        fanout: Sottocartelle per livello (con nested)
+        depth: Livelli di sottocartelle (con nested)
+        size: Dimensione di ogni immagine in byte
+        seed: Seme per hit e conflitti
+    """
+    if not nested and count > catalog_rows and hit_rate > 0:
+        raise ValueError("In un albero piatto servono al massimo tante immagini quante righe del catalogo")
+
+    rng = random.Random(seed)
+    payload = JPEG_HEADER + b'\x00' * max(0, size - len(JPEG_HEADER))
+    hits = 0
+    conflict_names = []
+
+    for i in range(count):
+        if rng.random() < hit_rate:
+            index = i % max(1, catalog_rows)
+            stem = source_code(index)
+            hits += 1
+            if rng.random() < conflict_rate:
+                conflict_names.append(f"{target_code(index)}.jpg")
+        else:
+            stem = f"UNK{i:08d}"
+
+        folder = root
+        if nested:
+            for level in range(depth):
+                folder = folder / f"d{level}_{(i // fanout ** level) % fanout}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"{stem}.jpg").write_bytes(payload)
+
+    return ImageTree(root, count, hits, conflict_names)
+
+
+def prepare_output(output_dir: Path, conflict_names: List[str]) -> None:
+    """Svuota (crea) la cartella di output e vi mette i file che generano conflitti."""
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True)
+    for name in conflict_names:
+        (output_dir / name).write_bytes(JPEG_HEADER)
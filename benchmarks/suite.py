@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Suite di benchmark end-to-end su dati sintetici.
+
+Genera cataloghi (CSV con ogni combinazione di separatore e codifica, XLSX)
+e alberi di immagini (piatti e annidati, con hit rate e conflict rate
+configurabili), poi misura build_map, build_map_from_csv, process_images e
+il percorso /upload della web app (test client Flask). Ogni caso gira in un
+processo separato: il picco di RSS misurato è quello del solo caso.
+
+Il risultato è un JSON con tempo, picco di RSS ed elementi al secondo per
+ogni caso. Con --compare viene confrontato con un risultato salvato e i casi
+peggiorati oltre la soglia vengono segnalati (exit code 1).
+
+Esempi:
+    python benchmarks/suite.py --preset quick --output baseline.json
+    python benchmarks/suite.py --preset quick --compare baseline.json
+    python benchmarks/suite.py --preset full --data-dir /tmp/bench-data --only build_map_from_csv
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import generators  # noqa: E402
+
+
+PRESETS = {
+    'quick': {
+        'csv_rows': [1_000, 10_000],
+        'xlsx_rows': [1_000, 10_000],
+        'images': [1_000],
+        'upload_images': [200],
+    },
+    'full': {
+        'csv_rows': [1_000, 100_000, 1_000_000, 5_000_000],
+        'xlsx_rows': [1_000, 100_000, 1_000_000],
+        'images': [10_000, 100_000],
+        'upload_images': [2_000],
+    },
+}
+
+CASE_NAMES = ('build_map', 'build_map_from_csv', 'process_images', 'web_upload')
+
+# Sotto questa differenza (secondi) una variazione di tempo è considerata rumore
+MIN_TIME_DELTA = 0.05
+
+
+# --- Esecuzione di un caso (processo figlio) ---------------------------------
+
+def peak_rss_mb() -> Optional[float]:
+    """Picco di RSS del processo corrente in MB (None se non disponibile)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta KB, macOS byte
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(case: dict) -> dict:
+    """Esegue un caso e restituisce tempo, elementi elaborati e picco di RSS."""
+    import logging
+    logging.disable(logging.WARNING)
+
+    name = case['name']
+    params = case['params']
+
+    if name == 'build_map':
+        from renamer.excel_map import build_map
+        start = time.perf_counter()
+        mapping = build_map(case['catalog'], streaming=params['streaming'])
+        wall = time.perf_counter() - start
+        items = len(mapping) // 2
+
+    elif name == 'build_map_from_csv':
+        from renamer.csv_map import build_map_from_csv
+        start = time.perf_counter()
+        mapping = build_map_from_csv(case['catalog'])
+        wall = time.perf_counter() - start
+        items = len(mapping) // 2
+
+    elif name == 'process_images':
+        from renamer.csv_map import build_map_from_csv
+        from renamer.file_ops import ProcessOptions, process_images
+        mapping = build_map_from_csv(case['catalog'])
+        options = ProcessOptions(exts=['jpg'], workers=params['workers'], recursive=params['nested'])
+        start = time.perf_counter()
+        report = process_images(mapping, case['images'], case['output'], options)
+        wall = time.perf_counter() - start
+        items = report.examined
+
+    elif name == 'web_upload':
+        items, wall = _run_web_upload(case)
+
+    else:
+        raise ValueError(f"Caso sconosciuto: {name}")
+
+    return {
+        'wall_s': wall,
+        'items': items,
+        'items_per_s': items / wall if wall > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _run_web_upload(case: dict) -> tuple:
+    """POST /upload con il test client, poi attesa della fine del job."""
+    os.chdir(case['workdir'])
+    import web_app
+
+    web_app.app.config['MAX_CONTENT_LENGTH'] = None
+    client = web_app.app.test_client()
+    image_paths = sorted(Path(case['images']).iterdir())
+
+    start = time.perf_counter()
+    handles = [open(path, 'rb') for path in image_paths]
+    try:
+        data = {
+            'mapping_file': (open(case['catalog'], 'rb'), 'catalogo.csv'),
+            'images': [(handle, path.name) for handle, path in zip(handles, image_paths)],
+        }
+        response = client.post('/upload', data=data, content_type='multipart/form-data')
+        status_url = response.get_json()['status_url']
+        while True:
+            state = client.get(status_url).get_json()
+            if state['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.01)
+    finally:
+        for handle in handles:
+            handle.close()
+    wall = time.perf_counter() - start
+
+    if state['status'] != 'done':
+        raise RuntimeError(f"Job fallito: {state['error']}")
+    return len(image_paths), wall
+
+
+# --- Preparazione dei casi (processo principale) -----------------------------
+
+def build_cases(preset: dict, data_dir: Path, only: List[str], hit_rate: float,
+                conflict_rate: float, workers: List[int]) -> List[dict]:
+    """Genera i dati mancanti in `data_dir` e restituisce l'elenco dei casi."""
+    cases = []
+
+    def wanted(name):
+        return not only or name in only
+
+    if wanted('build_map_from_csv'):
+        for rows in preset['csv_rows']:
+            for sep_name, separator in generators.CSV_SEPARATORS.items():
+                for encoding in generators.CSV_ENCODINGS:
+                    path = data_dir / f"catalog-{rows}-{sep_name}-{encoding}.csv"
+                    if not path.exists():
+                        generators.make_csv_catalog(path, rows, separator, encoding, duplicate_rate=0.01)
+                    cases.append({'name': 'build_map_from_csv', 'catalog': str(path),
+                                  'params': {'rows': rows, 'separator': sep_name, 'encoding': encoding}})
+
+    if wanted('build_map'):
+        for rows in preset['xlsx_rows']:
+            path = data_dir / f"catalog-{rows}.xlsx"
+            if not path.exists():
+                generators.make_xlsx_catalog(path, rows)
+            for streaming in (False, True):
+                cases.append({'name': 'build_map', 'catalog': str(path),
+                              'params': {'rows': rows, 'streaming': streaming}})
+
+    if wanted('process_images') or wanted('web_upload'):
+        for count in sorted(set(preset['images'] + preset['upload_images'])):
+            catalog = data_dir / f"catalog-{count}-comma-utf-8.csv"
+            if not catalog.exists():
+                generators.make_csv_catalog(catalog, count)
+
+    if wanted('process_images'):
+        for count in preset['images']:
+            catalog = data_dir / f"catalog-{count}-comma-utf-8.csv"
+            for nested in (False, True):
+                tree = _image_tree(data_dir, count, hit_rate, conflict_rate, nested)
+                for worker_count in workers:
+                    cases.append({'name': 'process_images', 'catalog': str(catalog),
+                                  'images': str(tree.root),
+                                  'output': str(data_dir / 'output'),
+                                  'conflict_names': tree.conflict_names,
+                                  'params': {'images': count, 'nested': nested, 'workers': worker_count,
+                                             'hit_rate': hit_rate, 'conflict_rate': conflict_rate}})
+
+    if wanted('web_upload'):
+        for count in preset['upload_images']:
+            catalog = data_dir / f"catalog-{count}-comma-utf-8.csv"
+            tree = _image_tree(data_dir, count, hit_rate, 0.0, False)
+            cases.append({'name': 'web_upload', 'catalog': str(catalog), 'images': str(tree.root),
+                          'params': {'images': count, 'hit_rate': hit_rate}})
+
+    return cases
+
+
+def _image_tree(data_dir: Path, count: int, hit_rate: float, conflict_rate: float,
+                nested: bool) -> generators.ImageTree:
+    """Albero di immagini in `data_dir`, riusato se già generato con gli stessi parametri."""
+    layout = 'nested' if nested else 'flat'
+    root = data_dir / f"images-{count}-{layout}-h{hit_rate}-c{conflict_rate}"
+    manifest = root.with_suffix('.json')
+    if manifest.exists():
+        saved = json.loads(manifest.read_text())
+        return generators.ImageTree(root, saved['files'], saved['hits'], saved['conflict_names'])
+
+    tree = generators.make_image_tree(root, count, catalog_rows=count, hit_rate=hit_rate,
+                                      conflict_rate=conflict_rate, nested=nested)
+    manifest.write_text(json.dumps({'files': tree.files, 'hits': tree.hits,
+                                    'conflict_names': tree.conflict_names}))
+    return tree
+
+
+def run_in_child(case: dict, data_dir: Path) -> dict:
+    """Esegue un caso in un processo separato (RSS e cache isolati)."""
+    if case['name'] == 'process_images':
+        generators.prepare_output(Path(case['output']), case['conflict_names'])
+    if case['name'] == 'web_upload':
+        workdir = Path(tempfile.mkdtemp(dir=data_dir, prefix='web-'))
+        case = dict(case, workdir=str(workdir))
+
+    env = dict(os.environ, IMAGE_RENAMER_CACHE_DIR=str(data_dir / 'map-cache'))
+    child_case = {key: value for key, value in case.items() if key != 'conflict_names'}
+    output = subprocess.run([sys.executable, __file__, '--child', json.dumps(child_case)],
+                            check=True, capture_output=True, text=True, env=env)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+# --- Confronto con una baseline ----------------------------------------------
+
+def case_key(result: dict) -> str:
+    return f"{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def compare(results: List[dict], baseline: dict, threshold: float) -> List[str]:
+    """Casi peggiorati rispetto alla baseline oltre la soglia (tempo o memoria)."""
+    previous = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        base = previous.get(case_key(result))
+        if base is None:
+            continue
+        if (result['wall_s'] > base['wall_s'] * (1 + threshold)
+                and result['wall_s'] - base['wall_s'] > MIN_TIME_DELTA):
+            regressions.append(f"{case_key(result)}: tempo {base['wall_s']:.3f}s -> {result['wall_s']:.3f}s")
+        if (result['peak_rss_mb'] and base.get('peak_rss_mb')
+                and result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold)):
+            regressions.append(f"{case_key(result)}: RSS {base['peak_rss_mb']:.0f}MB -> {result['peak_rss_mb']:.0f}MB")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick', help="Dimensioni dei dati")
+    parser.add_argument('--only', default='', help=f"Casi da eseguire, separati da virgola ({', '.join(CASE_NAMES)})")
+    parser.add_argument('--data-dir', help="Cartella per i dati generati (riusati tra esecuzioni)")
+    parser.add_argument('--hit-rate', type=float, default=0.7, help="Frazione di immagini presenti nel catalogo")
+    parser.add_argument('--conflict-rate', type=float, default=0.05, help="Frazione di immagini con conflitto di nome")
+    parser.add_argument('--workers', default='1,8', help="Valori di workers per process_images")
+    parser.add_argument('--output', help="File JSON dove salvare i risultati (default: stdout)")
+    parser.add_argument('--compare', help="File JSON di baseline con cui confrontare i risultati")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Peggioramento tollerato (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(json.loads(args.child))))
+        return 0
+
+    only = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(only) - set(CASE_NAMES)
+    if unknown:
+        parser.error(f"Casi sconosciuti: {', '.join(sorted(unknown))}")
+
+    temp_dir = None
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        data_dir = Path(temp_dir.name)
+
+    try:
+        print("Generazione dei dati...", file=sys.stderr)
+        cases = build_cases(PRESETS[args.preset], data_dir, only, args.hit_rate, args.conflict_rate,
+                            [int(w) for w in args.workers.split(',') if w.strip()])
+
+        results = []
+        for case in cases:
+            measured = run_in_child(case, data_dir)
+            result = {'name': case['name'], 'params': case['params'], **measured}
+            results.append(result)
+            rss = f"{result['peak_rss_mb']:.0f}MB" if result['peak_rss_mb'] else "n/d"
+            print(f"{case_key(result)}: {result['wall_s']:.3f}s, {result['items_per_s'] or 0:.0f}/s, RSS {rss}",
+                  file=sys.stderr)
+    finally:
+        if temp_dir:
+            temp_dir.cleanup()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'preset': args.preset,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressioni rispetto a {args.compare}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  - {line}", file=sys.stderr)
+            return 1
+        print(f"\nNessuna regressione rispetto a {args.compare}", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
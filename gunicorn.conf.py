@@ -0,0 +1,69 @@
+"""
+Configurazione di gunicorn per la web app in produzione:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Processi e thread sono calcolati da CPU e memoria disponibili (limiti del
+container compresi, vedi renamer/serving.py); WEB_CONCURRENCY e WEB_THREADS
+li impostano esplicitamente. L'app viene caricata una volta nel processo
+master (preload_app) e i worker nascono con fork: moduli, configurazione e
+mappe precaricate (MAPPING_PRELOAD, vedi wsgi.py) sono condivisi.
+"""
+
+import os
+import shutil
+import tempfile
+
+from renamer.jobs import DEFAULT_MAX_QUEUED
+from renamer.serving import DEFAULT_THREADS, DEFAULT_WORKER_MEMORY, available_cpus, worker_count
+
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# Processi: 2 per CPU più uno, nei limiti della memoria (WORKER_MEMORY_MB per processo)
+workers = int(os.environ.get('WEB_CONCURRENCY') or worker_count(
+    worker_memory=int(os.environ.get('WORKER_MEMORY_MB', 0)) * 1024 * 1024 or DEFAULT_WORKER_MEMORY))
+# Thread per processo: upload a blocchi e download aspettano la rete
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', DEFAULT_THREADS))
+
+# Job in background per processo: le CPU divise tra i worker (almeno uno),
+# se JOB_WORKERS non è impostato; lo stesso per il limite dei job non
+# terminati (JOB_MAX_QUEUED), che resta così quello di un solo processo.
+# Letti da web_app all'import.
+os.environ.setdefault('JOB_WORKERS', str(max(1, available_cpus() // workers)))
+os.environ.setdefault('JOB_MAX_QUEUED', str(max(1, DEFAULT_MAX_QUEUED // workers)))
+
+# Metriche sommate tra i worker: ogni processo salva i propri valori in
+# METRICS_DIR, svuotata a ogni avvio (default: cartella temporanea nuova)
+if os.environ.get('METRICS_DIR'):
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_DIR'])
+else:
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(
+        prefix='renamer-metrics-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+preload_app = True
+# I file (ZIP dei risultati) vengono inviati con sendfile(2), senza passare da Python
+sendfile = True
+
+# Un blocco di upload su disco lento può richiedere tempo
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+# Heartbeat dei worker in memoria: /tmp nei container può essere su overlay lento
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Dietro un proxy (nginx, Railway, Render): IP e schema dagli header X-Forwarded-*
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# ACCESS_LOG= (vuoto) disattiva il log delle richieste
+accesslog = os.environ.get('ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    server.log.info(f"Image Renamer in ascolto su {bind}: {workers} processi x {threads} thread, "
+                    f"{os.environ['JOB_WORKERS']} job per processo "
+                    f"(al più {os.environ['JOB_MAX_QUEUED']} non terminati)")
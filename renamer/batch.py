@@ -0,0 +1,281 @@
+"""
+Modulo per l'esecuzione a batch: più cataloghi e cartelle di input in un
+solo processo, descritti da un manifest JSON o YAML.
+
+Ogni file di mapping viene caricato una volta sola anche se usato da più
+job; le copie di tutti i job passano da un unico pool di thread, che limita
+la concorrenza di I/O complessiva. I job con la stessa cartella di output
+vengono eseguiti uno dopo l'altro, nell'ordine del manifest (i nomi
+occupati e il journal di una cartella non sono condivisibili tra esecuzioni
+contemporanee); quelli con output diversi in parallelo.
+
+Esempio di manifest (YAML; in JSON la struttura è la stessa):
+
+    defaults:
+      exts: [jpg, png]
+      mode: hardlink
+    jobs:
+      - name: brand-a
+        mapping: cataloghi/brand-a.xlsx
+        input_dir: /data/brand-a/foto
+        output_dir: /data/brand-a/catalogo
+      - mapping: cataloghi/comune.csv
+        input_dir: /data/brand-b/foto
+        output_dir: /data/brand-b/catalogo
+        recursive: true
+
+I percorsi relativi sono relativi alla cartella del manifest.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .dedup import ChecksumCache
+from .file_ops import DEFAULT_EXTS, TRANSFER_MODES, ProcessOptions, default_workers, process_images
+from .map_cache import load_map_cached
+from .report import RunReport
+
+
+# Opzioni di process_images (campi di ProcessOptions) impostabili per ogni
+# job (o in defaults)
+JOB_OPTIONS = ('recursive', 'max_depth', 'include', 'exclude', 'mirror', 'journal',
+               'dedup', 'max_conflicts')
+JOB_KEYS = ('name', 'mapping', 'input_dir', 'output_dir', 'exts', 'mode') + JOB_OPTIONS
+
+
+@dataclass
+class BatchJob:
+    """Un'esecuzione del manifest: mapping, cartelle e opzioni di process_images (JOB_OPTIONS)."""
+
+    name: str
+    mapping: str
+    input_dir: str
+    output_dir: str
+    exts: List[str] = field(default_factory=lambda: list(DEFAULT_EXTS))
+    mode: str = 'copy'
+    options: Dict[str, object] = field(default_factory=dict)
+
+
+@dataclass
+class JobResult:
+    """Esito di un job: il report, o l'errore che ne ha impedito l'esecuzione."""
+
+    job: BatchJob
+    report: Optional[RunReport] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.job.name,
+            'mapping': self.job.mapping,
+            'input_dir': self.job.input_dir,
+            'output_dir': self.job.output_dir,
+            'status': 'failed' if self.error else 'done',
+            'error': self.error,
+            'report': self.report.summary() if self.report else None,
+        }
+
+
+@dataclass
+class BatchReport:
+    """Report consolidato: totale di tutti i job più il dettaglio per job."""
+
+    results: List[JobResult] = field(default_factory=list)
+    total: RunReport = field(default_factory=RunReport)
+    mappings_loaded: int = 0
+    duration: float = 0.0
+
+    @property
+    def failed_jobs(self) -> int:
+        return sum(1 for result in self.results if result.error)
+
+    def to_dict(self) -> dict:
+        """Rappresentazione serializzabile in JSON (senza l'elenco delle operazioni)."""
+        return {
+            'jobs': [result.to_dict() for result in self.results],
+            'failed_jobs': self.failed_jobs,
+            'mappings_loaded': self.mappings_loaded,
+            'duration_s': round(self.duration, 6),
+            'total': self.total.summary(),
+        }
+
+
+def load_manifest(path: str) -> List[BatchJob]:
+    """
+    Legge un manifest JSON (.json) o YAML (.yaml/.yml).
+
+    Il manifest è una lista di job oppure un oggetto con 'jobs' e,
+    facoltativi, i 'defaults' comuni a tutti i job.
+
+    Raises:
+        FileNotFoundError: Se il manifest non esiste
+        ValueError: Se il formato o un job non sono validi
+    """
+    manifest_path = Path(path)
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"Manifest non trovato: {path}")
+    text = manifest_path.read_text(encoding='utf-8')
+
+    if manifest_path.suffix.lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Per i manifest YAML serve PyYAML (pip install pyyaml)")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"Manifest YAML non valido: {e}")
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Manifest JSON non valido: {e}")
+
+    defaults: dict = {}
+    if isinstance(data, dict):
+        defaults = data.get('defaults') or {}
+        data = data.get('jobs')
+    if not isinstance(data, list) or not data or not isinstance(defaults, dict):
+        raise ValueError("Il manifest deve contenere una lista di job non vuota")
+
+    base_dir = manifest_path.parent
+    jobs = []
+    names = set()
+    for number, raw in enumerate(data, start=1):
+        if not isinstance(raw, dict):
+            raise ValueError(f"Job {number}: atteso un oggetto")
+        job = _parse_job(dict(defaults, **raw), number, base_dir)
+        if job.name in names:
+            raise ValueError(f"Job {number}: nome duplicato {job.name}")
+        names.add(job.name)
+        jobs.append(job)
+    return jobs
+
+
+def run_batch(jobs: List[BatchJob], workers: int = 0, parallel_jobs: int = 0,
+              dry_run: bool = False, streaming: bool = False, use_cache: bool = True,
+              quiet: bool = False, max_warnings: Optional[int] = None) -> BatchReport:
+    """
+    Esegue i job con le mappe condivise e un unico pool di thread per le copie.
+
+    I job con dedup condividono una sola cache degli hash (dedup.ChecksumCache,
+    thread-safe): connessioni separate allo stesso database da job paralleli
+    si bloccherebbero a vicenda.
+
+    Un job che fallisce (es. cartella di input mancante) viene registrato nel
+    report e non ferma gli altri; lo stesso vale per un file di mapping non
+    leggibile, per tutti i job che lo usano.
+
+    Args:
+        jobs: Job da eseguire (vedi load_manifest)
+        workers: Thread di copia complessivi, per tutti i job (0 = default_workers)
+        parallel_jobs: Cartelle di output processate contemporaneamente
+            (0 = automatico, al massimo 4)
+        dry_run: Se True simula le operazioni
+        streaming, use_cache: Lettura delle mappe, come in load_map_cached
+        quiet, max_warnings: Log dei singoli file, come in process_images
+
+    Returns:
+        BatchReport con il totale e il dettaglio per job
+    """
+    started = time.perf_counter()
+    workers = workers or default_workers()
+    batch = BatchReport(results=[JobResult(job) for job in jobs])
+
+    # Ogni mapping una volta sola: (mappa, errore) per percorso
+    mappings: Dict[str, Tuple[Optional[Dict[str, str]], Optional[str]]] = {}
+    for job in jobs:
+        key = os.path.abspath(job.mapping)
+        if key in mappings:
+            continue
+        try:
+            mapping = load_map_cached(job.mapping, streaming=streaming, use_cache=use_cache).mapping
+            mappings[key] = (mapping, None if mapping else f"Nessun mapping valido in {job.mapping}")
+        except (OSError, ValueError) as e:
+            mappings[key] = (None, str(e))
+    batch.mappings_loaded = sum(1 for mapping, _ in mappings.values() if mapping)
+    logging.info(f"Batch: {len(jobs)} job, {len(mappings)} file di mapping, {workers} thread di copia")
+
+    # Job raggruppati per cartella di output, nell'ordine del manifest
+    groups: Dict[str, List[JobResult]] = {}
+    for result in batch.results:
+        groups.setdefault(os.path.realpath(result.job.output_dir), []).append(result)
+    parallel_jobs = parallel_jobs or min(4, len(groups))
+
+    lock = threading.Lock()
+
+    def run_group(results: List[JobResult]) -> None:
+        for result in results:
+            job = result.job
+            mapping, error = mappings[os.path.abspath(job.mapping)]
+            if error:
+                result.error = error
+                logging.error(f"[{job.name}] {error}")
+                continue
+            logging.info(f"[{job.name}] Inizio: {job.input_dir} -> {job.output_dir}")
+            try:
+                options = ProcessOptions(exts=job.exts, dry_run=dry_run, workers=workers,
+                                         mode=job.mode, quiet=quiet, max_warnings=max_warnings,
+                                         **job.options)
+                result.report = process_images(mapping, job.input_dir, job.output_dir, options,
+                                               executor=executor, checksums=checksums)
+            except Exception as e:
+                result.error = str(e)
+                logging.error(f"[{job.name}] Job non eseguito: {e}")
+                continue
+            with lock:
+                batch.total.merge(result.report)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='copy') if not dry_run else None
+    checksums = ChecksumCache() if any(job.options.get('dedup') for job in jobs) else None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, parallel_jobs), thread_name_prefix='job') as planners:
+            for future in [planners.submit(run_group, results) for results in groups.values()]:
+                future.result()
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+        if checksums:
+            checksums.close()
+
+    batch.duration = batch.total.duration = time.perf_counter() - started
+    processed, skipped, errors = batch.total
+    logging.info(f"Batch completato: {processed} processati, {skipped} saltati, {errors} errori, "
+                 f"{batch.failed_jobs} job falliti in {batch.duration:.2f}s")
+    return batch
+
+
+def _parse_job(raw: dict, number: int, base_dir: Path) -> BatchJob:
+    """Valida un job del manifest e risolve i percorsi rispetto alla sua cartella."""
+    unknown = set(raw) - set(JOB_KEYS)
+    if unknown:
+        raise ValueError(f"Job {number}: chiavi non riconosciute: {', '.join(sorted(unknown))}")
+    for key in ('mapping', 'input_dir', 'output_dir'):
+        if not raw.get(key):
+            raise ValueError(f"Job {number}: manca '{key}'")
+
+    exts = raw.get('exts', DEFAULT_EXTS)
+    if isinstance(exts, str):
+        exts = exts.split(',')
+    exts = [str(ext).strip() for ext in exts if str(ext).strip()]
+    mode = raw.get('mode', 'copy')
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f"Job {number}: modalità non valida: {mode}. "
+                         f"Usa una tra: {', '.join(TRANSFER_MODES)}")
+
+    options = {key: raw[key] for key in JOB_OPTIONS if key in raw}
+    for key in ('include', 'exclude'):
+        if isinstance(options.get(key), str):
+            options[key] = [options[key]]
+
+    paths = {key: str(base_dir / os.path.expanduser(str(raw[key])))
+             for key in ('mapping', 'input_dir', 'output_dir')}
+    name = str(raw.get('name') or f"job-{number}")
+    return BatchJob(name=name, exts=exts, mode=mode, options=options, **paths)
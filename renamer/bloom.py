@@ -0,0 +1,98 @@
+"""
+Modulo con il filtro di Bloom dei codici di una mappa.
+
+Il filtro viene inviato al browser, che lo usa per non caricare le immagini
+il cui codice non è nella mappa. Un falso positivo fa solo caricare
+un'immagine che il server poi salterà; i falsi negativi non esistono.
+
+Hash: FNV-1a a 32 bit dei byte UTF-8 del codice, con due basi diverse
+(h1, h2); la posizione i-esima è (h1 + i * h2) mod m. La stessa funzione è
+implementata in static/js/app.js.
+"""
+
+import base64
+import math
+from typing import Iterable, List
+
+import numpy as np
+
+
+FNV_PRIME = 16777619
+FNV_OFFSET = 2166136261
+# Base alternativa per il secondo hash
+FNV_OFFSET_2 = 0x9747B28C
+
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+
+def fnv1a_hashes(keys: List[str], offset: int) -> np.ndarray:
+    """FNV-1a a 32 bit di tutte le chiavi, calcolato a colonne con numpy."""
+    raw = [key.encode('utf-8') for key in keys]
+    lengths = np.fromiter(map(len, raw), dtype=np.int64, count=len(raw))
+    # Matrice di byte (una riga per chiave, completata con zeri)
+    encoded = np.array(raw, dtype=bytes)
+    width = encoded.dtype.itemsize
+    matrix = encoded.view(np.uint8).reshape(len(raw), width)
+
+    hashes = np.full(len(keys), offset, dtype=np.uint64)
+    for column in range(width):
+        active = lengths > column
+        updated = ((hashes ^ matrix[:, column]) * FNV_PRIME) & 0xFFFFFFFF
+        hashes = np.where(active, updated, hashes)
+    return hashes
+
+
+class BloomFilter:
+    """Filtro di Bloom con m bit e k funzioni hash."""
+
+    def __init__(self, size_bits: int, hash_count: int):
+        self.size_bits = max(8, size_bits)
+        self.hash_count = max(1, hash_count)
+        # Un byte per bit in memoria, compattati solo in to_dict
+        self._bitset = np.zeros(self.size_bits, dtype=bool)
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, count: int,
+                     false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE) -> 'BloomFilter':
+        """Filtro dimensionato per `count` chiavi con il tasso di falsi positivi dato."""
+        count = max(1, count)
+        size_bits = math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2)
+        hash_count = round(size_bits / count * math.log(2))
+        return cls(size_bits, hash_count)
+
+    @classmethod
+    def from_keys(cls, keys: Iterable[str],
+                  false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE) -> 'BloomFilter':
+        keys = list(keys)
+        bloom = cls.for_capacity(len(keys), false_positive_rate)
+        bloom.update(keys)
+        return bloom
+
+    def update(self, keys: List[str]) -> None:
+        """Aggiunge le chiavi (tutte insieme, in modo vettoriale)."""
+        if not keys:
+            return
+        for positions in self._positions(keys):
+            self._bitset[positions] = True
+        self.count += len(keys)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bitset[positions[0]] for positions in self._positions([key]))
+
+    def to_dict(self) -> dict:
+        """Rappresentazione JSON: bit in base64 (bit i = byte i // 8, bit i % 8) e parametri."""
+        bits = np.packbits(self._bitset, bitorder='little')
+        return {
+            'size_bits': self.size_bits,
+            'hash_count': self.hash_count,
+            'count': self.count,
+            'hash': 'fnv1a32-double',
+            'bits': base64.b64encode(bits.tobytes()).decode('ascii'),
+        }
+
+    def _positions(self, keys: List[str]) -> Iterable[np.ndarray]:
+        h1 = fnv1a_hashes(keys, FNV_OFFSET)
+        h2 = fnv1a_hashes(keys, FNV_OFFSET_2)
+        for i in range(self.hash_count):
+            yield (h1 + np.uint64(i) * h2) % np.uint64(self.size_bits)
@@ -0,0 +1,168 @@
+"""
+Modulo con la mappa bidirezionale compatta, salvabile su file e mappabile
+in memoria (mmap) in sola lettura.
+
+Ogni codice è memorizzato una sola volta, in un array ordinato di byte UTF-8
+a larghezza fissa; un secondo array contiene, per ogni codice, la posizione
+del suo "gemello". La ricerca è binaria (numpy.searchsorted) in entrambe le
+direzioni. Aperta da file, la mappa non occupa memoria privata del processo:
+le pagine stanno nella page cache e sono condivise da tutti i processi (es.
+i worker gunicorn) che aprono lo stesso file.
+"""
+
+import json
+import mmap
+import os
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+
+MAGIC = b'RNBIMAP1'
+# Allineamento degli array nel file (byte)
+ALIGNMENT = 64
+# Codici decodificati per volta durante l'iterazione
+ITER_BLOCK = 65536
+
+
+class CompactMap(Mapping):
+    """
+    Mappa bidirezionale {codice: gemello} a sola lettura, con l'interfaccia
+    di un dizionario (in, [], get, len, iterazione).
+
+    I codici sono confrontati come byte UTF-8: l'array è largo quanto il
+    codice più lungo, quindi un singolo codice molto lungo fa crescere
+    l'occupazione di tutti.
+    """
+
+    def __init__(self, codes: np.ndarray, partners: np.ndarray, source: Optional[mmap.mmap] = None):
+        """
+        Args:
+            codes: Array ordinato di codici (dtype 'S<larghezza>')
+            partners: Per ogni codice, l'indice del gemello
+            source: mmap da cui provengono gli array (tenuto aperto)
+        """
+        self._codes = codes
+        self._partners = partners
+        self._width = codes.dtype.itemsize
+        self._source = source
+        # Ultima ricerca (chiave, indice): `code in m` seguito da m[code]
+        # cerca una volta sola. Una tupla si assegna in modo atomico.
+        self._last = (None, -1)
+
+    @classmethod
+    def from_dict(cls, mapping: Dict[str, str]) -> 'CompactMap':
+        """
+        Costruisce la mappa compatta da una mappa bidirezionale.
+
+        Raises:
+            ValueError: Se la mappa non è bidirezionale o un codice non è rappresentabile
+        """
+        keys = list(mapping)
+        encoded = [key.encode('utf-8') for key in keys]
+        if any(not raw or raw.endswith(b'\0') for raw in encoded):
+            raise ValueError("Codice vuoto o terminato da un carattere nullo")
+        codes = np.array(encoded, dtype=bytes) if encoded else np.array([], dtype='S1')
+
+        position = {key: i for i, key in enumerate(keys)}
+        try:
+            partner_of = np.fromiter((position[mapping[key]] for key in keys),
+                                     dtype=np.int64, count=len(keys))
+        except KeyError as e:
+            raise ValueError(f"Mappa non bidirezionale: manca il codice {e}")
+
+        order = np.argsort(codes, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        index_dtype = np.int32 if len(keys) < 2 ** 31 else np.int64
+        partners = rank[partner_of[order]].astype(index_dtype)
+        return cls(codes[order], partners)
+
+    @classmethod
+    def load(cls, path: str) -> 'CompactMap':
+        """
+        Apre una mappa salvata con save, in mmap e in sola lettura.
+
+        Raises:
+            ValueError: Se il file non è una mappa compatta valida
+        """
+        with open(path, 'rb') as f:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if source[:len(MAGIC)] != MAGIC:
+            source.close()
+            raise ValueError(f"File non valido per una mappa compatta: {path}")
+        header_size = int.from_bytes(source[len(MAGIC):len(MAGIC) + 8], 'little')
+        header = json.loads(source[len(MAGIC) + 8:len(MAGIC) + 8 + header_size])
+
+        count = header['count']
+        codes = np.frombuffer(source, dtype=f"S{header['width']}", count=count,
+                              offset=header['codes_offset'])
+        partners = np.frombuffer(source, dtype=np.dtype(header['partners_dtype']), count=count,
+                                 offset=header['partners_offset'])
+        return cls(codes, partners, source)
+
+    def save(self, path: str) -> None:
+        """Salva la mappa (scrittura atomica: file temporaneo più rename)."""
+        partners = self._partners.astype(self._partners.dtype.newbyteorder('<'), copy=False)
+        header = {'count': len(self._codes), 'width': self._width,
+                  'partners_dtype': partners.dtype.str}
+        # Gli offset dipendono dalla lunghezza dell'intestazione: spazio fisso
+        base = _align(len(MAGIC) + 8 + 256)
+        header['codes_offset'] = base
+        header['partners_offset'] = _align(base + self._codes.nbytes)
+        encoded = json.dumps(header).encode('utf-8')
+        if len(encoded) > 256:
+            raise ValueError("Intestazione della mappa compatta troppo lunga")
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + len(encoded).to_bytes(8, 'little') + encoded)
+            f.write(b'\0' * (header['codes_offset'] - f.tell()))
+            f.write(self._codes.tobytes())
+            f.write(b'\0' * (header['partners_offset'] - f.tell()))
+            f.write(partners.tobytes())
+        os.replace(tmp_path, path)
+
+    @property
+    def nbytes(self) -> int:
+        """Byte occupati dagli array (in page cache se la mappa è aperta da file)."""
+        return self._codes.nbytes + self._partners.nbytes
+
+    def _index(self, key: object) -> int:
+        """Posizione del codice nell'array ordinato (-1 se assente)."""
+        last_key, last_index = self._last
+        if key == last_key:
+            return last_index
+        if not isinstance(key, str):
+            return -1
+        raw = key.encode('utf-8')
+        index = -1
+        if raw and len(raw) <= self._width:
+            position = int(np.searchsorted(self._codes, raw))
+            if position < len(self._codes) and self._codes[position] == raw:
+                index = position
+        self._last = (key, index)
+        return index
+
+    def __contains__(self, key: object) -> bool:
+        return self._index(key) >= 0
+
+    def __getitem__(self, key: str) -> str:
+        index = self._index(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._codes[self._partners[index]].decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def __iter__(self) -> Iterator[str]:
+        for start in range(0, len(self._codes), ITER_BLOCK):
+            for raw in self._codes[start:start + ITER_BLOCK].tolist():
+                yield raw.decode('utf-8')
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
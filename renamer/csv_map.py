@@ -1,64 +1,80 @@
 """
 Modulo per costruire mapping bidirezionale da file CSV.
+
+La lettura predefinita usa solo il modulo csv della libreria standard: un
+CSV di mapping non richiede di importare pandas (che resta disponibile con
+engine='pandas'). I file Excel passano invece da excel_map, importato solo
+quando serve.
 """
 
-import pandas as pd
-from typing import Dict
+import codecs
+import csv
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 import logging
 
+from .mapping import MapBuilder, MapResult, log_map_result
+
+
+# Parametri della fase di rilevamento e della lettura a blocchi
+SEPARATORS = [',', ';', '\t']
+ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
+SAMPLE_SIZE = 64 * 1024
+CHUNK_THRESHOLD = 64 * 1024 * 1024
+CHUNK_ROWS = 200_000
+
+# Motori di lettura: modulo csv (default) o pandas
+CSV_ENGINES = ('csv', 'pandas')
+
+# Valori trattati come cella vuota, gli stessi di pandas.read_csv: le due
+# letture producono la stessa mappa
+MISSING_VALUES = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+})
 
-def build_map_from_csv(csv_path: str) -> Dict[str, str]:
+
+class CsvDialect(NamedTuple):
+    """Formato rilevato di un file CSV (riutilizzabile tra più letture)."""
+
+    encoding: str
+    delimiter: str
+    columns: List[str]
+
+
+def detect_csv_dialect(csv_path: str, sample_size: int = SAMPLE_SIZE) -> CsvDialect:
     """
-    Legge un file CSV e costruisce una mappa bidirezionale tra colonna A e B.
+    Rileva codifica e separatore leggendo solo l'inizio del file.
     
     Args:
         csv_path: Percorso al file CSV
+        sample_size: Numero di byte letti per il rilevamento
         
     Returns:
-        Dizionario bidirezionale {ColonnaA: ColonnaB, ColonnaB: ColonnaA}
+        CsvDialect con codifica, separatore e intestazioni trovate
         
     Raises:
         FileNotFoundError: Se il file CSV non esiste
         ValueError: Se il file non ha almeno 2 colonne
     """
-    try:
-        # Prova diversi separatori e codifiche
-        separators = [',', ';', '\t']
-        encodings = ['utf-8', 'latin-1', 'cp1252']
-        
-        df = None
-        used_sep = None
-        used_encoding = None
-        
-        for encoding in encodings:
-            for sep in separators:
-                try:
-                    df = pd.read_csv(csv_path, sep=sep, encoding=encoding)
-                    if len(df.columns) >= 2:
-                        used_sep = sep
-                        used_encoding = encoding
-                        break
-                except:
-                    continue
-            if df is not None and len(df.columns) >= 2:
-                break
-        
-        if df is None:
-            raise ValueError("Impossibile leggere il file CSV con separatori comuni (virgola, punto e virgola, tab)")
-        
-        logging.info(f"CSV letto con separatore '{used_sep}' e codifica '{used_encoding}'")
-        logging.info(f"Colonne trovate: {list(df.columns)}")
-        
-        # Verifica che ci siano almeno 2 colonne
-        if len(df.columns) < 2:
-            # Proviamo a leggere il file per vedere il contenuto
-            try:
-                with open(csv_path, 'r', encoding='utf-8') as f:
-                    sample_lines = f.readlines()[:5]
-                    sample_content = ''.join(sample_lines)
-                    
-                raise ValueError(f"""Il file CSV deve avere almeno 2 colonne separate da virgola.
-Trovate: {len(df.columns)} colonna/e.
+    with open(csv_path, 'rb') as f:
+        sample = f.read(sample_size)
+    
+    encoding, text = _detect_encoding(sample)
+    
+    lines = text.splitlines()
+    header_line = next((line for line in lines if line.strip()), '')
+    
+    # Primo separatore (in ordine di preferenza) che produce almeno 2 colonne
+    for sep in SEPARATORS:
+        columns = next(csv.reader([header_line], delimiter=sep), [])
+        if len(columns) >= 2:
+            return CsvDialect(encoding, sep, [col.strip() for col in columns])
+    
+    sample_content = '\n'.join(lines[:5])
+    found = 1 if header_line else 0
+    raise ValueError(f"""Il file CSV deve avere almeno 2 colonne separate da virgola.
+Trovate: {found} colonna/e.
 
 Contenuto attuale del file:
 {sample_content}
@@ -72,43 +88,97 @@ SUGGERIMENTI:
 1. Assicurati che ci siano 2 colonne separate da virgola
 2. La prima riga deve contenere gli header
 3. Nessuna riga vuota all'inizio del file""")
-            except:
-                raise ValueError(f"Il file CSV deve avere almeno 2 colonne. Trovate: {len(df.columns)}")
+
+
+def _detect_encoding(sample: bytes) -> Tuple[str, str]:
+    """Restituisce la prima codifica che decodifica il campione senza errori."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig', sample[len(codecs.BOM_UTF8):].decode('utf-8', errors='replace')
+    
+    for encoding in ENCODINGS:
+        # Decoder incrementale: il campione può terminare a metà di un carattere
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            return encoding, decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+    
+    # latin-1 decodifica qualsiasi sequenza di byte: non si arriva mai qui
+    raise ValueError("Impossibile determinare la codifica del file CSV")
+
+
+def build_map_from_csv(csv_path: str, dialect: Optional[CsvDialect] = None) -> Dict[str, str]:
+    """
+    Legge un file CSV e costruisce una mappa bidirezionale tra colonna A e B.
+    
+    Args:
+        csv_path: Percorso al file CSV
+        dialect: Formato già rilevato (se None viene rilevato dal file)
         
-        # Usa le prime due colonne
-        col_a = df.columns[0]
-        col_b = df.columns[1]
+    Returns:
+        Dizionario bidirezionale {ColonnaA: ColonnaB, ColonnaB: ColonnaA}
         
-        logging.info(f"Usando colonne: '{col_a}' e '{col_b}'")
+    Raises:
+        FileNotFoundError: Se il file CSV non esiste
+        ValueError: Se il file non ha almeno 2 colonne
+    """
+    return load_map_from_csv(csv_path, dialect=dialect).mapping
+
+
+def load_map_from_csv(csv_path: str, dialect: Optional[CsvDialect] = None,
+                      chunksize: Optional[int] = None, engine: str = 'csv') -> MapResult:
+    """
+    Come build_map_from_csv, ma restituisce anche il report delle righe duplicate
+    e il formato rilevato (MapResult.dialect).
+    
+    Il file viene analizzato una sola volta, riga per riga, con il modulo
+    csv: la memoria usata è quella della mappa. Con engine='pandas' oltre
+    CHUNK_THRESHOLD byte viene letto a blocchi di CHUNK_ROWS righe.
+    
+    Args:
+        csv_path: Percorso al file CSV
+        dialect: Formato già rilevato (se None viene rilevato dal file)
+        chunksize: Righe per blocco con engine='pandas' (None = automatico
+            in base alla dimensione)
+        engine: 'csv' (libreria standard) o 'pandas'
         
-        # Rimuovi righe con valori NaN
-        df_clean = df.dropna(subset=[col_a, col_b])
+    Returns:
+        MapResult con la mappa bidirezionale, le righe scartate e il formato
         
-        if len(df_clean) == 0:
-            raise ValueError("Nessuna riga valida trovata nel file CSV")
+    Raises:
+        FileNotFoundError: Se il file CSV non esiste
+        ValueError: Se il file non ha almeno 2 colonne o il motore non è valido
+    """
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Motore CSV non valido: {engine}. Usa uno tra: {', '.join(CSV_ENGINES)}")
+    read = _read_csv_into_builder if engine == 'csv' else _read_csv_with_pandas
+    try:
+        if dialect is None:
+            dialect = detect_csv_dialect(csv_path)
         
-        # Costruisci mappa bidirezionale
-        mapping = {}
-        duplicates = []
+        logging.info(f"CSV letto con separatore '{dialect.delimiter}' e codifica '{dialect.encoding}'")
+        logging.info(f"Colonne trovate: {dialect.columns}")
         
-        for _, row in df_clean.iterrows():
-            code_a = str(row[col_a]).strip()
-            code_b = str(row[col_b]).strip()
-            
-            # Verifica duplicati
-            if code_a in mapping or code_b in mapping:
-                duplicates.append(f"{code_a} <-> {code_b}")
-                continue
-                
-            # Aggiungi mapping bidirezionale
-            mapping[code_a] = code_b
-            mapping[code_b] = code_a
+        if chunksize is None and os.path.getsize(csv_path) > CHUNK_THRESHOLD:
+            chunksize = CHUNK_ROWS
         
-        if duplicates:
-            logging.warning(f"Righe duplicate ignorate: {duplicates}")
+        try:
+            builder = read(csv_path, dialect, chunksize)
+        except UnicodeDecodeError:
+            # Il campione iniziale era valido ma il resto del file no
+            fallback = ENCODINGS[-1]
+            logging.warning(f"Codifica '{dialect.encoding}' non valida oltre l'inizio del file, "
+                            f"nuova lettura con '{fallback}'")
+            dialect = dialect._replace(encoding=fallback)
+            builder = read(csv_path, dialect, chunksize)
         
-        logging.info(f"Mappa costruita con successo: {len(mapping)//2} coppie di codici")
-        return mapping
+        result = builder.result()._replace(dialect=dialect)
+        
+        if not result.mapping:
+            raise ValueError("Nessuna riga valida trovata nel file CSV")
+        
+        log_map_result(result)
+        return result
         
     except FileNotFoundError:
         raise FileNotFoundError(f"File CSV non trovato: {csv_path}")
@@ -118,6 +188,57 @@ SUGGERIMENTI:
         raise ValueError(f"Errore durante la lettura del file CSV: {str(e)}")
 
 
+def _read_csv_into_builder(csv_path: str, dialect: CsvDialect, chunksize: Optional[int]) -> MapBuilder:
+    """Legge le prime due colonne del CSV (una sola passata, modulo csv) nel MapBuilder."""
+    builder = MapBuilder()
+    with open(csv_path, encoding=dialect.encoding, newline='') as f:
+        builder.add_rows(_code_pairs(csv.reader(f, delimiter=dialect.delimiter)))
+    
+    logging.info(f"Usando colonne: '{dialect.columns[0]}' e '{dialect.columns[1]}'")
+    return builder
+
+
+def _code_pairs(reader: Iterator[List[str]]) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    """
+    Prime due colonne di ogni riga dopo l'intestazione, come le legge
+    pandas.read_csv: righe vuote (o di soli spazi) saltate, celle mancanti o in MISSING_VALUES
+    restituite come None.
+    """
+    header_seen = False
+    for fields in reader:
+        if not fields or (len(fields) == 1 and not fields[0].strip()):
+            continue
+        if not header_seen:
+            header_seen = True
+            continue
+        code_a = fields[0] if fields[0] not in MISSING_VALUES else None
+        code_b = fields[1] if len(fields) > 1 and fields[1] not in MISSING_VALUES else None
+        yield code_a, code_b
+
+
+def _read_csv_with_pandas(csv_path: str, dialect: CsvDialect, chunksize: Optional[int]) -> MapBuilder:
+    """Legge le prime due colonne del CSV (una sola passata, pandas) nel MapBuilder."""
+    import pandas as pd
+    
+    reader = pd.read_csv(
+        csv_path,
+        sep=dialect.delimiter,
+        encoding=dialect.encoding,
+        usecols=[0, 1],
+        dtype=str,
+        chunksize=chunksize
+    )
+    chunks = reader if chunksize else [reader]
+    
+    builder = MapBuilder()
+    for chunk in chunks:
+        col_a, col_b = chunk.columns[0], chunk.columns[1]
+        builder.add(chunk[col_a], chunk[col_b])
+    
+    logging.info(f"Usando colonne: '{dialect.columns[0]}' e '{dialect.columns[1]}'")
+    return builder
+
+
 def build_map_auto(file_path: str) -> Dict[str, str]:
     """
     Costruisce mappa automaticamente rilevando il formato (CSV o Excel).
@@ -128,13 +249,27 @@ def build_map_auto(file_path: str) -> Dict[str, str]:
     Returns:
         Dizionario bidirezionale
     """
+    return load_map_auto(file_path).mapping
+
+
+def load_map_auto(file_path: str, streaming: bool = False) -> MapResult:
+    """
+    Come build_map_auto, ma restituisce anche il report delle righe duplicate.
+    
+    Args:
+        file_path: Percorso al file
+        streaming: Lettura in streaming dei file .xlsx (vedi excel_map.load_map)
+        
+    Returns:
+        MapResult con la mappa bidirezionale e le righe scartate
+    """
     file_extension = file_path.lower().split('.')[-1]
     
     if file_extension == 'csv':
-        return build_map_from_csv(file_path)
+        return load_map_from_csv(file_path)
     elif file_extension in ['xlsx', 'xls']:
         # Importa la funzione Excel esistente
-        from .excel_map import build_map
-        return build_map(file_path)
+        from .excel_map import load_map
+        return load_map(file_path, streaming=streaming)
     else:
-        raise ValueError(f"Formato file non supportato: {file_extension}. Usa CSV o Excel (.xlsx/.xls)") 
\ No newline at end of file
+        raise ValueError(f"Formato file non supportato: {file_extension}. Usa CSV o Excel (.xlsx/.xls)")
@@ -0,0 +1,221 @@
+"""
+Modulo per la deduplicazione in base al contenuto durante il processamento.
+
+Due file sono considerati identici se hanno la stessa dimensione e lo stesso
+hash BLAKE2b; l'hash viene calcolato solo quando la dimensione coincide con
+quella di un altro file ed è ricordato in una cache SQLite per percorso,
+dimensione e mtime, così le esecuzioni successive non rileggono i file.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import Executor, Future
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .map_cache import default_cache_dir, file_digest
+from .name_index import OutputNameIndex
+
+
+CHECKSUM_DB_NAME = 'checksums.sqlite'
+
+# Secondi di attesa se il database è bloccato da un altro processo (es. gli
+# shard di run_sharded o un'altra esecuzione sullo stesso catalogo)
+BUSY_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checksums (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL
+)
+"""
+
+
+class ChecksumCache:
+    """
+    Hash del contenuto dei file, riusato finché dimensione e mtime non cambiano.
+
+    È thread-safe: una sola istanza può servire più esecuzioni contemporanee
+    nello stesso processo (vedi batch.run_batch). Tra processi diversi il
+    database è in modalità WAL e le scritture bloccate attendono fino a
+    BUSY_TIMEOUT; se la cache resta inaccessibile l'hash viene calcolato e
+    restituito senza salvarlo.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: File SQLite (default: checksums.sqlite nella cartella di
+                default_cache_dir)
+        """
+        self.path = Path(path) if path else default_cache_dir() / CHECKSUM_DB_NAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def digest(self, path: str, stat: Optional[os.stat_result] = None) -> str:
+        """Hash del contenuto di `path` (dalla cache se il file non è cambiato)."""
+        key = os.path.abspath(path)
+        stat = stat or os.stat(key)
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, digest FROM checksums WHERE path = ?", (key,)
+                ).fetchone()
+            except sqlite3.OperationalError as e:
+                logging.debug(f"Cache degli hash non leggibile per {key}: {e}")
+                row = None
+            if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                self.hits += 1
+                return row[2]
+            self.misses += 1
+
+        digest = file_digest(key)
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checksums (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                    (key, stat.st_size, stat.st_mtime_ns, digest),
+                )
+            except sqlite3.OperationalError as e:
+                logging.debug(f"Hash di {key} non salvato nella cache: {e}")
+        return digest
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class Original:
+    """File trasferito dall'esecuzione: i duplicati successivi puntano alla sua destinazione."""
+
+    __slots__ = ('source', 'destination', 'future', 'digest', 'group', 'position')
+
+    def __init__(self, source: str, destination: Path, future: Optional[Future] = None):
+        self.source = source
+        self.destination = destination
+        # Trasferimento che scrive la destinazione (assegnato dopo l'avvio)
+        self.future = future
+        # Hash del contenuto, calcolato sul pool solo se un altro file ha la
+        # stessa dimensione
+        self.digest: Optional[Future] = None
+        # File visti con la stessa dimensione e posizione di questo fra loro
+        self.group: List['Original'] = []
+        self.position = 0
+
+
+class Deduplicator:
+    """
+    Riconosce i sorgenti già trasferiti con lo stesso contenuto e le
+    destinazioni già presenti in output identiche al sorgente.
+
+    match e existing_copy vanno usati dal thread che pianifica le operazioni,
+    nell'ordine dei file; gli hash sono calcolati sul pool (se c'è) e
+    confrontati con identical dal trasferimento del file.
+    """
+
+    def __init__(self, checksums: ChecksumCache, executor: Optional[Executor] = None):
+        self.checksums = checksums
+        self.executor = executor
+        # Per dimensione: i file visti, nell'ordine di pianificazione
+        self._by_size: Dict[int, List[Original]] = {}
+        self._last: Optional[Original] = None
+
+    def existing_copy(self, source: str, stat: os.stat_result, name: str,
+                      name_index: OutputNameIndex) -> Optional[Path]:
+        """
+        Cerca in output un file già presente, con il nome `name` o una sua
+        variante _N, identico al sorgente.
+
+        Le varianti sono tutte quelle trovate nella cartella, anche dopo un
+        suffisso mancante; gli hash di quelle con la stessa dimensione del
+        sorgente sono calcolati in parallelo sul pool.
+
+        Returns:
+            Percorso del file identico (None se non c'è)
+        """
+        candidates = []
+        for candidate in name_index.existing_variants(name):
+            path = name_index.directory / candidate
+            try:
+                candidate_stat = os.stat(path)
+            except OSError:
+                continue
+            if candidate_stat.st_size == stat.st_size:
+                candidates.append((path, self._digest(str(path), candidate_stat)))
+        if not candidates:
+            return None
+
+        digest = self._digest(source, stat)
+        for path, candidate_digest in candidates:
+            if candidate_digest.result() == digest.result():
+                done: Future = Future()
+                done.set_result(None)
+                self.match(source, stat.st_size, path, done, digest)
+                return path
+        return None
+
+    def match(self, source: str, size: int, destination: Path,
+              future: Optional[Future] = None, digest: Optional[Future] = None
+              ) -> Tuple[bool, Original]:
+        """
+        Registra il sorgente fra quelli visti, senza leggerne il contenuto.
+
+        Returns:
+            (candidato, record): candidato è True se un file già visto ha la
+            stessa dimensione (il confronto degli hash avviene con identical);
+            il record è quello di questo file, il cui Future del
+            trasferimento si assegna con started
+        """
+        original = self._last = Original(source, destination, future)
+        group = self._by_size.setdefault(size, [])
+        if group:
+            # Da qui la dimensione non basta: servono gli hash, calcolati sul
+            # pool prima dei trasferimenti che li confrontano
+            if group[0].digest is None:
+                group[0].digest = self._digest(group[0].source)
+            original.digest = digest or self._digest(source)
+        else:
+            original.digest = digest
+        original.group = group
+        original.position = len(group)
+        group.append(original)
+        return original.position > 0, original
+
+    @staticmethod
+    def identical(original: Original) -> Optional[Original]:
+        """
+        Primo file visto prima di `original` con lo stesso contenuto (None se
+        non c'è). Va chiamato dal trasferimento di `original`: gli hash che
+        attende sono stati inviati al pool prima di esso.
+        """
+        digest = original.digest.result()
+        for candidate in islice(original.group, original.position):
+            if candidate.digest is not None and candidate.digest.result() == digest:
+                return candidate
+        return None
+
+    def started(self, future: Future) -> None:
+        """Assegna il trasferimento all'ultimo record restituito da match."""
+        self._last.future = future
+
+    def _digest(self, path: str, stat: Optional[os.stat_result] = None) -> Future:
+        """Hash di `path` calcolato sul pool (o subito senza pool)."""
+        if self.executor is not None:
+            return self.executor.submit(self.checksums.digest, path, stat)
+        digest: Future = Future()
+        try:
+            digest.set_result(self.checksums.digest(path, stat))
+        except Exception as e:
+            digest.set_exception(e)
+        return digest
@@ -2,31 +2,63 @@
 Modulo per costruire mapping bidirezionale da file Excel.
 """
 
-import pandas as pd
-from typing import Dict
 import logging
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .mapping import MapBuilder, MapResult, build_bidirectional_map, log_map_result
+
+
+REQUIRED_COLUMNS = ['CodeX', 'CodeY']
 
+# Righe esaminate per trovare l'header e righe passate al MapBuilder per blocco
+HEADER_SEARCH_ROWS = 20
+STREAM_BATCH_ROWS = 50_000
 
-def build_map(xlsx_path: str) -> Dict[str, str]:
+
+def build_map(xlsx_path: str, streaming: bool = False) -> Dict[str, str]:
     """
     Legge un file Excel e costruisce una mappa bidirezionale tra CodeX e CodeY.
     
     Args:
         xlsx_path: Percorso al file Excel (.xlsx)
+        streaming: Se True legge il file .xlsx in streaming: openpyxl in sola
+            lettura e righe passate alla mappa a blocchi, senza DataFrame
         
     Returns:
         Dizionario bidirezionale {CodeX: CodeY, CodeY: CodeX}
         
+    Raises:
+        FileNotFoundError: Se il file Excel non esiste
+        ValueError: Se le colonne richieste non sono presenti
+    """
+    return load_map(xlsx_path, streaming=streaming).mapping
+
+
+def load_map(xlsx_path: str, streaming: bool = False) -> MapResult:
+    """
+    Come build_map, ma restituisce anche il report delle righe duplicate.
+    
+    Args:
+        xlsx_path: Percorso al file Excel (.xlsx)
+        streaming: Se True legge il file .xlsx in streaming (vedi build_map)
+        
+    Returns:
+        MapResult con la mappa bidirezionale e le righe scartate
+        
     Raises:
         FileNotFoundError: Se il file Excel non esiste
         ValueError: Se le colonne richieste non sono presenti
     """
     try:
+        if streaming and not xlsx_path.lower().endswith('.xls'):
+            return _load_map_streaming(xlsx_path)
+        
         # Leggi il file Excel
         df = pd.read_excel(xlsx_path)
         
         # Verifica che le colonne richieste esistano
-        required_columns = ['CodeX', 'CodeY']
+        required_columns = REQUIRED_COLUMNS
         missing_columns = [col for col in required_columns if col not in df.columns]
         
         if missing_columns:
@@ -40,29 +72,90 @@ def build_map(xlsx_path: str) -> Dict[str, str]:
             raise ValueError("Nessuna riga valida trovata nel file Excel")
         
         # Costruisci mappa bidirezionale
-        mapping = {}
-        duplicates = []
-        
-        for _, row in df_clean.iterrows():
-            code_x = str(row['CodeX']).strip()
-            code_y = str(row['CodeY']).strip()
-            
-            # Verifica duplicati
-            if code_x in mapping or code_y in mapping:
-                duplicates.append(f"{code_x} <-> {code_y}")
-                continue
-                
-            # Aggiungi mapping bidirezionale
-            mapping[code_x] = code_y
-            mapping[code_y] = code_x
-        
-        if duplicates:
-            logging.warning(f"Righe duplicate ignorate: {duplicates}")
-        
-        logging.info(f"Mappa costruita con successo: {len(mapping)//2} coppie di codici")
-        return mapping
+        result = build_bidirectional_map(df_clean['CodeX'], df_clean['CodeY'])
+        log_map_result(result)
+        return result
         
     except FileNotFoundError:
         raise FileNotFoundError(f"File Excel non trovato: {xlsx_path}")
     except Exception as e:
-        raise ValueError(f"Errore durante la lettura del file Excel: {str(e)}") 
\ No newline at end of file
+        raise ValueError(f"Errore durante la lettura del file Excel: {str(e)}") 
+
+
+def _load_map_streaming(xlsx_path: str) -> MapResult:
+    """
+    Legge solo le colonne CodeX/CodeY dal primo foglio aperto con openpyxl in
+    sola lettura, senza costruire il DataFrame.
+    
+    Le righe dopo l'header passano al MapBuilder a blocchi di
+    STREAM_BATCH_ROWS e vengono scartate subito: oltre alla mappa resta in
+    memoria solo la tabella delle stringhe condivise, che openpyxl carica
+    all'apertura. I valori delle celle sono quelli di read_excel (stesso
+    lettore, stesse conversioni in MapBuilder), quindi la mappa è la stessa
+    della lettura completa. L'header viene cercato nelle prime
+    HEADER_SEARCH_ROWS righe.
+    """
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(xlsx_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        header_row, col_x, col_y = _find_header(
+            enumerate(sheet.iter_rows(max_row=HEADER_SEARCH_ROWS, values_only=True), start=1))
+        logging.info(f"Excel in streaming: header alla riga {header_row}, "
+                     f"colonne {col_x + 1} e {col_y + 1}")
+        
+        # Solo le colonne tra CodeX e CodeY (indici di openpyxl da 1)
+        first = min(col_x, col_y)
+        rows = sheet.iter_rows(min_row=header_row + 1, min_col=first + 1,
+                               max_col=max(col_x, col_y) + 1, values_only=True)
+        builder = MapBuilder()
+        batch_x: List = []
+        batch_y: List = []
+        # Stessa numerazione di pandas: 0 = prima riga dopo l'header
+        batch_start = 0
+        for values in rows:
+            batch_x.append(values[col_x - first] if len(values) > col_x - first else None)
+            batch_y.append(values[col_y - first] if len(values) > col_y - first else None)
+            if len(batch_x) >= STREAM_BATCH_ROWS:
+                _add_batch(builder, batch_start, batch_x, batch_y)
+                batch_start += len(batch_x)
+                batch_x, batch_y = [], []
+        if batch_x:
+            _add_batch(builder, batch_start, batch_x, batch_y)
+    finally:
+        workbook.close()
+    
+    result = builder.result()
+    if not result.mapping:
+        raise ValueError("Nessuna riga valida trovata nel file Excel")
+    
+    log_map_result(result)
+    return result
+
+
+def _add_batch(builder: MapBuilder, start: int, codes_x: List, codes_y: List) -> None:
+    """
+    Passa un blocco di righe al MapBuilder mantenendo i numeri di riga; il
+    tipo delle colonne viene dedotto come in read_excel (es. numeri con celle
+    vuote diventano float64).
+    """
+    index = pd.RangeIndex(start, start + len(codes_x))
+    builder.add(pd.Series(codes_x, index=index), pd.Series(codes_y, index=index))
+
+
+def _find_header(rows: Iterable[Tuple[int, Tuple[Any, ...]]]) -> Tuple[int, int, int]:
+    """Restituisce (riga header, indice colonna CodeX, indice colonna CodeY)."""
+    first_row: Optional[List[str]] = None
+    for row_number, values in rows:
+        headers = {col: str(value).strip() for col, value in enumerate(values) if value is not None}
+        if first_row is None:
+            first_row = [headers[col] for col in sorted(headers)]
+        positions = {name: col for col, name in headers.items()}
+        if all(name in positions for name in REQUIRED_COLUMNS):
+            return row_number, positions['CodeX'], positions['CodeY']
+    
+    present = first_row or []
+    missing = [col for col in REQUIRED_COLUMNS if col not in present]
+    raise ValueError(f"Colonne mancanti nel file Excel: {missing}. "
+                     f"Colonne presenti: {present}")
@@ -2,27 +2,206 @@
 Modulo per operazioni sui file immagine.
 """
 
+import errno
+import os
 import shutil
 import logging
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Deque, Dict, Iterable, Optional, Sequence, Tuple
 
+from .dedup import ChecksumCache, Deduplicator, Original
+from .journal import RunJournal, is_completed
+from .log_utils import FileEventLog
+from .name_index import DEFAULT_MAX_CONFLICTS, OutputNameIndex
+from .plan import SKIP, PlanEntry, PlanReader, PlanWriter
+from .report import FileError, FileOperation, RunReport
+from .scanner import ScanEntry, scan_images
+from .shards import merge_shards, reset_shard, shard_for, staging_dir, write_manifest
 
-def process_images(mapping: Dict[str, str], input_dir: str, output_dir: str, 
-                  exts: List[str], dry_run: bool = False) -> Tuple[int, int, int]:
+
+# Modalità di scrittura dell'output. Tutte tranne 'copy' ripiegano sulla copia
+# se il filesystem non le supporta (es. sorgente e destinazione su device diversi).
+TRANSFER_MODES = ('copy', 'hardlink', 'reflink', 'symlink', 'move')
+
+# Esito di un file già presente in output e non cambiato (con journal)
+UNCHANGED = 'unchanged'
+
+# Modalità usata per un duplicato collegato (hardlink) alla destinazione
+# di un sorgente identico, invece di copiarlo di nuovo
+DEDUP = 'dedup'
+# Modalità in cui i duplicati vengono collegati: le altre non copiano dati
+DEDUP_LINK_MODES = ('copy', 'reflink')
+
+# Errori per cui una modalità non è supportata (device diversi, filesystem
+# senza hardlink o reflink) e si ripiega sulla copia; gli altri, compreso un
+# FileExistsError, vengono propagati
+FALLBACK_ERRNOS = frozenset({errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP,
+                             errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY})
+
+# ioctl Linux per clonare un file (reflink) su btrfs, XFS, ecc.
+_FICLONE = 0x40049409
+
+DEFAULT_EXTS = ('png', 'jpg', 'jpeg', 'bmp', 'gif')
+
+
+@dataclass
+class ProcessOptions:
+    """
+    Opzioni di process_images: quali immagini processare e come scrivere l'output.
+
+    Attributes:
+        exts: Estensioni permesse (es. ['png', 'jpg', 'jpeg'])
+        dry_run: Se True, simula le operazioni senza eseguirle
+        workers: Thread usati per le copie (1 = sequenziale, vedi default_workers)
+        mode: Come scrivere l'output: 'copy', 'hardlink', 'reflink', 'symlink'
+            o 'move' (con ripiego automatico sulla copia se non supportata)
+        max_conflicts: Suffissi _N massimi per lo stesso nome (None o 0 = nessun limite)
+        recursive: Se True cerca le immagini anche nelle sottocartelle
+        max_depth: Profondità massima della ricerca ricorsiva (None = illimitata)
+        include: Pattern glob dei file da includere (percorso relativo o nome)
+        exclude: Pattern glob di file o cartelle da escludere
+        mirror: Se True riproduce in output la struttura delle sottocartelle
+        journal: Se True usa il journal per esecuzioni incrementali e riprese
+        quiet: Se True registra solo riepilogo, errori e avvisi campionati
+        max_warnings: Codici non trovati da segnalare prima di limitarsi a
+            contarli (None = tutti, o DEFAULT_MAX_WARNINGS con quiet)
+        dedup: Se True non riscrive contenuti già presenti (non con 'move')
+    """
+
+    exts: Sequence[str] = DEFAULT_EXTS
+    dry_run: bool = False
+    workers: int = 1
+    mode: str = 'copy'
+    max_conflicts: Optional[int] = DEFAULT_MAX_CONFLICTS
+    recursive: bool = False
+    max_depth: Optional[int] = None
+    include: Sequence[str] = ()
+    exclude: Sequence[str] = ()
+    mirror: bool = False
+    journal: bool = False
+    quiet: bool = False
+    max_warnings: Optional[int] = None
+    dedup: bool = False
+
+
+def default_workers() -> int:
+    """
+    Numero di thread di copia predefinito.
+    
+    La copia è limitata dalla latenza di I/O (soprattutto su NAS), non dalla
+    CPU: si usano più thread dei core disponibili, con un tetto di 32.
+    """
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+def process_images(mapping: Dict[str, str], input_dir: str, output_dir: str,
+                  options: Optional[ProcessOptions] = None,
+                  progress: Optional[Callable[[int], None]] = None,
+                  shard: Optional[Tuple[int, int]] = None,
+                  run_id: Optional[str] = None,
+                  entries: Optional[Iterable[ScanEntry]] = None,
+                  executor: Optional[ThreadPoolExecutor] = None,
+                  plan: Optional[PlanWriter] = None,
+                  operations_log: Optional[str] = None,
+                  checksums: Optional[ChecksumCache] = None) -> RunReport:
     """
     Processa le immagini rinominandole secondo la mappa fornita.
     
+    I nomi di destinazione (e i relativi conflitti) vengono decisi nel thread
+    principale seguendo l'ordine alfabetico dei file, quindi il risultato è lo
+    stesso con qualsiasi numero di thread; solo le copie vengono eseguite in
+    parallelo. I messaggi di log rispettano sempre l'ordine dei file.
+    
+    La cartella di output viene letta una sola volta (OutputNameIndex): i
+    conflitti di nome si risolvono in memoria, senza interrogare il disco
+    per ogni file. La scansione dell'input (scanner.scan_images) è lazy: i
+    trasferimenti partono mentre la scansione è ancora in corso.
+    
+    Il report contiene anche i tempi per fase (scansione, ricerca nella mappa
+    e scelta del nome, trasferimento), i byte processati e copiati e il
+    dettaglio degli errori.
+    
+    Con journal=True ogni operazione viene registrata in un journal SQLite
+    nella cartella di output (journal.RunJournal). Rieseguendo sulla stessa
+    cartella si saltano i sorgenti invariati, si riprende un'esecuzione
+    interrotta e si rifanno solo i file il cui sorgente o la cui voce di
+    mapping è cambiata, senza creare copie _N dello stesso sorgente; se è
+    cambiata la voce di mapping la destinazione precedente viene rimossa.
+    
+    Con dedup=True si evitano le scritture di contenuti già presenti
+    (dedup.Deduplicator): se in output c'è già un file identico con il nome
+    target (o una sua variante _N) il file risulta invariato invece di
+    generare un'altra copia _N, e un sorgente identico a uno già copiato
+    nell'esecuzione diventa un hardlink alla sua destinazione. Gli hash sono
+    calcolati solo per file della stessa dimensione e ricordati tra le
+    esecuzioni (dedup.ChecksumCache).
+    
+    Con shard=(i, N) vengono processate solo le immagini dello shard i (vedi
+    shards.shard_for): i file sono scritti in una cartella di staging
+    dentro l'output e il report viene salvato nel manifest dello shard.
+    Terminati tutti gli shard, shards.merge_shards li sposta nell'output;
+    il risultato è lo stesso di un'esecuzione singola (run_sharded esegue
+    gli shard in parallelo su questa macchina).
+    
+    Con plan (solo in dry-run) le decisioni vengono anche scritte in un piano
+    (plan.PlanWriter): sorgente, destinazione con il nome _N già scelto e
+    operazione per ogni immagine. apply_plan lo esegue in seguito, anche su
+    un'altra macchina, senza rileggere la mappa né ripetere la scansione.
+    
+    Con quiet=True non viene scritta una riga per ogni file: restano gli
+    errori, gli avvisi sui codici non trovati (deduplicati e limitati, vedi
+    log_utils.FileEventLog) e il riepilogo finale.
+    
     Args:
         mapping: Dizionario di mapping {codice_sorgente: codice_target}
         input_dir: Cartella contenente le immagini di input
         output_dir: Cartella di destinazione per le immagini rinominate
-        exts: Lista di estensioni permesse (es. ['png', 'jpg', 'jpeg'])
-        dry_run: Se True, simula le operazioni senza eseguirle
+        options: Estensioni, modalità e le altre opzioni dell'esecuzione
+            (default: ProcessOptions())
+        progress: Funzione chiamata con il numero di file esaminati finora,
+            ogni volta che l'esito di un file viene registrato
+        shard: (i, N) per processare solo lo shard i di N (non con journal)
+        run_id: Identificativo comune agli shard della stessa esecuzione,
+            salvato nel manifest (richiesto con shard, vedi shards.try_merge)
+        entries: Immagini da processare al posto della scansione di input_dir
+            (es. solo i file cambiati, vedi scanner.scan_paths)
+        executor: Pool di thread condiviso per le copie (es. tra più
+            esecuzioni contemporanee, vedi batch.run_batch): non viene chiuso
+            e ne limita la concorrenza complessiva; workers determina solo
+            quante operazioni di questa esecuzione restano in corso
+        plan: Piano in cui scrivere le operazioni decise (richiede dry_run)
+        operations_log: File JSONL in cui scrivere le operazioni eseguite,
+            una per riga (vedi RunReport.write_json); il report le tiene in
+            memoria solo con shard, per il manifest
+        checksums: Cache degli hash condivisa (es. tra i job di
+            batch.run_batch) al posto di una aperta per questa esecuzione:
+            non viene chiusa
         
     Returns:
-        Tupla (processed, skipped, errors) con i conteggi delle operazioni
+        RunReport con i conteggi (spacchettabile come tupla processed,
+        skipped, errors), i file invariati, tempi, byte, errori e i file
+        per modalità usata
     """
+    options = options or ProcessOptions()
+    dry_run, workers, mode, journal, dedup = (options.dry_run, options.workers, options.mode,
+                                              options.journal, options.dedup)
+    mirror, quiet = options.mirror, options.quiet
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f"Modalità non supportata: {mode}. Usa una tra: {', '.join(TRANSFER_MODES)}")
+    if dedup and mode == 'move':
+        raise ValueError("La deduplicazione non è compatibile con la modalità move")
+    if shard and journal:
+        raise ValueError("Il journal non è compatibile con l'esecuzione a shard")
+    if plan is not None and (not dry_run or shard):
+        raise ValueError("Il piano si calcola in dry-run e senza shard")
+    if shard and not run_id:
+        raise ValueError("L'esecuzione a shard richiede un run id")
+    
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     
@@ -33,92 +212,590 @@ def process_images(mapping: Dict[str, str], input_dir: str, output_dir: str,
     # Crea cartella di output se non esiste
     if not dry_run:
         output_path.mkdir(parents=True, exist_ok=True)
+        if shard:
+            reset_shard(output_dir, *shard)
     
-    # Normalizza estensioni (rimuovi punto e converti in lowercase)
-    normalized_exts = [ext.lower().lstrip('.') for ext in exts]
+    workers = max(1, workers)
+    own_executor = executor is None
+    if dry_run:
+        executor = None
+    elif own_executor and workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
     
-    processed = 0
-    skipped = 0
-    errors = 0
+    run_journal = RunJournal.open_for_run(output_dir, dry_run) if journal else None
+    own_checksums = dedup and checksums is None
+    if own_checksums:
+        checksums = ChecksumCache()
+    deduplicator = Deduplicator(checksums, executor) if dedup else None
+    link_duplicates = dedup and mode in DEDUP_LINK_MODES and not dry_run
     
-    # Scansiona tutti i file nella cartella di input
-    for file_path in input_path.iterdir():
-        if not file_path.is_file():
-            continue
-            
-        # Verifica estensione
-        file_ext = file_path.suffix.lower().lstrip('.')
-        if file_ext not in normalized_exts:
-            logging.debug(f"File saltato (estensione non supportata): {file_path.name}")
-            continue
-        
-        # Estrai basename (nome senza estensione)
-        basename = file_path.stem
-        
-        # Cerca corrispondenza nella mappa
-        if basename not in mapping:
-            logging.warning(f"Codice non trovato nella mappa: {basename}")
-            skipped += 1
-            continue
-        
-        try:
-            # Trova codice target
-            target_code = mapping[basename]
-            
-            # Costruisci nome file di destinazione
-            dest_filename = f"{target_code}{file_path.suffix}"
-            dest_path = output_path / dest_filename
-            
-            # Gestisci conflitti di nome
-            if dest_path.exists() and not dry_run:
-                dest_path = _resolve_name_conflict(dest_path)
+    # Con gli shard i nomi occupati sono quelli dell'output, ma i file vengono
+    # scritti nello staging dello shard
+    write_root = staging_dir(output_dir, *shard) if shard else output_path
+    
+    report = RunReport(keep_operations=bool(shard))
+    events = FileEventLog(quiet, options.max_warnings, operations_log)
+    started = time.perf_counter()
+    # Nomi già presenti in output più quelli assegnati durante l'esecuzione,
+    # un indice per ogni cartella di output (più di una solo con mirror)
+    name_indexes: Dict[str, OutputNameIndex] = {}
+    # Operazioni in corso, nell'ordine dei file: (sorgente, destinazione, esito)
+    pending: Deque[Tuple[ScanEntry, Optional[Path], Optional[Future]]] = deque()
+    window = workers * 4
+    
+    # Scansiona le immagini nella cartella di input (l'output viene saltato
+    # se si trova al suo interno)
+    if entries is None:
+        entries = scan_images(str(input_path), options.exts, recursive=options.recursive,
+                              max_depth=options.max_depth, include=options.include,
+                              exclude=options.exclude, skip_dirs=[str(output_path)])
+    else:
+        entries = iter(entries)
+    
+    try:
+        while True:
+            scan_start = time.perf_counter()
+            entry = next(entries, None)
+            lookup_start = time.perf_counter()
+            report.add_time('scan', lookup_start - scan_start)
+            if entry is None:
+                break
             
-            # Esegui copia (se non in modalità dry-run)
-            if dry_run:
-                logging.info(f"[DRY-RUN] {file_path.name} -> {dest_path.name}")
+            # Cerca corrispondenza nella mappa
+            if entry.stem not in mapping:
+                if not shard or shard_for(entry.relative_path, shard[1]) == shard[0]:
+                    pending.append((entry, None, None))
+                    if plan is not None:
+                        plan.add(entry, None, None, False, None)
+                report.add_time('lookup', time.perf_counter() - lookup_start)
             else:
-                shutil.copy2(file_path, dest_path)
-                logging.info(f"Rinominato: {file_path.name} -> {dest_path.name}")
+                relative_dir = entry.relative_dir if mirror else ''
+                dest_name = f"{mapping[entry.stem]}{entry.suffix}"
+                # Chiave dello shard: il nome di destinazione, così i conflitti
+                # sullo stesso nome restano nello stesso shard
+                if shard and shard_for(f"{relative_dir}/{dest_name}", shard[1]) != shard[0]:
+                    report.add_time('lookup', time.perf_counter() - lookup_start)
+                    continue
+                name_index = name_indexes.get(relative_dir)
+                if name_index is None:
+                    name_index = _open_output_dir(output_path, relative_dir, options.max_conflicts, dry_run,
+                                                  write_root)
+                    name_indexes[relative_dir] = name_index
+                
+                dest_path, overwrite, outcome, duplicate_of = _plan(
+                    entry, dest_name, name_index, dry_run, mode,
+                    run_journal, deduplicator if dedup else None, link_duplicates)
+                report.add_time('lookup', time.perf_counter() - lookup_start)
+                if plan is not None:
+                    plan.add(entry, dest_name, dest_path, overwrite, outcome)
+                if outcome is None:
+                    outcome = _start_transfer(Path(entry.path), dest_path, mode, overwrite, executor,
+                                              duplicate_of)
+                    if link_duplicates:
+                        deduplicator.started(outcome)
+                pending.append((entry, dest_path, outcome))
             
-            processed += 1
-            
-        except Exception as e:
-            logging.error(f"Errore durante il processamento di {file_path.name}: {str(e)}")
-            errors += 1
+            _drain(pending, window if executor else 0, report, events, dry_run, mode, mirror, progress)
+        
+        _drain(pending, 0, report, events, dry_run, mode, mirror, progress)
+    finally:
+        if executor and own_executor:
+            executor.shutdown(wait=True)
+        if run_journal:
+            run_journal.close()
+        if own_checksums:
+            checksums.close()
+        events.close()
+        report.duration = time.perf_counter() - started
+    
+    if shard and not dry_run:
+        write_manifest(output_dir, *shard, report, run_id)
+    
+    processed, skipped, errors = report
     
     # Log finale
-    total_files = processed + skipped + errors
+    events.summary()
+    total_files = report.examined
     logging.info(f"Operazioni completate:")
     logging.info(f"  - File processati: {processed}")
     logging.info(f"  - File saltati: {skipped}")
     logging.info(f"  - Errori: {errors}")
+    if journal or dedup:
+        logging.info(f"  - File invariati: {report.unchanged}")
     logging.info(f"  - Totale file esaminati: {total_files}")
+    if not dry_run and report.modes:
+        logging.info(f"  - Modalità usate: {report.mode_counts()}")
+        logging.info(f"  - Dati processati: {report.bytes_processed / 1e6:.1f} MB "
+                     f"({report.bytes_copied / 1e6:.1f} MB copiati) in {report.duration:.2f}s")
     
-    return processed, skipped, errors
+    return report
 
 
-def _resolve_name_conflict(dest_path: Path) -> Path:
+def run_sharded(processes: int, mapping: Dict[str, str], input_dir: str, output_dir: str,
+                options: Optional[ProcessOptions] = None) -> RunReport:
     """
-    Risolve conflitti di nome aggiungendo suffissi numerici.
+    Esegue process_images in `processes` processi (uno shard ciascuno) e
+    unisce il risultato con shards.merge_shards.
     
     Args:
-        dest_path: Percorso di destinazione originale
+        processes: Numero di processi (e di shard)
+        mapping, input_dir, output_dir, options: Come in process_images
         
     Returns:
-        Nuovo percorso senza conflitti
+        RunReport complessivo (come un'esecuzione singola)
     """
-    counter = 1
-    stem = dest_path.stem
-    suffix = dest_path.suffix
-    parent = dest_path.parent
+    # Importato qui: multiprocessing serve solo con più processi
+    from concurrent.futures import ProcessPoolExecutor
     
-    while dest_path.exists():
-        new_name = f"{stem}_{counter}{suffix}"
-        dest_path = parent / new_name
-        counter += 1
+    processes = max(1, processes)
+    options = options or ProcessOptions()
+    run_id = uuid.uuid4().hex
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(process_images, mapping, input_dir, output_dir, options,
+                               shard=(index, processes), run_id=run_id)
+                   for index in range(1, processes + 1)]
+        reports = [future.result() for future in futures]
+    
+    if options.dry_run:
+        # Nessun file scritto: basta sommare i report
+        merged = RunReport()
+        for shard_report in reports:
+            for name in ('processed', 'skipped', 'errors', 'unchanged'):
+                setattr(merged, name, getattr(merged, name) + getattr(shard_report, name))
+            merged.duration = max(merged.duration, shard_report.duration)
+        return merged
+    return merge_shards(output_dir, processes, run_id=run_id)
+
+
+def apply_plan(plan_path: str, input_dir: Optional[str] = None, output_dir: Optional[str] = None,
+               workers: int = 1, check_sources: bool = True,
+               progress: Optional[Callable[[int], None]] = None,
+               quiet: bool = False, max_warnings: Optional[int] = None,
+               operations_log: Optional[str] = None) -> RunReport:
+    """
+    Esegue un piano calcolato con process_images(..., dry_run=True, plan=...).
+    
+    Le operazioni vengono lette in streaming e inviate al pool di thread a
+    blocchi (al massimo workers * 4 in corso); gli esiti sono registrati
+    nell'ordine del piano, come in process_images. Non serve la mappa e la
+    cartella di input non viene scansionata.
+    
+    Ogni voce viene eseguita secondo la propria azione (skip, unchanged o
+    la modalità di trasferimento), anche se diversa da quella
+    dell'intestazione: un piano filtrato o modificato a mano si applica
+    com'è. Il piano non viene ricalcolato: un'operazione fallisce (ed è
+    riportata tra gli errori) se l'azione non è valida, se il sorgente è
+    cambiato dopo la pianificazione o se la destinazione esiste già e il
+    piano non prevedeva di sovrascriverla.
+    
+    Args:
+        plan_path: File del piano
+        input_dir: Cartella di input (default: quella del piano)
+        output_dir: Cartella di output (default: quella del piano)
+        workers: Thread usati per i trasferimenti
+        check_sources: Se True confronta dimensione e mtime dei sorgenti con il piano
+        progress, quiet, max_warnings, operations_log: Come in process_images
+        
+    Returns:
+        RunReport dell'esecuzione
+        
+    Raises:
+        FileNotFoundError: Se il piano non esiste
+        ValueError: Se il piano non è valido
+    """
+    reader = PlanReader(plan_path)
+    header = reader.header
+    input_path = Path(input_dir or header['input_dir'])
+    output_path = Path(output_dir or header['output_dir'])
+    mode = header['mode']
+    if mode not in TRANSFER_MODES:
+        reader.close()
+        raise ValueError(f"Modalità non supportata nel piano: {mode}")
+    
+    output_path.mkdir(parents=True, exist_ok=True)
+    workers = max(1, workers)
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    run_journal = RunJournal(str(output_path)) if header.get('journal') else None
+    
+    report = RunReport()
+    events = FileEventLog(quiet, max_warnings, operations_log)
+    started = time.perf_counter()
+    created_dirs = set()
+    pending: Deque[Tuple[ScanEntry, Optional[Path], Optional[Future]]] = deque()
+    window = workers * 4
+    
+    try:
+        for item in reader:
+            relative_dir, _, name = item.source.rpartition('/')
+            stem, suffix = os.path.splitext(name)
+            entry = ScanEntry(str(input_path.joinpath(*item.source.split('/'))), relative_dir,
+                              name, stem, suffix)
+            if item.action == SKIP:
+                pending.append((entry, None, None))
+            elif item.action == UNCHANGED:
+                outcome: Future = Future()
+                outcome.set_result((UNCHANGED, 0.0, 0))
+                pending.append((entry, output_path.joinpath(*item.destination.split('/')), outcome))
+            else:
+                # La modalità è quella della voce: un piano modificato o
+                # filtrato a mano può differire dall'intestazione
+                dest_path = output_path.joinpath(*item.destination.split('/'))
+                outcome = _check_planned(entry, item, dest_path, check_sources)
+                if outcome is None:
+                    if dest_path.parent not in created_dirs:
+                        dest_path.parent.mkdir(parents=True, exist_ok=True)
+                        created_dirs.add(dest_path.parent)
+                    if run_journal is not None:
+                        run_journal.record(os.path.abspath(entry.path), item.size, item.mtime_ns,
+                                           item.target, os.path.abspath(dest_path), item.action)
+                    outcome = _start_transfer(Path(entry.path), dest_path, item.action,
+                                              item.overwrite, executor)
+                pending.append((entry, dest_path, outcome))
+            
+            _drain(pending, window if executor else 0, report, events, False, mode,
+                   header.get('mirror', False), progress)
         
-        # Limite di sicurezza per evitare loop infiniti
-        if counter > 1000:
-            raise RuntimeError(f"Troppi conflitti di nome per: {stem}{suffix}")
+        _drain(pending, 0, report, events, False, mode, header.get('mirror', False), progress)
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+        if run_journal:
+            run_journal.close()
+        reader.close()
+        events.close()
+        report.duration = time.perf_counter() - started
     
-    return dest_path 
\ No newline at end of file
+    processed, skipped, errors = report
+    events.summary()
+    logging.info(f"Piano applicato: {processed} file processati, {skipped} saltati, "
+                 f"{errors} errori, {report.unchanged} invariati in {report.duration:.2f}s")
+    return report
+
+
+def _check_planned(entry: ScanEntry, item: PlanEntry, dest_path: Path, check_sources: bool) -> Optional[Future]:
+    """Esito già deciso (errore) se il piano non è più valido per l'operazione, altrimenti None."""
+    error = None
+    try:
+        stat = os.stat(entry.path)
+        if item.action not in TRANSFER_MODES:
+            error = f"Azione non valida nel piano: {item.action}"
+        elif check_sources and (stat.st_size, stat.st_mtime_ns) != (item.size, item.mtime_ns):
+            error = "Sorgente modificato dopo la creazione del piano"
+        elif not item.overwrite and os.path.lexists(dest_path):
+            error = f"Destinazione già esistente: {dest_path.name} (piano non più valido)"
+    except OSError as e:
+        error = str(e)
+    if error is None:
+        return None
+    outcome: Future = Future()
+    outcome.set_exception(RuntimeError(error))
+    return outcome
+
+
+def _open_output_dir(output_path: Path, relative_dir: str, max_conflicts: Optional[int],
+                     dry_run: bool, write_root: Optional[Path] = None) -> OutputNameIndex:
+    """Crea (se serve) una cartella di output e ne indicizza i nomi."""
+    directory = output_path / relative_dir if relative_dir else output_path
+    write_root = write_root or output_path
+    write_dir = write_root / relative_dir if relative_dir else write_root
+    if not dry_run:
+        directory.mkdir(parents=True, exist_ok=True)
+        write_dir.mkdir(parents=True, exist_ok=True)
+    return OutputNameIndex(directory, max_conflicts, write_dir)
+
+
+def _plan(entry: ScanEntry, dest_name: str, name_index: OutputNameIndex, dry_run: bool, mode: str,
+          journal: Optional[RunJournal] = None, deduplicator: Optional[Deduplicator] = None,
+          link_duplicates: bool = False
+          ) -> Tuple[Optional[Path], bool, Optional[Future], Optional[Original]]:
+    """
+    Sceglie il nome di destinazione.
+    
+    Returns:
+        (destinazione, sovrascrivere, esito, originale): l'esito è già deciso
+        (Future completato) se non serve alcun trasferimento, altrimenti è
+        None; originale è il record del file se un file già trasferito ha la
+        stessa dimensione, da confrontare per hash nel trasferimento (solo
+        con link_duplicates)
+    """
+    outcome: Future = Future()
+    dest_path = None
+    overwrite = False
+    duplicate_of = None
+    try:
+        source = os.path.abspath(entry.path)
+        stat = os.stat(source) if journal is not None or deduplicator is not None else None
+        
+        if journal is not None:
+            record = journal.lookup(source)
+            # Stesso sorgente e stessa voce di mapping: riusa la destinazione
+            # registrata (completa = invariato, altrimenti va riscritta)
+            if (record is not None and record.target == dest_name
+                    and os.path.dirname(record.destination) == os.path.abspath(name_index.directory)):
+                dest_path = Path(record.destination)
+                if is_completed(record, stat.st_size, stat.st_mtime_ns, dest_name):
+                    outcome.set_result((UNCHANGED, 0.0, 0))
+                    return dest_path, overwrite, outcome, None
+                name_index.claim(dest_path.name)
+                overwrite = True
+            elif record is not None and not dry_run:
+                # Voce di mapping cambiata (es. mappa ricaricata in watch): la
+                # destinazione registrata ha il nome vecchio e va tolta
+                _remove_stale(record.destination, name_index)
+        
+        if dest_path is None and deduplicator is not None:
+            # Contenuto già presente in output: niente nuova copia _N
+            identical = deduplicator.existing_copy(source, stat, dest_name, name_index)
+            if identical is not None:
+                outcome.set_result((UNCHANGED, 0.0, 0))
+                return identical, overwrite, outcome, None
+        
+        if dest_path is None:
+            # Gestisci conflitti di nome
+            dest_path = name_index.reserve(dest_name)
+        
+        if dry_run:
+            outcome.set_result((None, 0.0, 0))
+            return dest_path, overwrite, outcome, None
+        
+        if link_duplicates:
+            candidate, original = deduplicator.match(source, stat.st_size, dest_path)
+            if candidate:
+                duplicate_of = original
+        
+        if journal is not None:
+            # Registrata prima di scrivere: una ripresa riusa questa destinazione
+            journal.record(source, stat.st_size, stat.st_mtime_ns, dest_name,
+                           os.path.abspath(dest_path), mode)
+    except Exception as e:
+        outcome.set_exception(e)
+        return dest_path, overwrite, outcome, None
+    return dest_path, overwrite, None, duplicate_of
+
+
+def _remove_stale(destination: str, name_index: OutputNameIndex) -> None:
+    """Rimuove l'output di un sorgente scritto con un nome non più valido e ne libera il nome."""
+    try:
+        os.unlink(destination)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        logging.warning(f"Destinazione precedente non rimossa {destination}: {e}")
+        return
+    logging.info(f"Rimossa la destinazione precedente {destination}: la voce di mapping è cambiata")
+    if os.path.dirname(destination) == os.path.abspath(name_index.directory):
+        name_index.release(os.path.basename(destination))
+
+
+def _start_transfer(file_path: Path, dest_path: Path, mode: str, overwrite: bool,
+                    executor: Optional[ThreadPoolExecutor],
+                    duplicate_of: Optional[Original] = None) -> Future:
+    """Avvia il trasferimento sul pool (o lo esegue subito senza pool)."""
+    if duplicate_of is not None:
+        task, args = _link_duplicate, (file_path, dest_path, mode, overwrite, duplicate_of)
+    else:
+        task, args = _timed_transfer, (file_path, dest_path, mode, overwrite)
+    if executor:
+        return executor.submit(task, *args)
+    outcome: Future = Future()
+    try:
+        outcome.set_result(task(*args))
+    except Exception as e:
+        outcome.set_exception(e)
+    return outcome
+
+
+def _timed_transfer(source: Path, dest: Path, mode: str, overwrite: bool) -> Tuple[str, float, int]:
+    """transfer_file con durata e dimensione del file: (modalità usata, secondi, byte)."""
+    start = time.perf_counter()
+    size = os.stat(source).st_size
+    used_mode = transfer_file(source, dest, mode, overwrite)
+    return used_mode, time.perf_counter() - start, size
+
+
+def _link_duplicate(source: Path, dest: Path, mode: str, overwrite: bool,
+                    record: Original) -> Tuple[str, float, int]:
+    """
+    Collega `dest` alla destinazione di un sorgente identico già trasferito;
+    se non ce n'è uno, l'originale non è stato scritto o l'hardlink non è
+    possibile esegue il trasferimento normale.
+    """
+    start = time.perf_counter()
+    size = os.stat(source).st_size
+    try:
+        original = Deduplicator.identical(record)
+        if original is not None:
+            # Sul pool l'originale è stato inviato prima: è già in esecuzione o finito
+            original.future.result()
+            if overwrite and os.path.lexists(dest):
+                os.unlink(dest)
+            os.link(original.destination, dest)
+            return DEDUP, time.perf_counter() - start, size
+    except Exception as e:
+        logging.debug(f"Collegamento del duplicato {source.name} non riuscito ({e}), trasferimento normale")
+    return _timed_transfer(source, dest, mode, overwrite)
+
+
+def _drain(pending: Deque[Tuple[ScanEntry, Optional[Path], Optional[Future]]], limit: int,
+           report: RunReport, events: FileEventLog, dry_run: bool, mode: str, mirror: bool,
+           progress: Optional[Callable[[int], None]] = None) -> None:
+    """Registra gli esiti in ordine finché restano al massimo `limit` operazioni in corso."""
+    while len(pending) > limit:
+        entry, dest_path, outcome = pending.popleft()
+        _record_outcome(entry, dest_path, outcome, report, events, dry_run, mode, mirror)
+        if progress:
+            progress(report.examined)
+
+
+def _record_outcome(entry: ScanEntry, dest_path: Optional[Path], outcome: Optional[Future],
+                    report: RunReport, events: FileEventLog, dry_run: bool, mode: str,
+                    mirror: bool) -> None:
+    """Registra nel report (e nel log) l'esito di un singolo file."""
+    if outcome is None:
+        events.missing_code(entry.stem)
+        report.skipped += 1
+        return
+    
+    try:
+        used_mode, seconds, size = outcome.result()
+    except Exception as e:
+        logging.error(f"Errore durante il processamento di {entry.relative_path}: {str(e)}")
+        report.errors += 1
+        report.failures.append(FileError(entry.path, str(e)))
+        return
+    
+    if used_mode == UNCHANGED:
+        if events.debug_lines:
+            logging.debug(f"Invariato: {entry.relative_path} -> {dest_path.name}")
+        report.unchanged += 1
+        return
+    
+    if events.file_lines:
+        source_name = entry.relative_path
+        dest_name = f"{entry.relative_dir}/{dest_path.name}" if mirror and entry.relative_dir else dest_path.name
+        if dry_run:
+            logging.info(f"[DRY-RUN] {source_name} -> {dest_name}")
+        elif used_mode == 'copy' and mode == 'copy':
+            logging.info(f"Rinominato: {source_name} -> {dest_name}")
+        else:
+            logging.info(f"Rinominato ({used_mode}): {source_name} -> {dest_name}")
+    if not dry_run:
+        operation = FileOperation(entry.path, str(dest_path), used_mode)
+        report.add_operation(operation)
+        events.operation(operation)
+        report.add_time('copy', seconds)
+        report.bytes_processed += size
+        if used_mode in ('copy', 'copy+delete'):
+            report.bytes_copied += size
+    report.processed += 1
+
+
+def transfer_file(source: Path, dest: Path, mode: str = 'copy', overwrite: bool = False) -> str:
+    """
+    Scrive `dest` a partire da `source` nella modalità richiesta.
+    
+    Senza overwrite la destinazione viene creata in modo esclusivo (O_EXCL,
+    link o rinomina senza sostituzione): un file già presente non viene mai
+    sovrascritto. Si ripiega sulla copia solo se la modalità non è supportata
+    (FALLBACK_ERRNOS).
+    
+    Args:
+        source: File sorgente
+        dest: Percorso di destinazione (non deve esistere, salvo overwrite)
+        mode: Una delle TRANSFER_MODES
+        overwrite: Se True rimuove prima un eventuale `dest` esistente (che
+            potrebbe essere un hardlink o un symlink verso il sorgente)
+        
+    Returns:
+        Modalità effettivamente usata: quella richiesta, 'copy' se è stato
+        necessario ripiegare sulla copia, 'copy+delete' per uno spostamento
+        tra filesystem diversi
+        
+    Raises:
+        FileExistsError: Se `dest` esiste già e overwrite è False
+        ValueError: Se la modalità non è supportata
+    """
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f"Modalità non supportata: {mode}")
+    if overwrite and os.path.lexists(dest):
+        os.unlink(dest)
+    
+    if mode == 'copy':
+        _copy_exclusive(source, dest)
+        return 'copy'
+    
+    try:
+        if mode == 'hardlink':
+            os.link(source, dest)
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(source), dest)
+        elif mode == 'reflink':
+            _reflink(source, dest)
+        else:
+            _rename_exclusive(source, dest)
+        return mode
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno not in FALLBACK_ERRNOS:
+            raise
+        logging.debug(f"{mode} non riuscito per {source.name} ({e}), uso la copia")
+    
+    _copy_exclusive(source, dest)
+    if mode == 'move':
+        os.unlink(source)
+        return 'copy+delete'
+    return 'copy'
+
+
+def _copy_exclusive(source: Path, dest: Path) -> None:
+    """copy2 su una destinazione creata prima con O_EXCL (FileExistsError se esiste)."""
+    with open(dest, 'xb'):
+        pass
+    try:
+        shutil.copy2(source, dest)
+    except BaseException:
+        _unlink_quietly(dest)
+        raise
+
+
+def _rename_exclusive(source: Path, dest: Path) -> None:
+    """
+    Sposta `source` senza sostituire un `dest` esistente: hardlink più
+    rimozione del sorgente (os.rename sovrascriverebbe), oppure rename dopo
+    un controllo se il filesystem non supporta gli hardlink.
+    """
+    try:
+        os.link(source, dest)
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise
+        if os.path.lexists(dest):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dest))
+        os.rename(source, dest)
+        return
+    os.unlink(source)
+
+
+def _reflink(source: Path, dest: Path) -> None:
+    """Clona il file condividendo i blocchi su disco (copy-on-write)."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.ENOTSUP, "reflink non disponibile su questa piattaforma")
+    
+    with open(source, 'rb') as src, open(dest, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(dest)
+            raise
+    shutil.copystat(source, dest)
+
+
+def _unlink_quietly(path: Path) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
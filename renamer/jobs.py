@@ -0,0 +1,172 @@
+"""
+Modulo con la coda dei job in background della web app.
+
+Ogni job ha una cartella propria (input, output e job.json con lo stato).
+Lo stato sta su disco, quindi può essere letto da qualsiasi processo del
+server, non solo da quello che esegue il job.
+"""
+
+import json
+import logging
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+
+STATE_FILE = 'job.json'
+
+# Stati di un job
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_MAX_QUEUED = 16
+DEFAULT_JOB_TTL = 3600
+
+JOB_ID_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+class Job:
+    """Job in una cartella dedicata, con lo stato salvato in job.json."""
+
+    def __init__(self, job_id: str, directory: Path):
+        self.id = job_id
+        self.directory = directory
+        self.input_dir = directory / 'input'
+        self.output_dir = directory / 'output'
+        self._state = {
+            'id': job_id,
+            'status': QUEUED,
+            'stage': 'In coda',
+            'percent': 0,
+            'stats': None,
+            'error': None,
+            'created_at': time.time(),
+        }
+
+    def update(self, **changes) -> None:
+        """Aggiorna lo stato e lo riscrive su disco (in modo atomico)."""
+        self._state.update(changes)
+        self._state['updated_at'] = time.time()
+        tmp_path = self.directory / f"{STATE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path.write_text(json.dumps(self._state), encoding='utf-8')
+        os.replace(tmp_path, self.directory / STATE_FILE)
+
+    def progress(self, stage: str, done: int, total: int) -> None:
+        """Aggiorna la percentuale solo quando cambia (al più 100 scritture)."""
+        percent = min(100, done * 100 // total) if total else 100
+        if percent != self._state['percent'] or stage != self._state['stage']:
+            self.update(stage=stage, percent=percent)
+
+
+class JobManager:
+    """
+    Crea i job e li esegue su un pool di thread limitato.
+
+    I job oltre il numero di thread restano in coda; oltre `max_queued` job
+    non terminati la creazione viene rifiutata. Le cartelle dei job terminati
+    da più di `ttl` secondi vengono eliminate alla creazione di un nuovo job.
+    """
+
+    def __init__(self, root_dir: str, workers: int = DEFAULT_JOB_WORKERS,
+                 max_queued: int = DEFAULT_MAX_QUEUED, ttl: int = DEFAULT_JOB_TTL):
+        """
+        Args:
+            root_dir: Cartella che contiene le cartelle dei job
+            workers: Job eseguiti contemporaneamente
+            max_queued: Job non terminati (in coda o in esecuzione) ammessi
+            ttl: Secondi dopo i quali un job terminato viene eliminato
+        """
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def create(self) -> Job:
+        """
+        Crea un nuovo job (in coda) con le sue cartelle.
+
+        Raises:
+            RuntimeError: Se ci sono già troppi job non terminati
+        """
+        self.cleanup()
+        with self._lock:
+            if self._active >= self.max_queued:
+                raise RuntimeError("Troppi job in coda, riprova tra qualche minuto")
+            self._active += 1
+
+        job_id = secrets.token_urlsafe(16)
+        job = Job(job_id, self.root_dir / job_id)
+        job.input_dir.mkdir(parents=True)
+        job.output_dir.mkdir()
+        job.update()
+        return job
+
+    def start(self, job: Job, target: Callable[[Job], Optional[dict]]) -> None:
+        """
+        Esegue `target(job)` sul pool; il dizionario restituito diventa
+        job['stats']. Un'eccezione porta il job in stato FAILED.
+        """
+        self._executor.submit(self._run, job, target)
+
+    def discard(self, job: Job) -> None:
+        """Elimina un job creato ma mai avviato (es. upload non valido)."""
+        self._release()
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Stato del job (None se l'ID non è valido o il job non esiste)."""
+        directory = self.job_dir(job_id)
+        if directory is None:
+            return None
+        try:
+            return json.loads((directory / STATE_FILE).read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def job_dir(self, job_id: str) -> Optional[Path]:
+        """Cartella del job (None se l'ID non è valido o non esiste)."""
+        if not JOB_ID_RE.match(job_id):
+            return None
+        directory = self.root_dir / job_id
+        return directory if directory.is_dir() else None
+
+    def cleanup(self) -> None:
+        """Elimina le cartelle dei job terminati da più di `ttl` secondi."""
+        deadline = time.time() - self.ttl
+        with os.scandir(self.root_dir) as entries:
+            for entry in entries:
+                if not (entry.is_dir(follow_symlinks=False) and JOB_ID_RE.match(entry.name)):
+                    continue
+                state = self.get(entry.name)
+                finished = state is None or state['status'] in (DONE, FAILED)
+                if finished and entry.stat().st_mtime < deadline and \
+                        (state is None or state['updated_at'] < deadline):
+                    logging.info(f"Rimozione job scaduto: {entry.name}")
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _run(self, job: Job, target: Callable[[Job], Optional[dict]]) -> None:
+        try:
+            job.update(status=RUNNING)
+            stats = target(job)
+            job.update(status=DONE, stage='Completato', percent=100, stats=stats)
+        except Exception as e:
+            logging.error(f"Job {job.id} fallito: {str(e)}")
+            job.update(status=FAILED, error=str(e))
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        with self._lock:
+            self._active -= 1
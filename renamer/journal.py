@@ -0,0 +1,110 @@
+"""
+Modulo con il journal SQLite delle esecuzioni, per riprendere o aggiornare
+in modo incrementale una cartella di output.
+"""
+
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+
+JOURNAL_NAME = '.renamer-journal.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    source TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class JournalRecord(NamedTuple):
+    """Ultima operazione registrata per un file sorgente."""
+
+    source: str
+    size: int
+    mtime_ns: int
+    target: str
+    destination: str
+    mode: str
+
+
+class RunJournal:
+    """
+    Journal delle operazioni, salvato nella cartella di output.
+
+    Ogni operazione viene registrata (e resa persistente) prima di scrivere
+    il file di destinazione: se l'esecuzione si interrompe, alla ripresa lo
+    stesso sorgente riusa la stessa destinazione invece di generare un nuovo
+    nome con suffisso _N. Un'operazione è considerata completata se la
+    destinazione esiste e ha la stessa dimensione del sorgente registrato.
+    """
+
+    def __init__(self, output_dir: str, read_only: bool = False):
+        """
+        Args:
+            output_dir: Cartella di output che contiene il journal
+            read_only: Apre un journal esistente senza modificarlo (dry-run)
+        """
+        self.path = Path(output_dir) / JOURNAL_NAME
+        self.read_only = read_only
+
+        if read_only:
+            self._conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+        else:
+            # Autocommit: ogni registrazione è persistente appena eseguita;
+            # con WAL e synchronous=NORMAL il costo è di pochi microsecondi
+            self._conn = sqlite3.connect(str(self.path), isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(_SCHEMA)
+
+    @classmethod
+    def open_for_run(cls, output_dir: str, dry_run: bool) -> Optional['RunJournal']:
+        """Journal da usare per un'esecuzione (None in dry-run se non esiste ancora)."""
+        if dry_run:
+            if not (Path(output_dir) / JOURNAL_NAME).exists():
+                return None
+            return cls(output_dir, read_only=True)
+        return cls(output_dir)
+
+    def lookup(self, source: str) -> Optional[JournalRecord]:
+        """Ultima operazione registrata per il sorgente (percorso assoluto)."""
+        row = self._conn.execute(
+            "SELECT source, size, mtime_ns, target, destination, mode FROM operations WHERE source = ?",
+            (source,)
+        ).fetchone()
+        return JournalRecord(*row) if row else None
+
+    def record(self, source: str, size: int, mtime_ns: int, target: str,
+               destination: str, mode: str) -> None:
+        """Registra l'operazione che sta per essere eseguita."""
+        if self.read_only:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO operations VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source, size, mtime_ns, target, destination, mode, time.time())
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def is_completed(record: JournalRecord, size: int, mtime_ns: int, target: str) -> bool:
+    """
+    True se il sorgente e la voce di mapping non sono cambiati e la
+    destinazione registrata è completa.
+    """
+    if record.size != size or record.mtime_ns != mtime_ns or record.target != target:
+        return False
+    try:
+        return os.stat(record.destination).st_size == size
+    except OSError:
+        return False
@@ -0,0 +1,186 @@
+"""
+Modulo con gli strumenti di log per le esecuzioni su molti file: log dei
+singoli file completo o riassuntivo, handler eseguiti fuori dal ciclo
+principale (coda) e barra di avanzamento a frequenza limitata.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Optional, Set, TextIO
+
+from .report import FileOperation
+
+
+# Avvisi "codice non trovato" mostrati in modalità quiet prima di riassumere
+DEFAULT_MAX_WARNINGS = 20
+
+# Aggiornamenti al secondo della barra (terminale) e intervallo delle righe
+# di avanzamento quando l'output non è un terminale (log di un container)
+PROGRESS_INTERVAL = 0.2
+PROGRESS_LOG_INTERVAL = 10.0
+
+
+class FileEventLog:
+    """
+    Log degli esiti dei singoli file (e, se richiesto, delle operazioni
+    eseguite in un file JSONL, una per riga, invece che in memoria).
+
+    In modalità completa ogni file produce una riga, come sempre. In modalità
+    quiet le righe dei file rinominati non vengono nemmeno formattate e gli
+    avvisi sui codici non trovati sono deduplicati e limitati: dopo
+    `max_warnings` codici diversi vengono solo contati (vedi summary).
+    """
+
+    def __init__(self, quiet: bool = False, max_warnings: Optional[int] = None,
+                 operations_log: Optional[str] = None):
+        """
+        Args:
+            quiet: Se True registra solo avvisi campionati, errori e riepilogo
+            max_warnings: Codici non trovati da mostrare (None = tutti senza
+                quiet, DEFAULT_MAX_WARNINGS con quiet)
+            operations_log: File JSONL in cui scrivere le operazioni eseguite
+                (vedi RunReport.write_json)
+        """
+        self.quiet = quiet
+        if max_warnings is None and quiet:
+            max_warnings = DEFAULT_MAX_WARNINGS
+        self.max_warnings = max_warnings
+        self.suppressed = 0
+        self._shown: Set[str] = set()
+        # Deciso una volta sola: nel ciclo principale basta un confronto
+        self.file_lines = not quiet and logging.getLogger().isEnabledFor(logging.INFO)
+        self.debug_lines = logging.getLogger().isEnabledFor(logging.DEBUG)
+        self._operations = open(operations_log, 'w', encoding='utf-8') if operations_log else None
+
+    def operation(self, operation: FileOperation) -> None:
+        """Scrive un'operazione eseguita nel log delle operazioni, se presente."""
+        if self._operations is not None:
+            self._operations.write(json.dumps(operation._asdict()) + '\n')
+
+    def missing_code(self, code: str) -> None:
+        """Avviso per un'immagine il cui codice non è nella mappa."""
+        if self.max_warnings is None:
+            logging.warning(f"Codice non trovato nella mappa: {code}")
+        elif code in self._shown:
+            # Stesso codice in un'altra cartella: già segnalato
+            pass
+        elif len(self._shown) < self.max_warnings:
+            self._shown.add(code)
+            logging.warning(f"Codice non trovato nella mappa: {code}")
+        else:
+            self.suppressed += 1
+
+    def summary(self) -> None:
+        """Riepiloga gli avvisi non mostrati."""
+        if self.suppressed:
+            logging.warning(f"Altri {self.suppressed} file con codice non trovato nella mappa "
+                            f"(mostrati i primi {len(self._shown)} codici)")
+
+    def close(self) -> None:
+        """Chiude il log delle operazioni."""
+        if self._operations is not None:
+            self._operations.close()
+            self._operations = None
+
+
+def start_queue_logging() -> logging.handlers.QueueListener:
+    """
+    Sposta gli handler del root logger su un thread dedicato: il root logger
+    si limita a mettere i record in coda, la formattazione e la scrittura
+    (anche su stdout rediretto in una pipe) avvengono fuori dal ciclo
+    principale. Chiamare stop_queue_logging alla fine per svuotare la coda.
+
+    Returns:
+        Il QueueListener avviato
+    """
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    records: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_queue_logging(listener: logging.handlers.QueueListener) -> None:
+    """Svuota la coda e ripristina gli handler originali sul root logger."""
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
+class ProgressBar:
+    """
+    Barra di avanzamento con file/s e tempo stimato, ridisegnata al massimo
+    ogni PROGRESS_INTERVAL secondi. Se lo stream non è un terminale scrive
+    una riga ogni PROGRESS_LOG_INTERVAL secondi.
+    """
+
+    def __init__(self, total: Optional[int] = None, stream: TextIO = sys.stderr, width: int = 30):
+        """
+        Args:
+            total: File previsti (None = sconosciuto, senza percentuale né ETA)
+            stream: Dove scrivere
+            width: Larghezza della barra in caratteri
+        """
+        self.total = total
+        self.stream = stream
+        self.width = width
+        self.interactive = stream.isatty()
+        self.interval = PROGRESS_INTERVAL if self.interactive else PROGRESS_LOG_INTERVAL
+        self.started = time.monotonic()
+        self._next_draw = self.started + self.interval
+        self._done = 0
+
+    def __call__(self, done: int) -> None:
+        """Aggiorna il conteggio (compatibile con il parametro progress di process_images)."""
+        self._done = done
+        now = time.monotonic()
+        if now >= self._next_draw:
+            self._next_draw = now + self.interval
+            self._draw(now)
+
+    def close(self) -> None:
+        """Disegna lo stato finale."""
+        self._draw(time.monotonic(), final=True)
+
+    def _draw(self, now: float, final: bool = False) -> None:
+        elapsed = max(now - self.started, 1e-9)
+        rate = self._done / elapsed
+        parts = []
+        if self.total:
+            fraction = min(1.0, self._done / self.total)
+            filled = int(fraction * self.width)
+            parts.append(f"[{'#' * filled}{'.' * (self.width - filled)}] {fraction:6.1%}")
+            parts.append(f"{self._done}/{self.total}")
+        else:
+            parts.append(f"{self._done} file")
+        parts.append(f"{rate:,.0f} file/s")
+        if final:
+            parts.append(f"in {_format_seconds(elapsed)}")
+        elif self.total and rate > 0:
+            parts.append(f"ETA {_format_seconds(max(0, self.total - self._done) / rate)}")
+        line = '  '.join(parts)
+
+        if self.interactive:
+            self.stream.write(f"\r{line}\033[K" + ("\n" if final else ""))
+        else:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
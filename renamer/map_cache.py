@@ -0,0 +1,264 @@
+"""
+Modulo per la cache su disco delle mappe già costruite.
+
+Ogni voce è identificata dall'hash del contenuto del file di mapping (più le
+opzioni di lettura) e contiene la mappa bidirezionale insieme al report delle
+righe duplicate, così una lettura dalla cache produce gli stessi warning di
+una costruzione completa.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Optional, Set
+
+from .csv_map import load_map_auto
+from .mapping import MapResult, log_map_result
+
+
+# Versione del formato: cambiandola le voci esistenti vengono ignorate
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+ENTRY_SUFFIX = '.pickle'
+
+
+def default_cache_dir() -> Path:
+    """Cartella della cache: $IMAGE_RENAMER_CACHE_DIR oppure ~/.cache/image-renamer."""
+    env_dir = os.environ.get('IMAGE_RENAMER_CACHE_DIR')
+    if env_dir:
+        return Path(env_dir)
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'image-renamer'
+
+
+def file_digest(path: str) -> str:
+    """Hash BLAKE2b (128 bit) del contenuto del file."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MapCache:
+    """
+    Cache delle mappe compilate, limitata in dimensione (eviction LRU).
+
+    Le voci sono file pickle nominati con hash del contenuto e opzioni di
+    lettura. Per evitare di ricalcolare l'hash a ogni esecuzione, per ogni
+    percorso viene ricordata la coppia (dimensione, mtime) già verificata;
+    queste impronte vengono rimosse insieme alle voci a cui puntano.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.max_bytes = max_bytes
+        self._entries_dir = self.cache_dir / 'maps'
+        self._stats_dir = self.cache_dir / 'stats'
+        # Letture riuscite e mancate di questa istanza (per le metriche)
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, path: str, fast_check: bool = True) -> str:
+        """
+        Restituisce l'hash del contenuto del file.
+
+        Args:
+            path: Percorso al file di mapping
+            fast_check: Se True riusa l'hash già calcolato quando dimensione
+                e mtime del file non sono cambiati
+
+        Returns:
+            Hash esadecimale del contenuto
+        """
+        stat = os.stat(path)
+        record_path = self._stats_dir / f"{_path_key(path)}.json"
+
+        if fast_check:
+            try:
+                record = json.loads(record_path.read_text())
+                if record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+                    return record['digest']
+            except (OSError, ValueError, KeyError):
+                pass
+
+        digest = file_digest(path)
+
+        if fast_check:
+            record = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+            try:
+                _atomic_write(record_path, json.dumps(record).encode())
+            except OSError as e:
+                logging.debug(f"Impossibile salvare l'impronta di {path}: {e}")
+
+        return digest
+
+    def get(self, key: str) -> Optional[MapResult]:
+        """Legge una voce dalla cache (None se assente o illeggibile)."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                version, payload = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logging.warning(f"Voce di cache non valida, verrà ricostruita: {entry_path.name} ({e})")
+            _remove(entry_path)
+            self.misses += 1
+            return None
+
+        if version != CACHE_FORMAT_VERSION:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        # Aggiorna l'mtime: l'eviction rimuove per prime le voci meno usate
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return MapResult(*payload)
+
+    def put(self, key: str, result: MapResult) -> None:
+        """Salva una voce nella cache e applica il limite di dimensione."""
+        data = pickle.dumps((CACHE_FORMAT_VERSION, tuple(result)), protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            _atomic_write(self._entry_path(key), data)
+        except OSError as e:
+            logging.warning(f"Impossibile scrivere la cache delle mappe: {e}")
+            return
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Rimuove le voci usate meno di recente finché la cache supera max_bytes,
+        poi le impronte dei percorsi (stats/) il cui contenuto non ha più voci.
+        
+        Returns:
+            Numero di voci rimosse
+        """
+        try:
+            entries = [(entry.stat(), entry) for entry in self._entries_dir.glob(f"*{ENTRY_SUFFIX}")]
+        except OSError:
+            return 0
+
+        total = sum(stat.st_size for stat, _ in entries)
+        removed = 0
+        kept = set()
+        for stat, entry in sorted(entries, key=lambda item: item[0].st_mtime):
+            if total > self.max_bytes:
+                _remove(entry)
+                total -= stat.st_size
+                removed += 1
+            else:
+                kept.add(entry.name.split('-', 1)[0])
+
+        if removed:
+            logging.info(f"Cache mappe: rimosse {removed} voci meno recenti")
+        self._prune_stats(kept)
+        return removed
+
+    def _prune_stats(self, digests: Set[str]) -> None:
+        """
+        Rimuove le impronte che non puntano a nessuno dei `digests` in cache:
+        senza, stats/ crescerebbe di un file per ogni percorso mai letto. Al
+        più costa un hash in più a chi sta costruendo una mappa non ancora salvata.
+        """
+        try:
+            records = list(self._stats_dir.glob('*.json'))
+        except OSError:
+            return
+        removed = 0
+        for record_path in records:
+            try:
+                digest = json.loads(record_path.read_text())['digest']
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError, KeyError):
+                digest = None
+            if digest not in digests:
+                _remove(record_path)
+                removed += 1
+        if removed:
+            logging.debug(f"Cache mappe: rimosse {removed} impronte senza voci")
+
+    def _entry_path(self, key: str) -> Path:
+        return self._entries_dir / f"{key}{ENTRY_SUFFIX}"
+
+
+def load_map_cached(file_path: str, streaming: bool = False, use_cache: bool = True,
+                    rebuild: bool = False, cache: Optional[MapCache] = None,
+                    fast_check: bool = True) -> MapResult:
+    """
+    Come csv_map.load_map_auto, ma riusa la mappa salvata in cache se il
+    contenuto del file non è cambiato.
+
+    Args:
+        file_path: Percorso al file di mapping (CSV o Excel)
+        streaming: Lettura in streaming dei file .xlsx
+        use_cache: Se False la cache non viene né letta né scritta
+        rebuild: Se True ricostruisce la mappa e sovrascrive la voce in cache
+        cache: Istanza di MapCache (default: cartella di default_cache_dir)
+        fast_check: Riusa l'hash se dimensione e mtime del file non cambiano
+
+    Returns:
+        MapResult con mappa bidirezionale e righe duplicate
+    """
+    if not use_cache:
+        return load_map_auto(file_path, streaming=streaming)
+
+    if not os.path.exists(file_path):
+        # Lascia al loader il messaggio di errore specifico del formato
+        return load_map_auto(file_path, streaming=streaming)
+
+    cache = cache or MapCache()
+    extension = file_path.lower().rsplit('.', 1)[-1]
+
+    try:
+        digest = cache.fingerprint(file_path, fast_check=fast_check)
+    except OSError as e:
+        logging.warning(f"Cache mappe non disponibile: {e}")
+        return load_map_auto(file_path, streaming=streaming)
+
+    read_mode = 'stream' if streaming and extension == 'xlsx' else 'full'
+    key = f"{digest}-{extension}-{read_mode}"
+
+    if not rebuild:
+        result = cache.get(key)
+        if result is not None:
+            logging.info(f"Mappa caricata dalla cache ({key})")
+            log_map_result(result)
+            return result
+
+    result = load_map_auto(file_path, streaming=streaming)
+    cache.put(key, result)
+    return result
+
+
+def _path_key(path: str) -> str:
+    return hashlib.blake2b(os.path.abspath(path).encode(), digest_size=16).hexdigest()
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Scrive su file temporaneo e rinomina: i lettori non vedono file parziali."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
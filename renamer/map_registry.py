@@ -0,0 +1,219 @@
+"""
+Modulo con il registro delle mappe caricate nella web app.
+
+Ogni file di mapping viene salvato una sola volta con l'hash del contenuto
+come ID: ricaricare lo stesso catalogo restituisce lo stesso ID senza
+rileggerlo. Le mappe compilate restano in una cache LRU in memoria, limitata
+in byte e condivisa da tutto il processo; la cache su disco (MapCache) le
+rende disponibili anche dopo un riavvio.
+
+Con compact=True ogni mappa viene salvata accanto al file di mapping come
+CompactMap (<id>.bimap) e aperta in mmap: tutti i processi del server
+condividono le stesse pagine invece di tenere ognuno il proprio dizionario.
+"""
+
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Mapping, Optional, Tuple
+
+from .compact_map import CompactMap
+from .map_cache import MapCache, file_digest, load_map_cached
+
+
+MAPPING_EXTS = ('.csv', '.xlsx', '.xls')
+COMPACT_EXT = '.bimap'
+MAPPING_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+
+
+def estimate_map_bytes(mapping: Mapping[str, str]) -> int:
+    """Stima della memoria occupata da una mappa (dizionario più stringhe, o array compatti)."""
+    if isinstance(mapping, CompactMap):
+        return mapping.nbytes
+    # Mappa bidirezionale: ogni valore è anche una chiave (lo stesso oggetto),
+    # quindi le stringhe vanno contate una volta sola
+    return sys.getsizeof(mapping) + sum(sys.getsizeof(key) for key in mapping)
+
+
+class MappingRegistry:
+    """
+    Registro delle mappe identificate dall'hash del contenuto. È thread-safe.
+    """
+
+    def __init__(self, root_dir: str, max_memory_bytes: int = DEFAULT_MEMORY_BYTES,
+                 persist: bool = True, cache: Optional[MapCache] = None, compact: bool = True):
+        """
+        Args:
+            root_dir: Cartella dove vengono salvati i file di mapping
+            max_memory_bytes: Memoria massima delle mappe tenute in LRU
+            persist: Se True le mappe compilate vengono salvate anche nella
+                cache su disco (MapCache)
+            cache: Istanza di MapCache (default: cartella di default_cache_dir)
+            compact: Se True le mappe sono CompactMap aperte in mmap
+                (condivise tra processi) invece di dizionari
+        """
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.max_memory_bytes = max_memory_bytes
+        self.persist = persist
+        self.cache = cache or (MapCache() if persist else None)
+        self.compact = compact
+        # Richieste servite dalla LRU e richieste che hanno dovuto caricarla
+        self.hits = 0
+        self.misses = 0
+        self._maps: 'OrderedDict[str, Tuple[Mapping[str, str], int]]' = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def register_file(self, path: str, move: bool = False) -> str:
+        """
+        Registra un file di mapping e ne compila la mappa.
+
+        Args:
+            path: File CSV o Excel
+            move: Se True il file viene spostato nel registro invece che copiato
+
+        Returns:
+            ID della mappa (hash del contenuto)
+
+        Raises:
+            ValueError: Se il formato non è supportato o il file non è valido
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in MAPPING_EXTS:
+            raise ValueError(f"Formato file non supportato: {extension}. "
+                             f"Usa uno tra: {', '.join(MAPPING_EXTS)}")
+
+        mapping_id = file_digest(path)
+        stored_path = self.root_dir / f"{mapping_id}{extension}"
+        if stored_path.exists():
+            logging.info(f"Mappa già registrata: {mapping_id}")
+            if move:
+                os.remove(path)
+        else:
+            tmp_path = self.root_dir / f".{mapping_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if move:
+                shutil.move(path, tmp_path)
+            else:
+                shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, stored_path)
+
+        try:
+            self.get(mapping_id)
+        except Exception:
+            # Un file non valido non resta nel registro
+            self._discard(mapping_id, stored_path)
+            raise
+        return mapping_id
+
+    def get(self, mapping_id: str) -> Mapping[str, str]:
+        """
+        Mappa bidirezionale con l'ID dato (dalla LRU, dal file compatto, dalla
+        cache su disco o ricostruita dal file salvato).
+
+        Raises:
+            KeyError: Se l'ID non è registrato
+        """
+        with self._lock:
+            cached = self._maps.get(mapping_id)
+            if cached is not None:
+                self._maps.move_to_end(mapping_id)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        stored_path = self.stored_path(mapping_id)
+        if stored_path is None:
+            raise KeyError(mapping_id)
+
+        compact_path = self.root_dir / f"{mapping_id}{COMPACT_EXT}"
+        if self.compact and compact_path.exists():
+            mapping = CompactMap.load(str(compact_path))
+            self._remember(mapping_id, mapping)
+            return mapping
+
+        # Il file salvato non cambia mai (il nome è l'hash del contenuto):
+        # il controllo rapido su dimensione e mtime è sufficiente
+        mapping = load_map_cached(str(stored_path), use_cache=self.persist,
+                                  cache=self.cache, fast_check=True).mapping
+        if self.compact:
+            CompactMap.from_dict(mapping).save(str(compact_path))
+            mapping = CompactMap.load(str(compact_path))
+        self._remember(mapping_id, mapping)
+        return mapping
+
+    def preload(self, limit: int) -> int:
+        """
+        Carica in memoria le mappe registrate più di recente, finché c'è
+        posto nella LRU. Chiamata prima del fork dei processi del server,
+        le mappe caricate sono condivise da tutti i worker.
+
+        Args:
+            limit: Numero massimo di mappe da caricare
+
+        Returns:
+            Numero di mappe caricate
+        """
+        stored = sorted((path for path in self.root_dir.iterdir()
+                         if path.suffix in MAPPING_EXTS and MAPPING_ID_RE.match(path.stem)),
+                        key=lambda path: path.stat().st_mtime, reverse=True)
+        loaded = 0
+        for path in stored[:limit]:
+            try:
+                self.get(path.stem)
+            except Exception as e:
+                logging.warning(f"Mappa {path.stem} non precaricata: {e}")
+                continue
+            loaded += 1
+            if self._memory_bytes >= self.max_memory_bytes:
+                break
+        return loaded
+
+    def __contains__(self, mapping_id: str) -> bool:
+        return mapping_id in self._maps or self.stored_path(mapping_id) is not None
+
+    def stored_path(self, mapping_id: str) -> Optional[Path]:
+        """File di mapping salvato per l'ID (None se non registrato)."""
+        if not MAPPING_ID_RE.match(mapping_id):
+            return None
+        for extension in MAPPING_EXTS:
+            path = self.root_dir / f"{mapping_id}{extension}"
+            if path.exists():
+                return path
+        return None
+
+    def info(self, mapping_id: str) -> dict:
+        """Descrizione della mappa, in forma serializzabile in JSON."""
+        mapping = self.get(mapping_id)
+        return {'mapping_id': mapping_id, 'pairs': len(mapping) // 2}
+
+    def _remember(self, mapping_id: str, mapping: Mapping[str, str]) -> None:
+        size = estimate_map_bytes(mapping)
+        with self._lock:
+            if mapping_id in self._maps:
+                return
+            self._maps[mapping_id] = (mapping, size)
+            self._memory_bytes += size
+            # Rimuove le mappe usate meno di recente (tiene sempre l'ultima)
+            while self._memory_bytes > self.max_memory_bytes and len(self._maps) > 1:
+                evicted_id, (_, evicted_size) = self._maps.popitem(last=False)
+                self._memory_bytes -= evicted_size
+                logging.debug(f"Mappa rimossa dalla memoria: {evicted_id}")
+
+    def _discard(self, mapping_id: str, stored_path: Path) -> None:
+        with self._lock:
+            entry = self._maps.pop(mapping_id, None)
+            if entry is not None:
+                self._memory_bytes -= entry[1]
+        for path in (stored_path, self.root_dir / f"{mapping_id}{COMPACT_EXT}"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
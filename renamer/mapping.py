@@ -0,0 +1,226 @@
+"""
+Modulo per costruire la mappa bidirezionale a partire da due colonne di codici.
+
+Usato sia da excel_map che da csv_map: lavora su colonne intere (o blocchi di
+righe) invece di scorrere il DataFrame riga per riga. numpy e pandas vengono
+importati solo da MapBuilder.add: la lettura dei CSV (MapBuilder.add_rows)
+non li carica.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+
+# Numero massimo di righe duplicate elencate nel warning di riepilogo
+MAX_LOGGED_DUPLICATES = 50
+
+
+class DuplicateRow(NamedTuple):
+    """Riga scartata durante la costruzione della mappa."""
+
+    row: int
+    code_a: str
+    code_b: str
+    reason: str
+
+    def __str__(self) -> str:
+        return f"{self.code_a} <-> {self.code_b}"
+
+
+class MapResult(NamedTuple):
+    """Mappa bidirezionale e report delle righe scartate."""
+
+    mapping: Dict[str, str]
+    duplicates: List[DuplicateRow]
+    # Formato del file sorgente (csv_map.CsvDialect per i CSV, None per Excel)
+    dialect: Optional[Any] = None
+
+
+# Motivi di scarto riportati in DuplicateRow.reason
+REASON_DUPLICATE = 'duplicate'        # la stessa coppia è già presente
+REASON_CONFLICT = 'conflict'          # un codice è già associato a un altro
+REASON_CROSS_COLUMN = 'cross_column'  # il codice compare già nell'altra colonna
+
+
+class MapBuilder:
+    """
+    Costruisce la mappa bidirezionale a blocchi di righe.
+
+    Le righe vengono valutate nello stesso ordine del file: una riga viene
+    scartata se uno dei due codici appartiene già a una riga accettata in
+    precedenza. Le righe "pulite" (entrambi i codici mai visti prima) vengono
+    inserite in blocco; solo le righe sospette passano dal controllo puntuale.
+    """
+
+    def __init__(self):
+        self.mapping: Dict[str, str] = {}
+        self.duplicates: List[DuplicateRow] = []
+        self._codes_a = set()
+        self._next_row = 0
+
+    def add(self, codes_a: Iterable, codes_b: Iterable) -> None:
+        """
+        Aggiunge un blocco di righe alla mappa.
+
+        Args:
+            codes_a: Valori della prima colonna (Series, array o lista)
+            codes_b: Valori della seconda colonna, allineati a codes_a
+        """
+        import numpy as np
+        import pandas as pd
+
+        series_a = codes_a if isinstance(codes_a, pd.Series) else pd.Series(list(codes_a), dtype=object)
+        series_b = codes_b if isinstance(codes_b, pd.Series) else pd.Series(list(codes_b), dtype=object)
+        if len(series_a) != len(series_b):
+            raise ValueError("Le due colonne di codici hanno lunghezze diverse")
+
+        if not isinstance(codes_a, pd.Series):
+            index = pd.RangeIndex(self._next_row, self._next_row + len(series_a))
+            series_a.index = index
+            series_b.index = index
+        self._next_row += len(series_a)
+
+        # Scarta le righe con valori mancanti
+        valid = series_a.notna().to_numpy() & series_b.notna().to_numpy()
+        rows = series_a.index.to_numpy()[valid]
+        a = _normalize(series_a[valid])
+        b = _normalize(series_b[valid])
+        n = len(a)
+        if n == 0:
+            return
+
+        # Prima occorrenza di ogni codice nella sequenza a0, b0, a1, b1, ...
+        interleaved = np.empty(2 * n, dtype=object)
+        interleaved[0::2] = a
+        interleaved[1::2] = b
+        seen = pd.Series(interleaved).duplicated().to_numpy().copy()
+        if self.mapping:
+            seen |= np.fromiter(map(self.mapping.__contains__, interleaved), dtype=bool, count=2 * n)
+
+        # Una riga con codice uguale nelle due colonne non è un duplicato di sé stessa
+        suspect = seen[0::2] | (seen[1::2] & (a != b))
+
+        # Le righe pulite non condividono codici con nessuna riga precedente,
+        # quindi possono essere inserite prima di valutare quelle sospette.
+        clean = ~suspect
+        clean_a = a[clean]
+        clean_b = b[clean]
+        self.mapping.update(zip(clean_a, clean_b))
+        self.mapping.update(zip(clean_b, clean_a))
+        self._codes_a.update(clean_a)
+
+        for i in np.flatnonzero(suspect):
+            self._add_row(int(rows[i]), a[i], b[i])
+
+    def add_rows(self, rows: Iterable[Tuple[Optional[str], Optional[str]]]) -> None:
+        """
+        Aggiunge righe (codice A, codice B) una alla volta, senza numpy né
+        pandas; il risultato è lo stesso di add. Le righe con un valore
+        mancante (None) vengono saltate ma contano nella numerazione.
+
+        Args:
+            rows: Coppie di stringhe, nell'ordine del file
+        """
+        mapping = self.mapping
+        codes_a = self._codes_a
+        row = self._next_row - 1
+        for row, (code_a, code_b) in enumerate(rows, start=self._next_row):
+            if code_a is None or code_b is None:
+                continue
+            code_a = code_a.strip()
+            code_b = code_b.strip()
+            if code_a in mapping or code_b in mapping:
+                self._add_row(row, code_a, code_b)
+            else:
+                mapping[code_a] = code_b
+                mapping[code_b] = code_a
+                codes_a.add(code_a)
+        self._next_row = row + 1
+
+    def _add_row(self, row: int, code_a: str, code_b: str) -> None:
+        """Valuta una singola riga sospetta rispettando l'ordine del file."""
+        mapping = self.mapping
+        if code_a in mapping or code_b in mapping:
+            if mapping.get(code_a) == code_b or mapping.get(code_b) == code_a:
+                reason = REASON_DUPLICATE
+            elif (code_a in mapping and code_a not in self._codes_a) or code_b in self._codes_a:
+                reason = REASON_CROSS_COLUMN
+            else:
+                reason = REASON_CONFLICT
+            self.duplicates.append(DuplicateRow(row, code_a, code_b, reason))
+            return
+
+        mapping[code_a] = code_b
+        mapping[code_b] = code_a
+        self._codes_a.add(code_a)
+
+    def result(self) -> MapResult:
+        """Restituisce la mappa costruita e le righe scartate."""
+        return MapResult(self.mapping, self.duplicates)
+
+
+def _normalize(values: 'pd.Series') -> 'np.ndarray':
+    """
+    Converte i codici in stringhe senza spazi iniziali/finali. I numeri
+    interi letti come float (colonna numerica con celle vuote in read_excel,
+    o 123.0 in una colonna mista) diventano '123', come le celle intere.
+    """
+    if values.dtype.kind == 'f':
+        text = values.astype(str)
+        integral = (values % 1 == 0).to_numpy()
+        text[integral] = values[integral].astype('int64').astype(str)
+    elif values.dtype == object:
+        text = values.map(_code_text)
+    else:
+        text = values.astype(str)
+    return text.str.strip().to_numpy(dtype=object)
+
+
+def _code_text(value: Any) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def build_bidirectional_map(codes_a: Iterable, codes_b: Iterable) -> MapResult:
+    """
+    Costruisce la mappa bidirezionale da due colonne di codici.
+
+    Args:
+        codes_a: Codici della prima colonna
+        codes_b: Codici della seconda colonna
+
+    Returns:
+        MapResult con la mappa {A: B, B: A} e le righe duplicate scartate
+    """
+    builder = MapBuilder()
+    builder.add(codes_a, codes_b)
+    return builder.result()
+
+
+def log_map_result(result: MapResult, limit: Optional[int] = MAX_LOGGED_DUPLICATES) -> None:
+    """
+    Registra nel log le righe duplicate e il riepilogo della mappa.
+
+    Args:
+        result: Risultato di build_bidirectional_map o MapBuilder
+        limit: Numero massimo di righe duplicate elencate (None = tutte)
+    """
+    duplicates = result.duplicates
+    if duplicates:
+        shown = duplicates if limit is None else duplicates[:limit]
+        listed = [str(dup) for dup in shown]
+        if len(duplicates) > len(shown):
+            listed.append(f"... (+{len(duplicates) - len(shown)} altre)")
+        logging.warning(f"Righe duplicate ignorate: {listed}")
+
+        counts: Dict[str, int] = {}
+        for dup in duplicates:
+            counts[dup.reason] = counts.get(dup.reason, 0) + 1
+        logging.warning(f"Riepilogo righe scartate: {counts}")
+
+    logging.info(f"Mappa costruita con successo: {len(result.mapping)//2} coppie di codici")
@@ -0,0 +1,316 @@
+"""
+Modulo con le metriche della web app in formato testo Prometheus.
+
+Contatori, gauge e istogrammi con etichette, senza dipendenze esterne.
+
+Con più processi (worker gunicorn) ogni scrape arriva a un worker a caso:
+con `multiprocess_dir` ogni processo salva periodicamente i propri valori in
+<dir>/<pid>.json e l'export somma i file di tutti i processi, quindi ogni
+worker risponde con i totali del server. I file dei processi terminati
+restano: i contatori non tornano indietro quando un worker viene sostituito
+(i gauge contano solo i processi vivi).
+"""
+
+import abc
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# Secondi: dalle richieste di stato (millisecondi) ai job (minuti)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 300.0, 900.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+# Funzione che legge i valori al momento dell'export: {valori etichette: valore}
+Collector = Callable[[], Dict[LabelValues, float]]
+
+# Secondi tra due salvataggi dei valori di un processo (multiprocess_dir)
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class _Metric(abc.ABC):
+    """Base comune: nome, descrizione, etichette e lock."""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Etichette non valide per {self.name}: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self, snapshot: Optional[list] = None) -> List[str]:
+        """Righe della metrica, dai valori del processo o da uno snapshot (vedi merge)."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(self.snapshot() if snapshot is None else snapshot))
+        return lines
+
+    @abc.abstractmethod
+    def snapshot(self) -> list:
+        """Valori correnti del processo, in forma serializzabile in JSON."""
+
+    @abc.abstractmethod
+    def merge(self, snapshots: Iterable[Tuple[list, bool]]) -> list:
+        """Combina gli snapshot di più processi: coppie (snapshot, processo vivo)."""
+
+    @abc.abstractmethod
+    def _samples(self, snapshot: list) -> List[str]:
+        """Righe dei campioni di uno snapshot, in formato testo Prometheus."""
+
+
+class _Value(_Metric):
+    """Un valore per combinazione di etichette, aggiornato o letto da un collector."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 collector: Optional[Collector] = None):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._collector = collector
+
+    def snapshot(self) -> list:
+        if self._collector is not None:
+            values = self._collector()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return sorted([list(key), value] for key, value in values.items())
+
+    def merge(self, snapshots: Iterable[Tuple[list, bool]]) -> list:
+        totals: Dict[LabelValues, float] = {}
+        for snapshot, _ in snapshots:
+            for key, value in snapshot:
+                totals[tuple(key)] = totals.get(tuple(key), 0.0) + value
+        return sorted([list(key), value] for key, value in totals.items())
+
+    def _samples(self, snapshot: list) -> List[str]:
+        return [f"{self.name}{self._format_labels(tuple(key))} {_number(value)}"
+                for key, value in snapshot]
+
+
+class Counter(_Value):
+    """Contatore monotono."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError(f"Un contatore non può diminuire: {self.name}")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Value):
+    """Valore istantaneo."""
+
+    kind = 'gauge'
+
+    def merge(self, snapshots: Iterable[Tuple[list, bool]]) -> list:
+        # Il valore di un processo terminato non è più attuale
+        return super().merge((snapshot, alive) for snapshot, alive in snapshots if alive)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Istogramma cumulativo (bucket, somma e conteggio) per combinazione di etichette."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per etichette: conteggi per bucket (non cumulativi), somma, conteggio
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return sorted([list(key), list(counts), total, count]
+                          for key, (counts, total, count) in self._values.items())
+
+    def merge(self, snapshots: Iterable[Tuple[list, bool]]) -> list:
+        totals: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+        for snapshot, _ in snapshots:
+            for key, counts, total, count in snapshot:
+                merged = totals.get(tuple(key))
+                if merged is not None:
+                    counts = [a + b for a, b in zip(merged[0], counts)]
+                    total, count = merged[1] + total, merged[2] + count
+                totals[tuple(key)] = (counts, total, count)
+        return sorted([list(key), counts, total, count]
+                      for key, (counts, total, count) in totals.items())
+
+    def _samples(self, snapshot: list) -> List[str]:
+        lines = []
+        for key, counts, total, count in snapshot:
+            key = tuple(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = ('le', '+Inf' if bound == math.inf else _number(bound))
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Insieme delle metriche esportate da un processo (o da tutti, con multiprocess_dir)."""
+
+    def __init__(self, multiprocess_dir: Optional[str] = None,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        """
+        Args:
+            multiprocess_dir: Cartella condivisa dai processi del server (vuota
+                all'avvio del server); None = solo i valori di questo processo
+            flush_interval: Secondi tra due salvataggi dei valori del processo
+        """
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        # Processo per cui è attivo il thread di salvataggio (i thread non
+        # sopravvivono al fork: ogni worker avvia il proprio)
+        self._flusher_pid: Optional[int] = None
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = (),
+                collector: Optional[Collector] = None) -> Counter:
+        return self._add(Counter(name, documentation, labels, collector))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (),
+              collector: Optional[Collector] = None) -> Gauge:
+        return self._add(Gauge(name, documentation, labels, collector))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """Tutte le metriche nel formato testo di Prometheus (versione 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        if not self.multiprocess_dir:
+            lines = []
+            for metric in metrics:
+                lines.extend(metric.render())
+            return '\n'.join(lines) + '\n'
+
+        self.flush()
+        processes = self._read_processes()
+        lines = []
+        for metric in metrics:
+            snapshots = [(values.get(metric.name, []), alive) for values, alive in processes]
+            lines.extend(metric.render(metric.merge(snapshots)))
+        return '\n'.join(lines) + '\n'
+
+    def start(self) -> None:
+        """
+        Avvia (una volta per processo) il salvataggio periodico dei valori
+        nella cartella condivisa. Da chiamare nei processi che aggiornano le
+        metriche, ad esempio a ogni richiesta: il costo è un confronto di pid.
+        """
+        pid = os.getpid()
+        if not self.multiprocess_dir or self._flusher_pid == pid:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def flush(self) -> None:
+        """Salva i valori del processo in <multiprocess_dir>/<pid>.json (in modo atomico)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        data = {metric.name: metric.snapshot() for metric in metrics}
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logging.warning(f"Metriche non salvate: {e}")
+
+    def _read_processes(self) -> List[Tuple[dict, bool]]:
+        """Valori salvati da ogni processo, con l'indicazione se è ancora vivo."""
+        processes = []
+        for name in os.listdir(self.multiprocess_dir):
+            stem, extension = os.path.splitext(name)
+            if extension != '.json' or not stem.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, name), encoding='utf-8') as f:
+                    processes.append((json.load(f), _alive(int(stem))))
+            except (OSError, ValueError):
+                continue
+        return processes
+
+    def _add(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Metrica già registrata: {metric.name}")
+            self._metrics.append(metric)
+        return metric
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Processo di un altro utente: esiste
+        pass
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
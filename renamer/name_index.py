@@ -0,0 +1,130 @@
+"""
+Modulo con l'indice in memoria dei nomi presenti nella cartella di output.
+"""
+
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+
+# Numero massimo di suffissi (_1, _2, ...) provati per lo stesso nome
+DEFAULT_MAX_CONFLICTS = 1000
+
+# Nome base e numero di una variante 'PRD001_3' (senza estensione)
+_SUFFIXED = re.compile(r'(.+)_(\d+)')
+
+
+class OutputNameIndex:
+    """
+    Assegna nomi di output senza conflitti senza interrogare il filesystem.
+
+    La cartella viene letta una sola volta alla creazione; da lì in poi i nomi
+    assegnati vengono registrati in memoria. Per ogni nome base si ricorda il
+    prossimo suffisso da provare, quindi anche molte immagini con lo stesso
+    codice target ricevono un nome in tempo costante. È thread-safe.
+    """
+
+    def __init__(self, directory: Path, max_conflicts: Optional[int] = DEFAULT_MAX_CONFLICTS,
+                 write_dir: Optional[Path] = None):
+        """
+        Args:
+            directory: Cartella di output (può non esistere ancora)
+            max_conflicts: Suffissi massimi per nome base (None o 0 = nessun limite)
+            write_dir: Cartella dei percorsi restituiti da reserve, se diversa
+                da `directory` (es. lo staging di uno shard)
+        """
+        self.directory = Path(directory)
+        self.write_dir = Path(write_dir) if write_dir is not None else self.directory
+        self.max_conflicts = max_conflicts or None
+        # Nomi trovati nella cartella e nomi assegnati durante l'esecuzione
+        self._existing: Set[str] = set()
+        self._names: Set[str] = set()
+        self._next_suffix: Dict[str, int] = {}
+        # Varianti _N presenti nella cartella per nome base (costruite alla
+        # prima richiesta di existing_variants)
+        self._variants: Optional[Dict[str, List[Tuple[int, str]]]] = None
+        self._lock = threading.Lock()
+
+        try:
+            with os.scandir(self.directory) as entries:
+                self._existing.update(entry.name for entry in entries)
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._existing or name in self._names
+
+    def __len__(self) -> int:
+        return len(self._existing) + len(self._names)
+
+    def existed(self, name: str) -> bool:
+        """True se `name` era già nella cartella prima dell'esecuzione."""
+        return name in self._existing
+
+    def existing_variants(self, name: str) -> List[str]:
+        """
+        Nomi che erano già nella cartella uguali a `name` o sue varianti _N
+        (es. 'PRD001.jpg', 'PRD001_1.jpg', 'PRD001_7.jpg'), in ordine di
+        suffisso; le varianti mancanti non interrompono la ricerca.
+        """
+        with self._lock:
+            if self._variants is None:
+                self._variants = {}
+                for existing in self._existing:
+                    stem, suffix = os.path.splitext(existing)
+                    match = _SUFFIXED.fullmatch(stem)
+                    if match:
+                        self._variants.setdefault(match.group(1) + suffix, []).append(
+                            (int(match.group(2)), existing))
+                for variants in self._variants.values():
+                    variants.sort()
+            names = [name] if name in self._existing else []
+            names.extend(variant for _, variant in self._variants.get(name, ())
+                         if variant in self._existing)
+            return names
+
+    def claim(self, name: str) -> None:
+        """Segna `name` come occupato (es. una destinazione già assegnata in precedenza)."""
+        with self._lock:
+            if name not in self._existing:
+                self._names.add(name)
+
+    def release(self, name: str) -> None:
+        """Libera `name` (es. un file rimosso dalla cartella), che può essere riassegnato."""
+        with self._lock:
+            self._existing.discard(name)
+            self._names.discard(name)
+
+    def reserve(self, name: str) -> Path:
+        """
+        Riserva un nome libero partendo da `name` (es. 'PRD001.jpg').
+
+        Se il nome è occupato prova 'PRD001_1.jpg', 'PRD001_2.jpg', ...
+
+        Returns:
+            Percorso completo del nome riservato
+
+        Raises:
+            RuntimeError: Se si supera il numero massimo di conflitti
+        """
+        with self._lock:
+            if name not in self:
+                self._names.add(name)
+                return self.write_dir / name
+
+            stem, suffix = os.path.splitext(name)
+            counter = self._next_suffix.get(name, 1)
+            while True:
+                if self.max_conflicts is not None and counter > self.max_conflicts:
+                    raise RuntimeError(f"Troppi conflitti di nome per: {name}")
+                candidate = f"{stem}_{counter}{suffix}"
+                counter += 1
+                if candidate not in self:
+                    break
+
+            self._next_suffix[name] = counter
+            self._names.add(candidate)
+            return self.write_dir / candidate
+
@@ -0,0 +1,223 @@
+"""
+Modulo con il formato dei piani di rinomina (file_ops.process_images con
+plan=PlanWriter, eseguiti poi da file_ops.apply_plan).
+
+Un piano è un file JSON Lines (compresso con gzip se il nome termina in
+.gz): una riga di intestazione con cartelle, modalità e file di mapping,
+una riga per immagine nell'ordine di scansione e una riga finale con i
+conteggi. Per ogni immagine mappata il piano riporta l'azione (la modalità
+di trasferimento, unchanged o skip), il nome target e la destinazione
+scelta (con l'eventuale suffisso _N). I percorsi sono relativi alla
+cartella di input (sorgenti) e di output (destinazioni), quindi il piano
+si può calcolare su una macchina e applicare su un'altra con le stesse
+cartelle montate altrove; due piani della stessa cartella si confrontano
+con un normale diff.
+
+Esempio:
+
+    {"format": "renamer-plan", "version": 1, "input_dir": "/data/in", ...}
+    {"action": "copy", "source": "IMG001.jpg", "target": "PRD001.jpg", "destination": "PRD001_1.jpg", ...}
+    {"action": "skip", "source": "foto-senza-codice.jpg"}
+    {"summary": {"processed": 1, "skipped": 1, "errors": 0, "unchanged": 0}}
+"""
+
+import gzip
+import json
+import os
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import IO, Iterator, NamedTuple, Optional
+
+from .report import RunReport
+from .scanner import ScanEntry
+
+
+PLAN_FORMAT = 'renamer-plan'
+PLAN_VERSION = 1
+
+# Azioni oltre alle modalità di trasferimento (file_ops.TRANSFER_MODES);
+# UNCHANGED ha lo stesso valore di file_ops.UNCHANGED
+SKIP = 'skip'
+UNCHANGED = 'unchanged'
+
+
+class PlanEntry(NamedTuple):
+    """Operazione di un piano, con i percorsi relativi alle cartelle del piano."""
+
+    action: str
+    source: str
+    target: Optional[str] = None
+    destination: Optional[str] = None
+    overwrite: bool = False
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+
+
+class PlanWriter:
+    """
+    Scrive un piano man mano che process_images decide le operazioni.
+
+    Il file viene scritto con un nome temporaneo e compare con il nome finale
+    solo con finish: un piano interrotto non è mai scambiato per completo.
+    """
+
+    def __init__(self, path: str, input_dir: str, output_dir: str, mode: str,
+                 mirror: bool = False, journal: bool = False,
+                 mapping_file: Optional[str] = None):
+        """
+        Args:
+            path: File del piano (.jsonl, o .jsonl.gz per comprimerlo)
+            input_dir: Cartella di input (base dei percorsi sorgente)
+            output_dir: Cartella di output (base dei percorsi di destinazione)
+            mode: Modalità di trasferimento prevista
+            mirror, journal: Opzioni dell'esecuzione, riportate nell'intestazione
+            mapping_file: File di mapping usato (solo informativo)
+        """
+        self.path = Path(path)
+        self.input_dir = os.path.abspath(input_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.mode = mode
+        self._tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = _open(self._tmp_path, 'wt', compressed=self.path.suffix == '.gz')
+        self._write({
+            'format': PLAN_FORMAT,
+            'version': PLAN_VERSION,
+            'created_at': time.time(),
+            'input_dir': self.input_dir,
+            'output_dir': self.output_dir,
+            'mode': mode,
+            'mirror': mirror,
+            'journal': journal,
+            'mapping': os.path.abspath(mapping_file) if mapping_file else None,
+        })
+
+    def add(self, entry: ScanEntry, dest_name: Optional[str], dest_path: Optional[Path],
+            overwrite: bool, outcome: Optional[Future]) -> None:
+        """
+        Registra l'esito della pianificazione di un'immagine (vedi file_ops._plan):
+        dest_name è il nome target, None per le immagini senza codice nella
+        mappa. Le immagini in errore non entrano nel piano: restano nel report.
+        """
+        if dest_name is None:
+            self._write({'action': SKIP, 'source': entry.relative_path})
+            return
+        if outcome is not None and outcome.exception() is not None:
+            return
+        line = {
+            'action': UNCHANGED if outcome is not None and outcome.result()[0] == UNCHANGED else self.mode,
+            'source': entry.relative_path,
+            'target': dest_name,
+            'destination': os.path.relpath(dest_path, self.output_dir).replace(os.sep, '/'),
+        }
+        if line['action'] != UNCHANGED:
+            if overwrite:
+                line['overwrite'] = True
+            stat = os.stat(entry.path)
+            line['size'] = stat.st_size
+            line['mtime_ns'] = stat.st_mtime_ns
+        self._write(line)
+
+    def finish(self, report: RunReport) -> Path:
+        """Scrive i conteggi finali e rende visibile il piano con il nome definitivo."""
+        processed, skipped, errors = report
+        self._write({'summary': {'processed': processed, 'skipped': skipped, 'errors': errors,
+                                 'unchanged': report.unchanged}})
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        """Scarta il piano incompleto."""
+        self._file.close()
+        try:
+            self._tmp_path.unlink()
+        except OSError:
+            pass
+
+    def _write(self, data: dict) -> None:
+        self._file.write(json.dumps(data, ensure_ascii=False, separators=(', ', ': ')) + '\n')
+
+
+class PlanReader:
+    """
+    Legge un piano: intestazione e conteggi finali all'apertura, le
+    operazioni in streaming iterando sull'oggetto.
+    """
+
+    def __init__(self, path: str):
+        """
+        Raises:
+            FileNotFoundError: Se il piano non esiste
+            ValueError: Se il file non è un piano valido e completo o la
+                versione non è supportata
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Piano non trovato: {path}")
+        self.path = path
+        self._compressed = path.endswith('.gz')
+        self._file: IO[str] = _open(Path(path), 'rt', self._compressed)
+        try:
+            header = json.loads(self._file.readline() or 'null')
+        except (ValueError, OSError):
+            header = None
+        if not isinstance(header, dict) or header.get('format') != PLAN_FORMAT:
+            self._file.close()
+            raise ValueError(f"File non valido come piano di rinomina: {path}")
+        if header.get('version') != PLAN_VERSION:
+            self._file.close()
+            raise ValueError(f"Versione del piano non supportata: {header.get('version')}")
+        self.header = header
+        self.summary = self._read_summary()
+        if self.summary is None:
+            self._file.close()
+            raise ValueError(f"Piano incompleto (manca il riepilogo finale): {path}")
+
+    @property
+    def total(self) -> int:
+        """Immagini nel piano, qualunque sia l'azione."""
+        return sum(self.summary.get(name, 0) for name in ('processed', 'skipped', 'unchanged'))
+
+    def __iter__(self) -> Iterator[PlanEntry]:
+        try:
+            for number, line in enumerate(self._file, start=2):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    raise ValueError(f"Riga {number} del piano non valida")
+                if 'summary' in data:
+                    continue
+                yield PlanEntry(data['action'], data['source'], data.get('target'),
+                                data.get('destination'), data.get('overwrite', False),
+                                data.get('size'), data.get('mtime_ns'))
+        finally:
+            self._file.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _read_summary(self) -> Optional[dict]:
+        """Conteggi dall'ultima riga (senza leggere tutto il file, se non è compresso)."""
+        last = ''
+        if self._compressed:
+            with _open(Path(self.path), 'rt', True) as f:
+                for line in f:
+                    last = line if line.strip() else last
+        else:
+            with open(self.path, 'rb') as f:
+                f.seek(max(0, f.seek(0, os.SEEK_END) - 4096))
+                lines = [line for line in f.read().splitlines() if line.strip()]
+                last = lines[-1].decode('utf-8', errors='replace') if lines else ''
+        try:
+            return json.loads(last).get('summary')
+        except (ValueError, AttributeError):
+            return None
+
+
+def _open(path: Path, mode: str, compressed: bool) -> IO[str]:
+    if compressed:
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
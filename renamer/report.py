@@ -0,0 +1,159 @@
+"""
+Modulo con il report di un'esecuzione di process_images.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+
+# Fasi di cui si misura la durata (secondi)
+STAGES = ('scan', 'lookup', 'copy', 'zip')
+
+
+class FileOperation(NamedTuple):
+    """Operazione eseguita su un singolo file."""
+
+    source: str
+    destination: str
+    mode: str
+
+
+class FileError(NamedTuple):
+    """Errore su un singolo file."""
+
+    source: str
+    error: str
+
+
+@dataclass
+class RunReport:
+    """
+    Esito di un'esecuzione: conteggi, tempi per fase, byte e file per
+    modalità usata.
+
+    Le operazioni file per file restano in memoria solo con
+    keep_operations=True (shard, il cui manifest le elenca); altrimenti
+    vanno scritte man mano nel log delle operazioni (log_utils.FileEventLog)
+    e write_json le copia nel report senza caricarle.
+
+    Si può spacchettare come la vecchia tupla:
+        processed, skipped, errors = process_images(...)
+
+    I tempi di 'copy' sono la somma dei tempi di ogni trasferimento: con più
+    thread possono superare la durata complessiva (duration).
+    """
+
+    processed: int = 0
+    skipped: int = 0
+    errors: int = 0
+    unchanged: int = 0
+    operations: List[FileOperation] = field(default_factory=list)
+    keep_operations: bool = False
+    modes: Dict[str, int] = field(default_factory=dict)
+    failures: List[FileError] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(STAGES, 0.0))
+    duration: float = 0.0
+    # Byte dei file processati e byte effettivamente copiati (non contano
+    # hardlink, symlink, reflink e spostamenti sullo stesso filesystem)
+    bytes_processed: int = 0
+    bytes_copied: int = 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter((self.processed, self.skipped, self.errors))
+
+    @property
+    def examined(self) -> int:
+        """File esaminati finora, qualunque sia l'esito."""
+        return self.processed + self.skipped + self.errors + self.unchanged
+
+    @property
+    def files_per_second(self) -> Optional[float]:
+        return self.examined / self.duration if self.duration > 0 else None
+
+    @property
+    def bytes_per_second(self) -> Optional[float]:
+        return self.bytes_processed / self.duration if self.duration > 0 else None
+
+    def add_operation(self, operation: FileOperation) -> None:
+        """Conta l'operazione per modalità (e la conserva con keep_operations)."""
+        self.modes[operation.mode] = self.modes.get(operation.mode, 0) + 1
+        if self.keep_operations:
+            self.operations.append(operation)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def merge(self, other: 'RunReport') -> None:
+        """
+        Aggiunge a questo report conteggi, tempi, byte, errori e operazioni
+        di un altro. La durata è la maggiore delle due: le esecuzioni unite
+        sono considerate contemporanee.
+        """
+        for name in ('processed', 'skipped', 'errors', 'unchanged', 'bytes_processed', 'bytes_copied'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for stage, seconds in other.timings.items():
+            self.add_time(stage, seconds)
+        self.duration = max(self.duration, other.duration)
+        for mode, count in other.modes.items():
+            self.modes[mode] = self.modes.get(mode, 0) + count
+        self.operations.extend(other.operations)
+        self.failures.extend(other.failures)
+
+    def mode_counts(self) -> Dict[str, int]:
+        """Numero di file per modalità effettivamente usata (copy, hardlink, ...)."""
+        return dict(self.modes)
+
+    def summary(self) -> dict:
+        """Conteggi, tempi, byte e errori, senza l'elenco delle operazioni."""
+        return {
+            'processed': self.processed,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'unchanged': self.unchanged,
+            'modes': self.mode_counts(),
+            'duration_s': round(self.duration, 6),
+            'timings_s': {stage: round(seconds, 6) for stage, seconds in self.timings.items()},
+            'bytes_processed': self.bytes_processed,
+            'bytes_copied': self.bytes_copied,
+            'files_per_s': _rounded(self.files_per_second),
+            'bytes_per_s': _rounded(self.bytes_per_second),
+            'failures': [failure._asdict() for failure in self.failures],
+        }
+
+    def to_dict(self) -> dict:
+        """Rappresentazione serializzabile in JSON (operazioni solo se conservate)."""
+        return dict(self.summary(), operations=[operation._asdict() for operation in self.operations])
+
+    def write_json(self, path: str, operations_log: Optional[str] = None) -> None:
+        """
+        Salva il report in JSON, nello stesso formato di to_dict. Se le
+        operazioni non sono in memoria vengono copiate riga per riga da
+        `operations_log` (JSONL scritto da FileEventLog).
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.summary(), indent=2)[:-2])
+            f.write(',\n  "operations": [')
+            separator = '\n    '
+            if self.operations or operations_log is None:
+                lines = (json.dumps(operation._asdict()) for operation in self.operations)
+            else:
+                lines = _read_lines(operations_log)
+            for line in lines:
+                f.write(separator + line)
+                separator = ',\n    '
+            f.write('\n  ]\n}\n' if separator != '\n    ' else ']\n}\n')
+
+
+def _read_lines(path: str) -> Iterator[str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line.rstrip('\n')
+    except FileNotFoundError:
+        return
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
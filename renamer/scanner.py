@@ -0,0 +1,180 @@
+"""
+Modulo per la scansione (anche ricorsiva) della cartella delle immagini.
+"""
+
+import os
+from fnmatch import fnmatch
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+
+class ScanEntry(NamedTuple):
+    """Immagine trovata durante la scansione."""
+
+    path: str
+    relative_dir: str
+    name: str
+    stem: str
+    suffix: str
+
+    @property
+    def relative_path(self) -> str:
+        """Percorso relativo alla cartella di input (con '/' come separatore)."""
+        return f"{self.relative_dir}/{self.name}" if self.relative_dir else self.name
+
+
+def normalize_exts(exts: Iterable[str]) -> Set[str]:
+    """Estensioni senza punto e in minuscolo, come insieme."""
+    return {ext.lower().lstrip('.') for ext in exts}
+
+
+def scan_images(root: str, exts: Iterable[str], recursive: bool = False,
+                max_depth: Optional[int] = None, include: Sequence[str] = (),
+                exclude: Sequence[str] = (), skip_dirs: Iterable[str] = ()) -> Iterator[ScanEntry]:
+    """
+    Genera le immagini presenti in `root`, man mano che vengono trovate.
+
+    Usa os.scandir riutilizzando il tipo di file già restituito dal sistema
+    (nessuna stat aggiuntiva per i file normali). L'ordine è deterministico:
+    in ogni cartella prima i file, poi le sottocartelle, entrambi in ordine
+    alfabetico. Per questo ordine i nomi delle immagini di una cartella sono
+    tenuti in memoria e ordinati prima di restituire la prima (vedi
+    _scan_dir); la scansione è lazy tra una cartella e l'altra.
+
+    Args:
+        root: Cartella di partenza
+        exts: Estensioni permesse (es. ['png', 'jpg'])
+        recursive: Se True scende nelle sottocartelle
+        max_depth: Profondità massima (0 = solo root, None = illimitata)
+        include: Pattern glob; se presenti, un file viene incluso solo se il
+            suo percorso relativo o il suo nome corrisponde ad almeno uno
+        exclude: Pattern glob di file o cartelle da escludere
+        skip_dirs: Cartelle da non visitare (es. l'output se sta dentro l'input)
+
+    Yields:
+        ScanEntry per ogni immagine trovata
+    """
+    ext_set = normalize_exts(exts)
+    if not recursive:
+        max_depth = 0
+    skip = {os.path.realpath(path) for path in skip_dirs}
+
+    yield from _scan_dir(root, '', 0, ext_set, max_depth, tuple(include), tuple(exclude), skip)
+
+
+def scan_paths(root: str, paths: Iterable[str], exts: Iterable[str], recursive: bool = False,
+               max_depth: Optional[int] = None, include: Sequence[str] = (),
+               exclude: Sequence[str] = (), skip_dirs: Iterable[str] = ()) -> List[ScanEntry]:
+    """
+    Come scan_images, ma limitata ai file indicati (es. quelli segnalati come
+    nuovi o modificati): restituisce quelli che una scansione completa
+    includerebbe, nello stesso ordine, senza leggere il resto della cartella.
+
+    Args:
+        root: Cartella di partenza
+        paths: Percorsi dei file da valutare (assoluti o relativi alla cartella corrente)
+        exts, recursive, max_depth, include, exclude, skip_dirs: Come in scan_images
+
+    Returns:
+        Le ScanEntry dei file inclusi, in ordine di scansione
+    """
+    ext_set = normalize_exts(exts)
+    if not recursive:
+        max_depth = 0
+    skip = {os.path.realpath(path) for path in skip_dirs}
+    include, exclude = tuple(include), tuple(exclude)
+    root_abs = os.path.abspath(root)
+
+    found = {}
+    for path in paths:
+        relative = os.path.relpath(os.path.abspath(path), root_abs)
+        parts = relative.split(os.sep)
+        if parts[0] in (os.pardir, os.curdir):
+            continue
+        if max_depth is not None and len(parts) - 1 > max_depth:
+            continue
+        if exclude and any(_matches('/'.join(parts[:i + 1]), parts[i], exclude)
+                           for i in range(len(parts))):
+            continue
+        if skip and any(os.path.realpath(os.path.join(root, *parts[:i])) in skip
+                        for i in range(1, len(parts))):
+            continue
+
+        name = parts[-1]
+        stem, dot_suffix = os.path.splitext(name)
+        if dot_suffix[1:].lower() not in ext_set:
+            continue
+        relative_dir = '/'.join(parts[:-1])
+        relative_path = f"{relative_dir}/{name}" if relative_dir else name
+        if include and not _matches(relative_path, name, include):
+            continue
+        full_path = os.path.join(root, *parts)
+        if not os.path.isfile(full_path):
+            continue
+        found[relative_path] = ScanEntry(full_path, relative_dir, name, stem, dot_suffix)
+
+    # Ordine di scan_images: in ogni cartella prima i file, poi le sottocartelle
+    return sorted(found.values(), key=scan_order)
+
+
+def scan_order(entry: ScanEntry) -> Tuple[List[str], str]:
+    """Chiave di ordinamento che riproduce l'ordine di scan_images."""
+    return (entry.relative_dir.split('/') if entry.relative_dir else [], entry.name)
+
+
+def _scan_dir(directory: str, relative_dir: str, depth: int, ext_set: Set[str],
+              max_depth: Optional[int], include: tuple, exclude: tuple,
+              skip: Set[str]) -> Iterator[ScanEntry]:
+    """
+    Immagini di `directory` e (ricorsivamente) delle sue sottocartelle.
+
+    Per l'ordine alfabetico i nomi di una cartella vengono letti tutti prima
+    di restituire la prima immagine: in memoria restano solo i nomi delle
+    immagini e delle sottocartelle incluse (circa 100 byte ciascuno), non le
+    voci di os.scandir. Una cartella con milioni di immagini va quindi letta
+    per intero prima che partano i trasferimenti; le sottocartelle vengono
+    lette una alla volta, quando la scansione le raggiunge.
+    """
+    files = []
+    subdirs = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            relative_path = f"{relative_dir}/{name}" if relative_dir else name
+
+            if exclude and _matches(relative_path, name, exclude):
+                continue
+
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if max_depth is None or depth < max_depth:
+                        subdirs.append(name)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if os.path.splitext(name)[1][1:].lower() not in ext_set:
+                continue
+            if include and not _matches(relative_path, name, include):
+                continue
+            files.append(name)
+
+    files.sort()
+    for name in files:
+        stem, dot_suffix = os.path.splitext(name)
+        yield ScanEntry(os.path.join(directory, name), relative_dir, name, stem, dot_suffix)
+    del files
+
+    subdirs.sort()
+    for name in subdirs:
+        path = os.path.join(directory, name)
+        if skip and os.path.realpath(path) in skip:
+            continue
+        relative_path = f"{relative_dir}/{name}" if relative_dir else name
+        yield from _scan_dir(path, relative_path, depth + 1, ext_set,
+                             max_depth, include, exclude, skip)
+
+
+def _matches(relative_path: str, name: str, patterns: tuple) -> bool:
+    return any(fnmatch(relative_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
@@ -0,0 +1,102 @@
+"""
+Modulo con il dimensionamento del server web di produzione (gunicorn, vedi
+gunicorn.conf.py): CPU e memoria effettivamente disponibili, anche dentro
+un container con limiti cgroup, e numero di processi e thread.
+"""
+
+import os
+from typing import Optional
+
+
+# Memoria stimata per processo del server (interprete, Flask, numpy, LRU
+# delle mappe non compatte e buffer delle richieste)
+DEFAULT_WORKER_MEMORY = 256 * 1024 * 1024
+# Quota della memoria disponibile destinata ai processi: il resto resta alla
+# page cache (mappe compatte in mmap, immagini e ZIP inviati con sendfile)
+MEMORY_FRACTION = 0.75
+# Thread per processo: le richieste lunghe (upload a blocchi, download)
+# aspettano la rete, non la CPU
+DEFAULT_THREADS = 4
+MAX_WORKERS = 32
+
+
+def available_cpus() -> int:
+    """
+    CPU utilizzabili dal processo: affinità, ridotta dalla quota CPU del
+    cgroup (es. `docker run --cpus 2`) se presente.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota + 0.5)))
+    return max(1, cpus)
+
+
+def available_memory() -> Optional[int]:
+    """
+    Byte di memoria utilizzabili: limite del cgroup (container) o memoria
+    fisica della macchina, se inferiore. None se non determinabile.
+    """
+    limits = [limit for limit in (_cgroup_memory_limit(), _physical_memory()) if limit]
+    return min(limits) if limits else None
+
+
+def worker_count(cpus: Optional[int] = None, memory: Optional[int] = None,
+                 worker_memory: int = DEFAULT_WORKER_MEMORY) -> int:
+    """
+    Processi del server: 2 per CPU più uno, limitati dalla memoria (una quota
+    di `worker_memory` byte ciascuno) e da MAX_WORKERS.
+
+    Args:
+        cpus: CPU disponibili (default available_cpus())
+        memory: Byte disponibili (default available_memory(); None = nessun limite)
+        worker_memory: Memoria stimata per processo
+    """
+    cpus = cpus or available_cpus()
+    workers = 2 * cpus + 1
+    memory = memory if memory is not None else available_memory()
+    if memory:
+        workers = min(workers, int(memory * MEMORY_FRACTION) // worker_memory)
+    return max(1, min(workers, MAX_WORKERS))
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    """CPU concesse dal cgroup (v2 cpu.max o v1 cfs_quota/cfs_period), None se illimitate."""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def _cgroup_memory_limit() -> Optional[int]:
+    """Limite di memoria del cgroup (v2 o v1), None se assente."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 2 ** 60:
+            # v1 senza limite riporta un valore enorme invece di "max"
+            return int(value)
+    return None
+
+
+def _physical_memory() -> Optional[int]:
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
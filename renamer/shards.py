@@ -0,0 +1,291 @@
+"""
+Modulo per l'esecuzione a shard (più processi o più macchine sulla stessa
+cartella di output).
+
+Ogni immagine appartiene a uno shard scelto con un hash stabile del nome di
+destinazione (o del percorso, per le immagini senza codice): tutte le
+immagini che competono per lo stesso nome finiscono nello stesso shard e
+ricevono i suffissi _N nello stesso ordine di un'esecuzione singola.
+
+Ogni shard scrive in una propria cartella di staging dentro l'output e salva
+un manifest; merge_shards sposta poi i file nella cartella finale, shard per
+shard, e unisce i report.
+
+Tutti gli shard di un'esecuzione condividono un run id, salvato nel
+manifest: il merge avviene solo quando gli N manifest hanno lo stesso run
+id, quindi i manifest rimasti da un'esecuzione interrotta non vengono mai
+uniti a quelli nuovi. All'avvio ogni shard svuota la propria staging e
+rimuove il proprio manifest.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .report import FileError, FileOperation, RunReport
+
+
+SHARDS_DIR = '.shards'
+# Cartella di lock del merge, una per run id: un lock rimasto da
+# un'esecuzione interrotta non blocca le successive
+MERGE_LOCK = 'merge-{run_id}.lock'
+RUN_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+SHARD_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+
+# Versione del formato dei manifest
+MANIFEST_VERSION = 2
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Interpreta 'i/N' (shard i di N, a partire da 1).
+
+    Raises:
+        ValueError: Se il formato o i valori non sono validi
+    """
+    match = SHARD_RE.match(value)
+    if not match:
+        raise ValueError(f"Shard non valido: {value}. Usa il formato i/N (es. 1/4)")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard non valido: {value}. Serve 1 <= i <= N")
+    return index, count
+
+
+def check_run_id(run_id: str) -> str:
+    """
+    Valida un run id (usato anche nel nome del lock).
+
+    Raises:
+        ValueError: Se contiene caratteri diversi da lettere, cifre, '_', '-', '.'
+    """
+    if not RUN_ID_RE.match(run_id):
+        raise ValueError(f"Run id non valido: {run_id}. Usa al più 64 caratteri tra lettere, "
+                         f"cifre, '_', '-' e '.'")
+    return run_id
+
+
+def default_run_id(mapping_file: str, input_dir: str, output_dir: str, count: int) -> str:
+    """
+    Run id derivato da file di mapping (percorso, dimensione, mtime),
+    cartelle e numero di shard: uguale su tutte le macchine che eseguono la
+    stessa esecuzione, ma anche su una sua ripetizione con gli stessi dati.
+    """
+    stat = os.stat(mapping_file)
+    key = '\0'.join([os.path.abspath(mapping_file), str(stat.st_size), str(stat.st_mtime_ns),
+                      os.path.abspath(input_dir), os.path.abspath(output_dir), str(count)])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def shard_for(key: str, count: int) -> int:
+    """Shard (da 1 a count) di una chiave, con un hash stabile tra processi e macchine."""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count + 1
+
+
+def staging_dir(output_dir: str, index: int, count: int) -> Path:
+    """Cartella in cui lo shard scrive i propri file prima del merge."""
+    return Path(output_dir) / SHARDS_DIR / f"{index}-of-{count}"
+
+
+def manifest_path(output_dir: str, index: int, count: int) -> Path:
+    return Path(output_dir) / SHARDS_DIR / f"{index}-of-{count}.json"
+
+
+def merge_log_path(output_dir: str, index: int, count: int) -> Path:
+    """Log del merge dello shard: destinazione finale di ogni file spostato (JSON Lines)."""
+    return Path(output_dir) / SHARDS_DIR / f"{index}-of-{count}.merged.jsonl"
+
+
+def reset_shard(output_dir: str, index: int, count: int) -> None:
+    """Rimuove staging, manifest e log del merge lasciati da un'esecuzione precedente dello shard."""
+    manifest = manifest_path(output_dir, index, count)
+    if manifest.exists():
+        logging.info(f"Rimozione del manifest precedente dello shard {index}/{count}")
+        manifest.unlink()
+    merge_log_path(output_dir, index, count).unlink(missing_ok=True)
+    staging = staging_dir(output_dir, index, count)
+    if staging.exists():
+        logging.info(f"Rimozione della staging precedente dello shard {index}/{count}")
+        shutil.rmtree(staging)
+
+
+def write_manifest(output_dir: str, index: int, count: int, report: RunReport, run_id: str) -> Path:
+    """
+    Salva il manifest di uno shard: il report con le destinazioni relative
+    alla cartella di staging e il run id. Scritto per ultimo e in modo
+    atomico, segnala che lo shard è completo.
+    """
+    staging = staging_dir(output_dir, index, count)
+    data = report.to_dict()
+    data['operations'] = [
+        dict(operation._asdict(), destination=os.path.relpath(operation.destination, staging))
+        for operation in report.operations
+    ]
+    data.update(version=MANIFEST_VERSION, run_id=run_id, shard=index, shard_count=count,
+                timings=report.timings, duration=report.duration)
+
+    path = manifest_path(output_dir, index, count)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(data), encoding='utf-8')
+    os.replace(tmp_path, path)
+    return path
+
+
+def manifest_run_ids(output_dir: str, count: int) -> Dict[int, Optional[str]]:
+    """Run id del manifest di ogni shard presente (None per i manifest senza run id)."""
+    run_ids = {}
+    for index in range(1, count + 1):
+        try:
+            data = json.loads(manifest_path(output_dir, index, count).read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            continue
+        run_ids[index] = data.get('run_id')
+    return run_ids
+
+
+def merge_shards(output_dir: str, count: int, run_id: Optional[str] = None,
+                 cleanup: bool = True) -> RunReport:
+    """
+    Sposta i file di tutti gli shard nella cartella di output e unisce i report.
+
+    Gli shard vengono uniti in ordine; i nomi non possono coincidere tra shard
+    diversi (la partizione è per nome di destinazione), salvo un codice target
+    che coincide con il nome _N generato per un altro codice: in quel caso il
+    file viene rinominato con il primo suffisso libero e segnalato nel log.
+
+    Un merge interrotto si può ripetere: i file già spostati restano dove
+    sono e vengono solo riportati nel report. La destinazione di ogni file
+    viene scritta nel log del merge dello shard (merge_log_path) prima dello
+    spostamento, così anche i file rinominati per un conflitto sono riportati
+    con il percorso finale.
+
+    Args:
+        output_dir: Cartella di output condivisa dagli shard
+        count: Numero di shard (N)
+        run_id: Run id atteso nei manifest (None = qualsiasi, purché uguale per tutti)
+        cleanup: Se True rimuove staging e manifest dopo il merge
+
+    Returns:
+        RunReport complessivo, con le destinazioni finali
+
+    Raises:
+        RuntimeError: Se manca il manifest di qualche shard o i manifest
+            appartengono a esecuzioni diverse
+    """
+    run_ids = manifest_run_ids(output_dir, count)
+    missing = [index for index in range(1, count + 1) if index not in run_ids]
+    if missing:
+        raise RuntimeError(f"Shard non completati: {', '.join(map(str, missing))} di {count}")
+    expected = run_id if run_id is not None else run_ids[1]
+    mismatched = [index for index, found in run_ids.items() if found is None or found != expected]
+    if mismatched:
+        raise RuntimeError(f"Manifest di esecuzioni diverse (run id atteso {expected}): "
+                           f"shard {', '.join(map(str, mismatched))} di {count}")
+
+    output_path = Path(output_dir)
+    merged = RunReport(keep_operations=True)
+    for index in range(1, count + 1):
+        data = json.loads(manifest_path(output_dir, index, count).read_text(encoding='utf-8'))
+        staging = staging_dir(output_dir, index, count)
+        for name in ('processed', 'skipped', 'errors', 'unchanged', 'bytes_processed', 'bytes_copied'):
+            setattr(merged, name, getattr(merged, name) + data[name])
+        for stage, seconds in data['timings'].items():
+            merged.add_time(stage, seconds)
+        # Gli shard girano in parallelo: conta il più lento
+        merged.duration = max(merged.duration, data['duration'])
+        merged.failures.extend(FileError(**failure) for failure in data['failures'])
+
+        log_path = merge_log_path(output_dir, index, count)
+        moved = _read_merge_log(log_path)
+        with open(log_path, 'a', encoding='utf-8') as merge_log:
+            for operation in data['operations']:
+                relative = operation['destination']
+                staged = staging / relative
+                if os.path.lexists(staged):
+                    destination = _free_path(output_path / relative)
+                    destination.parent.mkdir(parents=True, exist_ok=True)
+                    # Registrata prima dello spostamento: una ripresa la ritrova
+                    merge_log.write(json.dumps({
+                        'staged': relative,
+                        'destination': os.path.relpath(destination, output_path),
+                    }) + '\n')
+                    merge_log.flush()
+                    os.rename(staged, destination)
+                else:
+                    # Già spostato da un merge interrotto
+                    destination = output_path / moved.get(relative, relative)
+                merged.add_operation(FileOperation(operation['source'], str(destination),
+                                                   operation['mode']))
+
+    if cleanup:
+        shutil.rmtree(output_path / SHARDS_DIR, ignore_errors=True)
+    logging.info(f"Merge di {count} shard completato: {merged.processed} file processati")
+    return merged
+
+
+def try_merge(output_dir: str, count: int, run_id: str) -> Optional[RunReport]:
+    """
+    Esegue il merge se tutti gli shard hanno salvato il manifest di questa
+    esecuzione (stesso run id). Pensata per essere chiamata da ogni shard
+    alla fine: solo il primo che trova tutti i manifest (e crea la cartella
+    di lock, operazione atomica anche su storage condiviso) esegue il merge.
+    Se il merge fallisce il lock viene rilasciato; dopo un'interruzione
+    brusca il merge si completa con `app.py merge`.
+
+    Returns:
+        Il report complessivo, o None se il merge non spettava a questo shard
+    """
+    run_ids = manifest_run_ids(output_dir, count)
+    if len(run_ids) < count or any(found != run_id for found in run_ids.values()):
+        return None
+    lock = Path(output_dir) / SHARDS_DIR / MERGE_LOCK.format(run_id=run_id)
+    try:
+        os.mkdir(lock)
+    except FileExistsError:
+        return None
+    try:
+        return merge_shards(output_dir, count, run_id=run_id)
+    except BaseException:
+        try:
+            os.rmdir(lock)
+        except OSError:
+            pass
+        raise
+
+
+def _read_merge_log(path: Path) -> Dict[str, str]:
+    """Destinazioni registrate da un merge precedente: {staging: output}, relative."""
+    moved = {}
+    try:
+        with open(path, encoding='utf-8') as merge_log:
+            for line in merge_log:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Ultima riga troncata da un'interruzione: il file non è stato spostato
+                    continue
+                moved[entry['staged']] = entry['destination']
+    except FileNotFoundError:
+        pass
+    return moved
+
+
+def _free_path(path: Path) -> Path:
+    """`path` se libero, altrimenti la prima variante _N libera (con avviso)."""
+    if not os.path.lexists(path):
+        return path
+    counter = 1
+    while True:
+        candidate = path.with_name(f"{path.stem}_{counter}{path.suffix}")
+        if not os.path.lexists(candidate):
+            logging.warning(f"Conflitto tra shard: {path.name} salvato come {candidate.name}")
+            return candidate
+        counter += 1
+
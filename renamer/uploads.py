@@ -0,0 +1,268 @@
+"""
+Modulo con le sessioni di upload a blocchi (chunk) della web app.
+
+Il client dichiara i file da inviare, poi manda i blocchi in qualsiasi
+ordine (anche in parallelo); ogni blocco viene scritto direttamente nella
+sua posizione nel file finale. Un upload interrotto riprende inviando solo
+i blocchi mancanti.
+"""
+
+import json
+import logging
+import math
+import os
+import secrets
+import shutil
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+
+from .jobs import JOB_ID_RE
+
+
+MANIFEST_FILE = 'session.json'
+RECEIVED_FILE = 'received.log'
+# Prefisso delle sessioni riservate da una finalizzazione (vedi UploadManager.claim)
+CLAIMED_PREFIX = '.claimed.'
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_UPLOAD_TTL = 24 * 3600
+
+# Byte copiati per volta dal corpo della richiesta al file
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadSession:
+    """
+    Sessione di upload: manifest dei file, file preallocati e registro dei
+    blocchi ricevuti (una riga 'file:blocco' per blocco, in append).
+    """
+
+    def __init__(self, directory: Path, manifest: dict):
+        self.directory = directory
+        self.manifest = manifest
+        self.id = manifest['id']
+        self.chunk_size = manifest['chunk_size']
+        self.files = manifest['files']
+        # ID di una mappa già registrata, in alternativa al file di mapping
+        self.mapping_id = manifest.get('mapping_id')
+
+    @property
+    def image_count(self) -> int:
+        return sum(1 for entry in self.files if entry['role'] == 'images')
+
+    def file_path(self, file_index: int) -> Path:
+        """Percorso su disco del file `file_index` del manifest."""
+        entry = self.files[file_index]
+        return self.directory / entry['role'] / entry['name']
+
+    def chunk_count(self, file_index: int) -> int:
+        return math.ceil(self.files[file_index]['size'] / self.chunk_size)
+
+    def write_chunk(self, file_index: int, chunk_index: int, stream: BinaryIO) -> None:
+        """
+        Scrive un blocco nella sua posizione del file finale, leggendo lo
+        stream a piccoli blocchi (il corpo della richiesta non viene mai
+        tenuto tutto in memoria). Reinviare un blocco già ricevuto è innocuo.
+
+        Raises:
+            ValueError: Se gli indici non sono validi o il blocco è incompleto
+        """
+        if not 0 <= file_index < len(self.files):
+            raise ValueError(f"File non valido: {file_index}")
+        if not 0 <= chunk_index < self.chunk_count(file_index):
+            raise ValueError(f"Blocco non valido: {chunk_index}")
+
+        offset = chunk_index * self.chunk_size
+        expected = min(self.chunk_size, self.files[file_index]['size'] - offset)
+        written = 0
+        with open(self.file_path(file_index), 'r+b') as dest:
+            dest.seek(offset)
+            while written < expected:
+                block = stream.read(min(COPY_BLOCK_SIZE, expected - written))
+                if not block:
+                    break
+                dest.write(block)
+                written += len(block)
+
+        if written != expected or stream.read(1):
+            raise ValueError(f"Blocco {chunk_index} incompleto: attesi {expected} byte")
+
+        # Scritture brevi in append: atomiche anche con richieste concorrenti
+        with open(self.directory / RECEIVED_FILE, 'a', encoding='utf-8') as log:
+            log.write(f"{file_index}:{chunk_index}\n")
+
+    def missing_chunks(self) -> Dict[int, List[int]]:
+        """Blocchi non ancora ricevuti, per indice di file (solo file incompleti)."""
+        received = set()
+        try:
+            with open(self.directory / RECEIVED_FILE, encoding='utf-8') as log:
+                received.update(line.strip() for line in log)
+        except FileNotFoundError:
+            pass
+
+        missing = {}
+        for file_index in range(len(self.files)):
+            chunks = [chunk for chunk in range(self.chunk_count(file_index))
+                      if f"{file_index}:{chunk}" not in received]
+            if chunks:
+                missing[file_index] = chunks
+        return missing
+
+    def status(self) -> dict:
+        """Stato della sessione, in forma serializzabile in JSON."""
+        missing = self.missing_chunks()
+        return {
+            'upload_id': self.id,
+            'mapping_id': self.mapping_id,
+            'chunk_size': self.chunk_size,
+            'complete': not missing,
+            'files': [
+                {
+                    'index': index,
+                    'name': entry['name'],
+                    'role': entry['role'],
+                    'size': entry['size'],
+                    'chunks': self.chunk_count(index),
+                    'missing': missing.get(index, []),
+                }
+                for index, entry in enumerate(self.files)
+            ],
+        }
+
+
+class UploadManager:
+    """Crea e ritrova le sessioni di upload, eliminando quelle scadute."""
+
+    def __init__(self, root_dir: str, ttl: int = DEFAULT_UPLOAD_TTL,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            root_dir: Cartella che contiene le sessioni
+            ttl: Secondi di inattività dopo i quali una sessione viene eliminata
+            max_bytes: Dimensione totale massima di una sessione (None = nessun limite)
+        """
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def create(self, mapping: Optional[dict], images: List[dict],
+               chunk_size: int = DEFAULT_CHUNK_SIZE,
+               mapping_id: Optional[str] = None) -> UploadSession:
+        """
+        Crea una sessione e prealloca i file dichiarati.
+
+        Args:
+            mapping: {'name': ..., 'size': ...} del file di mapping (il primo
+                file della sessione); None se si usa `mapping_id`
+            images: Lista di {'name': ..., 'size': ...} delle immagini
+            chunk_size: Dimensione dei blocchi (limitata tra MIN e MAX_CHUNK_SIZE)
+            mapping_id: ID di una mappa già registrata (map_registry)
+
+        Raises:
+            ValueError: Se la dichiarazione dei file non è valida
+        """
+        self.cleanup()
+        if not images:
+            raise ValueError("Nessuna immagine da caricare")
+        if not mapping and not mapping_id:
+            raise ValueError("Serve il file di mapping o l'ID di una mappa registrata")
+
+        files = [_file_entry(mapping, 'mapping')] if mapping else []
+        names = set()
+        for image in images:
+            entry = _file_entry(image, 'images')
+            if entry['name'] in names:
+                raise ValueError(f"Immagine duplicata: {entry['name']}")
+            names.add(entry['name'])
+            files.append(entry)
+
+        total = sum(entry['size'] for entry in files)
+        if self.max_bytes is not None and total > self.max_bytes:
+            raise ValueError(f"Upload troppo grande: {total} byte (massimo {self.max_bytes})")
+
+        upload_id = secrets.token_urlsafe(16)
+        manifest = {
+            'id': upload_id,
+            'mapping_id': None if mapping else mapping_id,
+            'chunk_size': max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, int(chunk_size))),
+            'files': files,
+            'created_at': time.time(),
+        }
+        directory = self.root_dir / upload_id
+        for role in ('mapping', 'images'):
+            (directory / role).mkdir(parents=True)
+        session = UploadSession(directory, manifest)
+        for index, entry in enumerate(files):
+            # File sparso della dimensione finale: i blocchi vengono scritti
+            # direttamente al loro posto
+            with open(session.file_path(index), 'wb') as f:
+                f.truncate(entry['size'])
+        (directory / MANIFEST_FILE).write_text(json.dumps(manifest), encoding='utf-8')
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        """Sessione con l'ID dato (None se non valida o inesistente)."""
+        if not JOB_ID_RE.match(upload_id):
+            return None
+        directory = self.root_dir / upload_id
+        try:
+            manifest = json.loads((directory / MANIFEST_FILE).read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            return None
+        # L'attività sulla sessione ne rinnova la scadenza
+        os.utime(directory)
+        return UploadSession(directory, manifest)
+
+    def claim(self, session: UploadSession) -> Optional[UploadSession]:
+        """
+        Riserva la sessione in modo esclusivo (rename atomico della cartella),
+        prima di spostarne i file: tra più richieste concorrenti, anche da
+        processi diversi, solo una ottiene la sessione.
+
+        Returns:
+            La sessione nella nuova cartella, o None se era già stata
+            riservata (o rimossa) da un'altra richiesta
+        """
+        claimed = self.root_dir / f"{CLAIMED_PREFIX}{session.id}"
+        try:
+            os.rename(session.directory, claimed)
+        except OSError:
+            # Sessione già spostata, o riservata (cartella di destinazione non vuota)
+            return None
+        return UploadSession(claimed, session.manifest)
+
+    def release(self, session: UploadSession) -> None:
+        """Annulla claim: la sessione torna disponibile con il suo ID."""
+        os.rename(session.directory, self.root_dir / session.id)
+
+    def remove(self, session: UploadSession) -> None:
+        shutil.rmtree(session.directory, ignore_errors=True)
+
+    def cleanup(self) -> None:
+        """Elimina le sessioni inattive da più di `ttl` secondi."""
+        deadline = time.time() - self.ttl
+        with os.scandir(self.root_dir) as entries:
+            for entry in entries:
+                # Anche le sessioni riservate da una finalizzazione non completata
+                name = entry.name[len(CLAIMED_PREFIX):] if entry.name.startswith(CLAIMED_PREFIX) \
+                    else entry.name
+                if (entry.is_dir(follow_symlinks=False) and JOB_ID_RE.match(name)
+                        and entry.stat().st_mtime < deadline):
+                    logging.info(f"Rimozione upload scaduto: {entry.name}")
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _file_entry(declared: dict, role: str) -> dict:
+    """Valida un file dichiarato dal client (nome senza percorso, dimensione >= 0)."""
+    try:
+        name = os.path.basename(str(declared['name']))
+        size = int(declared['size'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Dichiarazione file non valida: {declared}")
+    if not name or name in ('.', '..') or size < 0:
+        raise ValueError(f"Dichiarazione file non valida: {declared}")
+    return {'name': name, 'size': size, 'role': role}
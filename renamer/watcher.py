@@ -0,0 +1,323 @@
+"""
+Modulo per la modalità watch: osserva la cartella di input e processa solo
+le immagini nuove o modificate, ricaricando la mappa quando il file di
+mapping cambia su disco.
+
+Gli eventi arrivano da watchdog (inotify su Linux, FSEvents su macOS, ...)
+se il pacchetto è installato, altrimenti da un polling dei soli metadati
+(una stat per file, nessuna lettura). In entrambi i casi un file entra in un
+batch solo quando dimensione e mtime restano invariati per `debounce`
+secondi: i file ancora in copia non vengono processati a metà.
+
+I batch usano sempre il journal (journal.RunJournal): un file modificato
+sovrascrive la propria destinazione invece di generare una copia _N, un
+file riprocessato per un codice rimappato sostituisce la destinazione col
+nome vecchio, e al riavvio i file già processati risultano invariati.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional, Set, Tuple
+
+from .file_ops import ProcessOptions, process_images
+from .map_cache import load_map_cached
+from .report import RunReport
+from .scanner import ScanEntry, scan_images, scan_order, scan_paths
+
+
+# Secondi tra due controlli (polling della cartella, file in attesa, mappa)
+DEFAULT_INTERVAL = 2.0
+# Secondi senza modifiche dopo i quali un file (o la mappa) è considerato stabile
+DEFAULT_DEBOUNCE = 2.0
+
+WATCH_BACKENDS = ('auto', 'polling')
+
+# (dimensione, mtime in ns)
+Signature = Tuple[int, int]
+
+
+class FolderWatcher:
+    """
+    Processa in modo incrementale le immagini che compaiono o cambiano nella
+    cartella di input, con la mappa compilata tenuta in memoria.
+
+    Uso tipico: start() processa la cartella una prima volta (i file già
+    presenti nel journal risultano invariati), poi poll_once() a intervalli
+    regolari raccoglie le modifiche e processa quelle stabili (run() fa
+    entrambe le cose fino all'interruzione).
+    """
+
+    def __init__(self, map_file: str, input_dir: str, output_dir: str,
+                 options: Optional[ProcessOptions] = None,
+                 interval: float = DEFAULT_INTERVAL, debounce: float = DEFAULT_DEBOUNCE,
+                 backend: str = 'auto', streaming: bool = False, use_cache: bool = True):
+        """
+        Args:
+            map_file: File di mapping (Excel o CSV), ricaricato quando cambia
+            input_dir: Cartella osservata
+            output_dir: Cartella di destinazione
+            options: Opzioni di process_images (il journal è sempre attivo);
+                estensioni, ricorsione e pattern valgono anche per l'osservazione
+            interval: Secondi tra due controlli
+            debounce: Secondi di stabilità richiesti prima di processare un file
+            backend: 'auto' (watchdog se installato, altrimenti polling) o
+                'polling' (es. cartelle di rete, dove inotify non vede le
+                scritture fatte da altre macchine)
+            streaming, use_cache: Lettura della mappa, come in load_map_cached
+
+        Raises:
+            ValueError: Se il backend non è valido
+        """
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"Backend non valido: {backend}. Usa uno tra: {', '.join(WATCH_BACKENDS)}")
+        self.map_file = map_file
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.interval = interval
+        self.debounce = debounce
+        self.backend = backend
+        self.streaming = streaming
+        self.use_cache = use_cache
+        self.options = replace(options or ProcessOptions(), journal=True)
+        self._scan_options = dict(exts=self.options.exts, recursive=self.options.recursive,
+                                  max_depth=self.options.max_depth,
+                                  include=tuple(self.options.include),
+                                  exclude=tuple(self.options.exclude), skip_dirs=[output_dir])
+
+        self.mapping: Dict[str, str] = {}
+        self.batches = 0
+        # Immagini note, con la firma al momento dell'ultimo processamento
+        self._known: Dict[str, Tuple[ScanEntry, Optional[Signature]]] = {}
+        # File cambiati in attesa di stabilità: (firma, istante dell'ultimo cambiamento)
+        self._dirty: Dict[str, Tuple[Signature, float]] = {}
+        self._map_signature: Optional[Signature] = None
+        self._map_dirty: Optional[Tuple[Signature, float]] = None
+
+        # Osservatore watchdog (None = polling) e percorsi che ha segnalato
+        self._observer = None
+        self._events: Set[str] = set()
+        self._rescan = False
+        self._events_lock = threading.Lock()
+
+    @property
+    def using_events(self) -> bool:
+        """True se le modifiche arrivano dagli eventi del filesystem invece che dal polling."""
+        return self._observer is not None
+
+    def start(self) -> RunReport:
+        """
+        Carica la mappa, avvia l'osservazione e processa la cartella di input
+        (solo i file nuovi o cambiati rispetto al journal).
+
+        Raises:
+            ValueError: Se la mappa è vuota o non valida
+        """
+        self._map_signature = _signature(self.map_file)
+        self.mapping = self._load_mapping()
+        if not self.mapping:
+            raise ValueError(f"Nessun mapping valido trovato in {self.map_file}")
+
+        if self.backend == 'auto':
+            self._observer = self._start_observer()
+        if self.using_events:
+            logging.info(f"Osservazione di {self.input_dir} tramite eventi del filesystem")
+        else:
+            logging.info(f"Osservazione di {self.input_dir} tramite polling ogni {self.interval:g}s")
+
+        # Gli eventi arrivati durante la scansione iniziale vengono valutati
+        # al primo poll_once: nessuna modifica va persa
+        entries = list(scan_images(self.input_dir, **self._scan_options))
+        for entry in entries:
+            self._known[entry.path] = (entry, _signature(entry.path))
+        return self._process(entries)
+
+    def poll_once(self) -> Optional[RunReport]:
+        """
+        Raccoglie le modifiche e processa i file stabili (più quelli
+        interessati da una nuova versione della mappa).
+
+        Returns:
+            Il report del batch, o None se non c'era nulla da processare
+        """
+        now = time.monotonic()
+        changed_codes = self._check_mapping(now)
+        if self.using_events:
+            self._collect_events(now)
+        else:
+            self._collect_polling(now)
+
+        batch = {path: entry for path, entry in self._stable_files(now)}
+        if changed_codes:
+            affected = [entry for entry, _ in self._known.values() if entry.stem in changed_codes]
+            logging.info(f"Mappa aggiornata: {len(changed_codes)} codici cambiati, "
+                         f"{len(affected)} immagini da riprocessare")
+            for entry in affected:
+                batch.setdefault(entry.path, entry)
+        if not batch:
+            return None
+
+        entries = sorted(batch.values(), key=scan_order)
+        logging.info(f"Batch {self.batches + 1}: {len(entries)} immagini nuove o modificate")
+        return self._process(entries)
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """Esegue start e poi poll_once ogni `interval` secondi, finché `stop` non viene impostato."""
+        stop = stop or threading.Event()
+        try:
+            self.start()
+            while not stop.wait(self.interval):
+                self.poll_once()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Ferma l'osservazione degli eventi."""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def _process(self, entries: List[ScanEntry]) -> RunReport:
+        report = process_images(self.mapping, self.input_dir, self.output_dir, self.options,
+                                entries=entries)
+        self.batches += 1
+        return report
+
+    def _load_mapping(self) -> Dict[str, str]:
+        return load_map_cached(self.map_file, streaming=self.streaming,
+                               use_cache=self.use_cache).mapping
+
+    def _check_mapping(self, now: float) -> Set[str]:
+        """Ricarica la mappa se il file è cambiato ed è stabile; restituisce i codici cambiati."""
+        signature = _signature(self.map_file)
+        if signature is None or signature == self._map_signature:
+            self._map_dirty = None
+            return set()
+        if self._map_dirty is None or self._map_dirty[0] != signature:
+            self._map_dirty = (signature, now)
+            return set()
+        if now - self._map_dirty[1] < self.debounce:
+            return set()
+
+        self._map_dirty = None
+        self._map_signature = signature
+        try:
+            mapping = self._load_mapping()
+        except (OSError, ValueError) as e:
+            # Es. file salvato a metà: si riprova alla prossima modifica
+            logging.warning(f"Mappa non ricaricata, resta in uso la precedente: {e}")
+            return set()
+        if not mapping:
+            logging.warning("La nuova mappa è vuota: resta in uso la precedente")
+            return set()
+
+        old = self.mapping
+        changed = {code for code in old.keys() | mapping.keys() if old.get(code) != mapping.get(code)}
+        self.mapping = mapping
+        logging.info(f"Mappa ricaricata da {self.map_file}: {len(mapping) // 2} coppie di codici")
+        return changed
+
+    def _collect_polling(self, now: float) -> None:
+        """Confronta la cartella con le firme note (solo metadati)."""
+        seen = set()
+        for entry in scan_images(self.input_dir, **self._scan_options):
+            seen.add(entry.path)
+            signature = _signature(entry.path)
+            known = self._known.get(entry.path)
+            if signature is not None and (known is None or known[1] != signature):
+                self._mark(entry, signature, now)
+        for path in self._known.keys() - seen:
+            self._forget(path)
+
+    def _collect_events(self, now: float) -> None:
+        """Valuta i percorsi segnalati dagli eventi dall'ultimo controllo."""
+        with self._events_lock:
+            paths, self._events = self._events, set()
+            rescan, self._rescan = self._rescan, False
+        if rescan:
+            # Una cartella creata o spostata: i suoi file non hanno eventi propri
+            self._collect_polling(now)
+            return
+
+        for entry in scan_paths(self.input_dir, paths, **self._scan_options):
+            signature = _signature(entry.path)
+            known = self._known.get(entry.path)
+            if signature is not None and (known is None or known[1] != signature):
+                self._mark(entry, signature, now)
+        for path in paths:
+            if not os.path.exists(path):
+                # Stessa forma dei percorsi di scan_images
+                relative = os.path.relpath(path, self.input_dir)
+                self._forget(os.path.join(self.input_dir, *relative.split(os.sep)))
+
+    def _mark(self, entry: ScanEntry, signature: Signature, now: float) -> None:
+        """Segna un file come cambiato (il timer riparte solo se la firma è diversa)."""
+        dirty = self._dirty.get(entry.path)
+        if dirty is None or dirty[0] != signature:
+            self._dirty[entry.path] = (signature, now)
+        if entry.path not in self._known:
+            self._known[entry.path] = (entry, None)
+
+    def _forget(self, path: str) -> None:
+        self._known.pop(path, None)
+        self._dirty.pop(path, None)
+
+    def _stable_files(self, now: float) -> List[Tuple[str, ScanEntry]]:
+        """Toglie dall'attesa e restituisce i file invariati da almeno `debounce` secondi."""
+        stable = []
+        for path, (signature, since) in list(self._dirty.items()):
+            current = _signature(path)
+            if current is None:
+                self._forget(path)
+            elif current != signature:
+                self._dirty[path] = (current, now)
+            elif now - since >= self.debounce:
+                del self._dirty[path]
+                entry = self._known[path][0]
+                self._known[path] = (entry, current)
+                stable.append((path, entry))
+        return stable
+
+    def _start_observer(self):
+        """Avvia watchdog sulla cartella di input (None se non è installato o non parte)."""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logging.debug("watchdog non installato: uso il polling")
+            return None
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = [event.src_path, getattr(event, 'dest_path', '')]
+                with watcher._events_lock:
+                    if event.is_directory:
+                        # La modifica di una cartella segue quella dei suoi file
+                        if event.event_type != 'modified':
+                            watcher._rescan = True
+                        return
+                    watcher._events.update(os.fsdecode(path) for path in paths if path)
+
+        observer = Observer()
+        try:
+            observer.schedule(_Handler(), self.input_dir,
+                              recursive=bool(self._scan_options['recursive']))
+            observer.start()
+        except OSError as e:
+            # Es. limite di inotify raggiunto
+            logging.warning(f"Eventi del filesystem non disponibili ({e}): uso il polling")
+            return None
+        return observer
+
+
+def _signature(path: str) -> Optional[Signature]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,102 @@
+"""
+Modulo per generare un archivio ZIP in streaming, senza scriverlo su disco
+(o scriverlo su file in un solo passaggio, per inviarlo con sendfile).
+"""
+
+import os
+import threading
+import zipfile
+from typing import Iterable, Iterator, List, Tuple
+
+
+# Formati già compressi: ricomprimerli costa CPU senza ridurre la dimensione
+STORED_EXTS = {'jpg', 'jpeg', 'png', 'gif'}
+
+# Dimensione dei blocchi letti dai file e restituiti al client
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkBuffer:
+    """
+    Destinazione non seekable per zipfile: accumula i byte scritti finché
+    il generatore non li consegna.
+
+    Senza seek/tell zipfile scrive i dati di ogni file seguiti da un data
+    descriptor, quindi l'archivio può essere prodotto in un solo passaggio.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def compress_type_for(name: str) -> int:
+    """ZIP_STORED per i formati già compressi, ZIP_DEFLATED per gli altri."""
+    ext = os.path.splitext(name)[1][1:].lower()
+    return zipfile.ZIP_STORED if ext in STORED_EXTS else zipfile.ZIP_DEFLATED
+
+
+def iter_zip(files: Iterable[Tuple[str, str]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Genera un archivio ZIP a blocchi, leggendo ogni file una sola volta.
+
+    Args:
+        files: Coppie (percorso su disco, nome nell'archivio)
+        chunk_size: Byte letti per volta da ogni file
+
+    Yields:
+        Blocchi consecutivi dell'archivio
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for path, arcname in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = compress_type_for(arcname)
+            with open(path, 'rb') as src, archive.open(info, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield from buffer.drain()
+            yield from buffer.drain()
+    yield from buffer.drain()
+
+
+def write_zip(files: Iterable[Tuple[str, str]], path: str) -> int:
+    """
+    Scrive l'archivio di iter_zip in un file (scrittura atomica: file
+    temporaneo più rename).
+
+    Args:
+        files: Coppie (percorso su disco, nome nell'archivio)
+        path: File ZIP da creare
+
+    Returns:
+        Dimensione dell'archivio in byte
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter_zip(files):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
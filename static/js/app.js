@@ -10,6 +10,8 @@ document.addEventListener('DOMContentLoaded', function() {
     const imagesPreview = document.getElementById('imagesPreview');
     const processBtn = document.getElementById('processBtn');
     const loadingSpinner = document.getElementById('loadingSpinner');
+    const loadingText = document.getElementById('loadingText');
+    const progressBar = document.getElementById('progressBar');
     const resultsSection = document.getElementById('resultsSection');
     const resultsContent = document.getElementById('resultsContent');
     const downloadSection = document.getElementById('downloadSection');
@@ -20,9 +22,26 @@ document.addEventListener('DOMContentLoaded', function() {
     // Variable to store all selected images
     let selectedImages = [];
 
+    // Filtro di Bloom dei codici della mappa selezionata (null finché non è pronto)
+    let mappingFilter = null;
+
+    // Intervallo tra due richieste di stato del job (ms)
+    const POLL_INTERVAL = 1000;
+
+    // Upload a blocchi: dimensione dei blocchi, blocchi inviati in parallelo
+    // e tentativi per blocco prima di arrendersi
+    const CHUNK_SIZE = 8 * 1024 * 1024;
+    const PARALLEL_CHUNKS = 4;
+    const CHUNK_RETRIES = 3;
+
     // Event listeners per le anteprime dei file
     mappingFile.addEventListener('change', function() {
         updateFilePreview(this, mappingPreview, 'mapping');
+        mappingFilter = null;
+        updateImagesPreview();
+        if (this.files[0]) {
+            loadMappingFilter(this.files[0]).catch(error => console.error('Errore:', error));
+        }
     });
 
     imageFiles.addEventListener('change', function() {
@@ -48,7 +67,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Event listener per il download
     downloadBtn.addEventListener('click', function(e) {
         e.preventDefault();
-        window.location.href = '/download';
+        // Ogni upload ha il suo URL di download (vedi showResults)
+        window.location.href = downloadBtn.href;
     });
 
     /**
@@ -113,27 +133,47 @@ document.addEventListener('DOMContentLoaded', function() {
         processBtn.textContent = 'Elaborazione in corso...';
 
         try {
-            // Prepara i dati per l'upload
-            const formData = new FormData();
-            formData.append('mapping_file', mappingFile.files[0]);
-            
-            // Aggiungi tutte le immagini selezionate
-            selectedImages.forEach(file => {
-                formData.append('images', file);
-            });
+            // Invia i file a blocchi; alla fine il server avvia il job e
+            // risponde subito con il suo ID
+            updateProgress('Caricamento file di mapping', 0);
+            const mapping = await registerMapping(mappingFile.files[0]);
+            if (!mapping.mapping_id) {
+                showError(mapping.error || 'Errore nel file di mapping.');
+                return;
+            }
 
-            // Invia la richiesta
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
+            // Le immagini il cui codice non è nella mappa non vengono caricate
+            if (!mappingFilter) {
+                await loadMappingFilter(mappingFile.files[0]);
+            }
+            const imagesToUpload = selectedImages.filter(isMapped);
+            const skippedBeforeUpload = selectedImages.length - imagesToUpload.length;
+            if (imagesToUpload.length === 0) {
+                showError('Nessuna immagine corrisponde ai codici della mappa.');
+                return;
+            }
 
-            const result = await response.json();
+            updateProgress('Caricamento file', 0);
+            const upload = await uploadInChunks(mapping.mapping_id, imagesToUpload);
 
-            if (response.ok && result.success) {
-                showResults(result);
+            if (!upload.success) {
+                showError(upload.error || 'Errore sconosciuto durante il processamento.');
+                return;
+            }
+
+            // Attendi il completamento controllando lo stato del job
+            const job = await waitForJob(upload.status_url);
+            if (job.status === 'done') {
+                showResults({
+                    message: 'Processamento completato con successo!',
+                    stats: {
+                        ...job.stats,
+                        skipped: job.stats.skipped + skippedBeforeUpload
+                    },
+                    download_url: job.download_url
+                });
             } else {
-                showError(result.error || 'Errore sconosciuto durante il processamento.');
+                showError(job.error || 'Errore sconosciuto durante il processamento.');
             }
 
         } catch (error) {
@@ -147,6 +187,212 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    /**
+     * Registra il file di mapping sul server (/mappings) e ne restituisce l'ID.
+     *
+     * L'ID viene ricordato in localStorage: lo stesso catalogo non viene
+     * ricaricato finché il server lo conosce.
+     */
+    async function registerMapping(file) {
+        const mappingKey = `mapping:${file.name}:${file.size}:${file.lastModified}`;
+        const savedId = localStorage.getItem(mappingKey);
+        if (savedId) {
+            const response = await fetch(`/mappings/${savedId}`);
+            if (response.ok) {
+                return await response.json();
+            }
+        }
+
+        const formData = new FormData();
+        formData.append('mapping_file', file);
+        const response = await fetch('/mappings', { method: 'POST', body: formData });
+        const mapping = await response.json();
+        if (response.ok) {
+            localStorage.setItem(mappingKey, mapping.mapping_id);
+        }
+        return mapping;
+    }
+
+    /**
+     * Registra la mappa e scarica il filtro di Bloom dei suoi codici
+     */
+    async function loadMappingFilter(file) {
+        const mapping = await registerMapping(file);
+        if (!mapping.mapping_id) {
+            return;
+        }
+        const response = await fetch(`/mappings/${mapping.mapping_id}/bloom`);
+        if (response.ok && mappingFile.files[0] === file) {
+            mappingFilter = createBloomFilter(await response.json());
+            updateImagesPreview();
+        }
+    }
+
+    /**
+     * Filtro di Bloom restituito dal server (vedi renamer/bloom.py): FNV-1a a
+     * 32 bit con due basi, posizione i-esima (h1 + i * h2) mod m
+     */
+    function createBloomFilter(data) {
+        const bits = Uint8Array.from(atob(data.bits), c => c.charCodeAt(0));
+        const encoder = new TextEncoder();
+        return {
+            has(key) {
+                const bytes = encoder.encode(key);
+                const h1 = fnv1a32(bytes, 2166136261);
+                const h2 = fnv1a32(bytes, 0x9747B28C);
+                for (let i = 0; i < data.hash_count; i++) {
+                    const position = (h1 + i * h2) % data.size_bits;
+                    if (!(bits[position >> 3] & (1 << (position & 7)))) {
+                        return false;
+                    }
+                }
+                return true;
+            }
+        };
+    }
+
+    function fnv1a32(bytes, offset) {
+        let hash = offset >>> 0;
+        for (const byte of bytes) {
+            hash = Math.imul(hash ^ byte, 16777619) >>> 0;
+        }
+        return hash;
+    }
+
+    /**
+     * True se il codice dell'immagine (nome senza estensione) può essere nella
+     * mappa; senza filtro tutte le immagini vengono caricate
+     */
+    function isMapped(file) {
+        if (!mappingFilter) {
+            return true;
+        }
+        const dot = file.name.lastIndexOf('.');
+        return mappingFilter.has(dot > 0 ? file.name.slice(0, dot) : file.name);
+    }
+
+    /**
+     * Carica le immagini con il protocollo a blocchi (/uploads), usando una
+     * mappa già registrata.
+     *
+     * La sessione viene ricordata in localStorage: se la pagina viene
+     * ricaricata o la rete cade, rinviando la stessa selezione si inviano
+     * solo i blocchi che il server non ha ancora ricevuto.
+     */
+    async function uploadInChunks(mappingId, images) {
+        const files = images;
+        const sessionKey = `upload:${mappingId}:` + files.map(f => `${f.name}:${f.size}:${f.lastModified}`).join('|');
+
+        let session = null;
+        const savedId = localStorage.getItem(sessionKey);
+        if (savedId) {
+            const response = await fetch(`/uploads/${savedId}`);
+            if (response.ok) {
+                session = await response.json();
+            }
+        }
+        if (!session) {
+            const response = await fetch('/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    mapping_id: mappingId,
+                    images: images.map(f => ({ name: f.name, size: f.size })),
+                    chunk_size: CHUNK_SIZE
+                })
+            });
+            session = await response.json();
+            if (!response.ok) {
+                return { success: false, error: session.error };
+            }
+            localStorage.setItem(sessionKey, session.upload_id);
+        }
+
+        // Blocchi da inviare e byte già presenti sul server
+        const chunkSize = session.chunk_size;
+        const queue = [];
+        const totalBytes = files.reduce((sum, f) => sum + f.size, 0);
+        let sentBytes = totalBytes;
+        session.files.forEach(entry => {
+            entry.missing.forEach(chunk => {
+                const start = chunk * chunkSize;
+                const end = Math.min(start + chunkSize, entry.size);
+                queue.push({ file: entry.index, chunk, start, end });
+                sentBytes -= end - start;
+            });
+        });
+
+        const baseUrl = `/uploads/${session.upload_id}`;
+        async function sendChunk(task) {
+            const body = files[task.file].slice(task.start, task.end);
+            for (let attempt = 1; ; attempt++) {
+                try {
+                    const response = await fetch(`${baseUrl}/files/${task.file}/chunks/${task.chunk}`, {
+                        method: 'PUT',
+                        headers: { 'Content-Type': 'application/octet-stream' },
+                        body
+                    });
+                    if (response.ok) {
+                        return;
+                    }
+                    if (attempt >= CHUNK_RETRIES) {
+                        throw new Error((await response.json()).error);
+                    }
+                } catch (error) {
+                    if (attempt >= CHUNK_RETRIES) {
+                        throw error;
+                    }
+                }
+            }
+        }
+
+        // PARALLEL_CHUNKS invii contemporanei che prendono blocchi dalla coda
+        async function worker() {
+            while (queue.length > 0) {
+                const task = queue.shift();
+                await sendChunk(task);
+                sentBytes += task.end - task.start;
+                updateProgress('Caricamento file', Math.floor(sentBytes * 100 / Math.max(totalBytes, 1)));
+            }
+        }
+        await Promise.all(Array.from({ length: PARALLEL_CHUNKS }, worker));
+
+        const response = await fetch(`${baseUrl}/finalize`, { method: 'POST' });
+        const result = await response.json();
+        if (response.ok) {
+            localStorage.removeItem(sessionKey);
+        }
+        return result.success ? result : { success: false, error: result.error };
+    }
+
+    /**
+     * Controlla lo stato del job finché non termina (done o failed)
+     */
+    async function waitForJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+
+            if (!response.ok) {
+                return { status: 'failed', error: job.error };
+            }
+            if (job.status === 'done' || job.status === 'failed') {
+                return job;
+            }
+
+            updateProgress(job.stage, job.percent);
+            await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL));
+        }
+    }
+
+    /**
+     * Aggiorna il testo e la barra di avanzamento
+     */
+    function updateProgress(stage, percent) {
+        loadingText.textContent = `${stage} (${percent}%)`;
+        progressBar.style.width = `${percent}%`;
+    }
+
     /**
      * Mostra la sezione di loading
      */
@@ -306,10 +552,19 @@ document.addEventListener('DOMContentLoaded', function() {
                 `<br><small>Dalla cartella: ${folderPaths[0]}</small>`;
         }
 
+        let mappingInfo = '';
+        if (mappingFilter) {
+            const unmapped = selectedImages.length - selectedImages.filter(isMapped).length;
+            mappingInfo = unmapped > 0 ?
+                `<br><small>${unmapped} immagini senza codice nella mappa non verranno caricate</small>` :
+                `<br><small>Tutte le immagini hanno un codice nella mappa</small>`;
+        }
+
         imagesPreview.innerHTML = `
             <strong>Immagini selezionate:</strong> ${selectedImages.length} file
             (${formatFileSize(totalSize)})
             ${pathInfo}
+            ${mappingInfo}
             <br><small>File: ${selectedImages.slice(0, 5).map(f => f.name).join(', ')}${selectedImages.length > 5 ? '...' : ''}</small>
         `;
     }
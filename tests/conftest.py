@@ -0,0 +1,11 @@
+"""Fixture comuni ai test."""
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Cache delle mappe e degli hash nella cartella del test, non in ~/.cache."""
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('IMAGE_RENAMER_CACHE_DIR', str(path))
+    return path
@@ -0,0 +1,33 @@
+"""Funzioni di supporto per preparare e confrontare cartelle di immagini."""
+
+import os
+from pathlib import Path
+from typing import Dict
+
+
+def write_files(root: Path, files: Dict[str, bytes]) -> None:
+    """Crea i file {percorso relativo: contenuto} sotto `root`."""
+    for relative, content in files.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+
+def read_tree(root: Path) -> Dict[str, bytes]:
+    """Contenuto dei file sotto `root`, per percorso relativo (esclusi journal e staging)."""
+    tree = {}
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in filenames:
+            if name.startswith('.'):
+                continue
+            path = Path(directory) / name
+            tree[path.relative_to(root).as_posix()] = path.read_bytes()
+    return tree
+
+
+def write_mapping(path: Path, pairs, delimiter: str = ',', encoding: str = 'utf-8') -> Path:
+    """Scrive un CSV di mapping CodeX/CodeY."""
+    lines = [f"CodeX{delimiter}CodeY"] + [f"{a}{delimiter}{b}" for a, b in pairs]
+    path.write_bytes(('\n'.join(lines) + '\n').encode(encoding))
+    return path
@@ -0,0 +1,50 @@
+"""CompactMap: costruzione da dizionario, salvataggio e riapertura in mmap."""
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from renamer.compact_map import CompactMap  # noqa: E402
+from renamer.mapping import build_bidirectional_map  # noqa: E402
+
+
+MAPPING = build_bidirectional_map(
+    ['IMG001', 'IMG002', 'CAFÉ03', 'A', 'IMG-LONG-CODE-0004'],
+    ['PRD001', 'PRD002', 'PRD003', 'A', 'Z'],
+).mapping
+
+
+def test_from_dict_behaves_like_the_dict():
+    compact = CompactMap.from_dict(MAPPING)
+    assert len(compact) == len(MAPPING)
+    assert dict(compact) == MAPPING
+    assert compact['CAFÉ03'] == 'PRD003'
+    assert compact['Z'] == 'IMG-LONG-CODE-0004'
+    assert 'IMG999' not in compact
+    assert compact.get('IMG999') is None
+    with pytest.raises(KeyError):
+        compact['IMG999']
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / 'map.bin'
+    CompactMap.from_dict(MAPPING).save(str(path))
+    loaded = CompactMap.load(str(path))
+    assert dict(loaded) == MAPPING
+    assert sorted(loaded) == sorted(MAPPING)
+    assert all(loaded[loaded[code]] == code for code in MAPPING)
+
+
+def test_empty_map_round_trip(tmp_path):
+    path = tmp_path / 'empty.bin'
+    CompactMap.from_dict({}).save(str(path))
+    assert len(CompactMap.load(str(path))) == 0
+
+
+def test_invalid_input_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        CompactMap.from_dict({'IMG001': 'PRD001'})
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'not a compact map')
+    with pytest.raises(ValueError):
+        CompactMap.load(str(path))
@@ -0,0 +1,58 @@
+"""Rilevamento di separatore e codifica dei CSV e lettura con i due motori."""
+
+import codecs
+
+import pytest
+
+from renamer.csv_map import CSV_ENGINES, detect_csv_dialect, load_map_from_csv
+
+
+PAIRS = [('IMG001', 'PRD001'), ('CAFÉ02', 'PRD002'), ('IMG003', 'ÀÈÌ003')]
+
+
+def _write(path, delimiter, encoding, bom=False):
+    lines = [f"CodeX{delimiter}CodeY"] + [f"{a}{delimiter}{b}" for a, b in PAIRS]
+    data = ('\r\n'.join(lines) + '\r\n').encode(encoding)
+    path.write_bytes(codecs.BOM_UTF8 + data if bom else data)
+    return path
+
+
+@pytest.mark.parametrize('delimiter', [',', ';', '\t'])
+@pytest.mark.parametrize('encoding, bom, expected', [
+    ('utf-8', False, 'utf-8'),
+    ('utf-8', True, 'utf-8-sig'),
+    ('cp1252', False, 'cp1252'),
+])
+def test_detect_dialect(tmp_path, delimiter, encoding, bom, expected):
+    path = _write(tmp_path / 'map.csv', delimiter, encoding, bom)
+    dialect = detect_csv_dialect(str(path))
+    assert dialect.delimiter == delimiter
+    assert dialect.encoding == expected
+    assert dialect.columns == ['CodeX', 'CodeY']
+
+
+@pytest.mark.parametrize('engine', CSV_ENGINES)
+@pytest.mark.parametrize('delimiter, encoding', [(';', 'cp1252'), ('\t', 'utf-8')])
+def test_engines_read_the_same_map(tmp_path, engine, delimiter, encoding):
+    path = _write(tmp_path / 'map.csv', delimiter, encoding)
+    result = load_map_from_csv(str(path), engine=engine)
+    expected = {a: b for a, b in PAIRS}
+    expected.update({b: a for a, b in PAIRS})
+    assert result.mapping == expected
+    assert result.dialect.delimiter == delimiter
+
+
+def test_engines_agree_on_missing_values_and_duplicates(tmp_path):
+    path = tmp_path / 'map.csv'
+    path.write_text('CodeX,CodeY\nA1,B1\nNA,B2\nA3,\n\nA1,B1\nA4, B4 \nB1,C1\n', encoding='utf-8')
+    results = [load_map_from_csv(str(path), engine=engine) for engine in CSV_ENGINES]
+    assert results[0].mapping == results[1].mapping
+    assert results[0].duplicates == results[1].duplicates
+    assert results[0].mapping == {'A1': 'B1', 'B1': 'A1', 'A4': 'B4', 'B4': 'A4'}
+
+
+def test_single_column_is_rejected(tmp_path):
+    path = tmp_path / 'map.csv'
+    path.write_text('CodeX\nA1\n', encoding='utf-8')
+    with pytest.raises(ValueError, match='almeno 2 colonne'):
+        detect_csv_dialect(str(path))
@@ -0,0 +1,71 @@
+"""La lettura in streaming dei file .xlsx deve dare la stessa mappa di pandas.read_excel."""
+
+import datetime
+
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+
+from renamer import excel_map  # noqa: E402
+
+
+ROWS = [
+    ('IMG001', 'PRD001'),
+    (1001, 'PRD002'),            # intero
+    (1002.0, 'PRD003'),          # float intero: '1002' come in read_excel
+    ('  IMG004 ', 12.5),         # spazi e float non intero
+    ('IMG005', None),            # cella vuota
+    (None, None),
+    ('IMG001', 'PRD001'),        # duplicato
+    ('IMG006', 'PRD001'),        # conflitto
+    ('IMG007', datetime.datetime(2024, 3, 1)),
+    ('IMG008', 'PRD008'),
+]
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    # Workbook normale (non write_only): le stringhe finiscono nella tabella
+    # condivisa, come nei file salvati da Excel
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Note', 'CodeX', 'CodeY'])
+    for number, (code_x, code_y) in enumerate(ROWS):
+        sheet.append([f"riga {number}", code_x, code_y])
+    path = tmp_path / 'catalogo.xlsx'
+    workbook.save(path)
+    return path
+
+
+@pytest.mark.parametrize('batch_rows', [3, excel_map.STREAM_BATCH_ROWS])
+def test_streaming_matches_read_excel(workbook_path, monkeypatch, batch_rows):
+    expected = excel_map.load_map(str(workbook_path), streaming=False)
+    monkeypatch.setattr(excel_map, 'STREAM_BATCH_ROWS', batch_rows)
+    streamed = excel_map.load_map(str(workbook_path), streaming=True)
+    assert streamed.mapping == expected.mapping
+    assert streamed.duplicates == expected.duplicates
+    assert streamed.mapping['1002'] == 'PRD003'
+    assert streamed.mapping['IMG004'] == '12.5'
+
+
+def test_streaming_finds_header_below_title_rows(tmp_path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Catalogo primavera'])
+    sheet.append([])
+    sheet.append(['CodeY', 'CodeX'])
+    sheet.append(['PRD001', 'IMG001'])
+    path = tmp_path / 'catalogo.xlsx'
+    workbook.save(path)
+    assert excel_map.build_map(str(path), streaming=True) == {'IMG001': 'PRD001', 'PRD001': 'IMG001'}
+
+
+def test_missing_columns_are_reported(tmp_path):
+    workbook = openpyxl.Workbook()
+    workbook.active.append(['Codice', 'CodeY'])
+    workbook.active.append(['IMG001', 'PRD001'])
+    path = tmp_path / 'catalogo.xlsx'
+    workbook.save(path)
+    for streaming in (False, True):
+        with pytest.raises(ValueError, match='Colonne mancanti'):
+            excel_map.load_map(str(path), streaming=streaming)
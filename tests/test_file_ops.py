@@ -0,0 +1,153 @@
+"""process_images, transfer_file e apply_plan sul filesystem di una cartella temporanea."""
+
+import os
+
+import pytest
+
+from renamer.file_ops import (DEDUP, TRANSFER_MODES, ProcessOptions, apply_plan, process_images,
+                              transfer_file)
+from renamer.plan import PlanReader, PlanWriter
+
+from .helpers import read_tree, write_files
+
+
+MAPPING = {
+    'p1': 'T1', 'T1': 'p1',
+    'p2': 'T1', 'p3': 'T3', 'T3': 'p3',
+    'p5': 'T5', 'T5': 'p5',
+}
+
+SOURCES = {
+    'p1.jpg': b'uno',
+    'p2.jpg': b'due',
+    'p3.jpg': b'tre',
+    'p4.jpg': b'senza codice',
+    'p5.jpg': b'cinque',
+}
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    path = tmp_path / 'input'
+    write_files(path, SOURCES)
+    return path
+
+
+@pytest.mark.parametrize('mode', TRANSFER_MODES)
+def test_transfer_never_replaces_an_existing_destination(tmp_path, mode):
+    source = tmp_path / 'source.jpg'
+    dest = tmp_path / 'dest.jpg'
+    source.write_bytes(b'nuovo')
+    dest.write_bytes(b'esistente')
+
+    with pytest.raises(FileExistsError):
+        transfer_file(source, dest, mode)
+    assert dest.read_bytes() == b'esistente'
+    assert source.read_bytes() == b'nuovo'
+
+    transfer_file(source, dest, mode, overwrite=True)
+    assert dest.read_bytes() == b'nuovo'
+    assert os.path.lexists(source) == (mode != 'move')
+
+
+def test_transfer_rejects_unknown_mode(tmp_path):
+    source = tmp_path / 'source.jpg'
+    source.write_bytes(b'x')
+    with pytest.raises(ValueError):
+        transfer_file(source, tmp_path / 'dest.jpg', 'teleport')
+
+
+def test_names_and_conflicts(input_dir, tmp_path):
+    output = tmp_path / 'output'
+    write_files(output, {'T3.jpg': b'gia presente'})
+    report = process_images(MAPPING, str(input_dir), str(output), ProcessOptions(exts=['jpg']))
+
+    assert tuple(report) == (4, 1, 0)
+    assert read_tree(output) == {
+        'T1.jpg': b'uno',
+        'T1_1.jpg': b'due',
+        'T3.jpg': b'gia presente',
+        'T3_1.jpg': b'tre',
+        'T5.jpg': b'cinque',
+    }
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_journal_resume_skips_completed_files(input_dir, tmp_path, workers):
+    output = tmp_path / 'output'
+    options = ProcessOptions(exts=['jpg'], journal=True, workers=workers)
+    process_images(MAPPING, str(input_dir), str(output), options)
+    expected = read_tree(output)
+
+    # Esecuzione interrotta: un file mai scritto, uno scritto a metà
+    (output / 'T1_1.jpg').unlink()
+    (output / 'T3.jpg').write_bytes(b't')
+    untouched = {name: (output / name).stat().st_mtime_ns for name in ('T1.jpg', 'T5.jpg')}
+
+    report = process_images(MAPPING, str(input_dir), str(output), options)
+    assert report.processed == 2
+    assert report.unchanged == 2
+    assert read_tree(output) == expected
+    assert {name: (output / name).stat().st_mtime_ns for name in untouched} == untouched
+
+
+def test_dedup_finds_identical_variant_after_a_gap(tmp_path):
+    input_dir = tmp_path / 'input'
+    output = tmp_path / 'output'
+    write_files(input_dir, {'p1.jpg': b'contenuto'})
+    # Stessa dimensione ma contenuto diverso in A.jpg, nessun A_1.jpg
+    write_files(output, {'A.jpg': b'CONTENUTO', 'A_2.jpg': b'contenuto'})
+
+    report = process_images({'p1': 'A', 'A': 'p1'}, str(input_dir), str(output),
+                            ProcessOptions(exts=['jpg'], dedup=True))
+    assert report.unchanged == 1
+    assert sorted(read_tree(output)) == ['A.jpg', 'A_2.jpg']
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_dedup_links_identical_sources(tmp_path, workers):
+    input_dir = tmp_path / 'input'
+    output = tmp_path / 'output'
+    write_files(input_dir, {'p1.jpg': b'stesso', 'p2.jpg': b'stesso', 'p3.jpg': b'STESSO'})
+    mapping = {'p1': 'A', 'A': 'p1', 'p2': 'B', 'B': 'p2', 'p3': 'C', 'C': 'p3'}
+
+    report = process_images(mapping, str(input_dir), str(output),
+                            ProcessOptions(exts=['jpg'], dedup=True, workers=workers))
+    assert report.mode_counts() == {'copy': 2, DEDUP: 1}
+    assert os.path.samefile(output / 'A.jpg', output / 'B.jpg')
+    assert not os.path.samefile(output / 'A.jpg', output / 'C.jpg')
+    assert read_tree(output)['C.jpg'] == b'STESSO'
+
+
+def test_plan_then_apply_gives_the_same_tree(input_dir, tmp_path):
+    write_files(input_dir, {'sub/p6.jpg': b'sei'})
+    mapping = dict(MAPPING, p6='T1', T6='p6')
+    existing = {'T3.jpg': b'gia presente'}
+    options = ProcessOptions(exts=['jpg'], recursive=True, mirror=True)
+
+    direct = tmp_path / 'direct'
+    write_files(direct, existing)
+    process_images(mapping, str(input_dir), str(direct), options)
+
+    planned = tmp_path / 'planned'
+    write_files(planned, existing)
+    plan_path = tmp_path / 'plan.jsonl.gz'
+    writer = PlanWriter(str(plan_path), str(input_dir), str(planned), options.mode, mirror=True)
+    report = process_images(mapping, str(input_dir), str(planned),
+                            ProcessOptions(exts=['jpg'], recursive=True, mirror=True, dry_run=True),
+                            plan=writer)
+    writer.finish(report)
+    assert read_tree(planned) == existing
+    reader = PlanReader(str(plan_path))
+    assert reader.total == 6
+    reader.close()
+
+    applied = apply_plan(str(plan_path), workers=4)
+    assert tuple(applied) == tuple(report)
+    assert read_tree(planned) == read_tree(direct)
+
+    # Lo stesso piano su un'altra cartella di output con lo stesso contenuto
+    elsewhere = tmp_path / 'elsewhere'
+    write_files(elsewhere, existing)
+    apply_plan(str(plan_path), output_dir=str(elsewhere))
+    assert read_tree(elsewhere) == read_tree(direct)
@@ -0,0 +1,79 @@
+"""MapBuilder: add (vettoriale) e add_rows (riga per riga) devono dare lo stesso risultato."""
+
+import pytest
+
+from renamer.mapping import (REASON_CONFLICT, REASON_CROSS_COLUMN, REASON_DUPLICATE,
+                             MapBuilder, build_bidirectional_map)
+
+
+ROWS = [
+    ('A1', 'B1'),
+    ('A2', 'B2'),
+    ('A1', 'B1'),      # stessa coppia
+    ('A1', 'B9'),      # A1 è già associato a B1
+    ('B2', 'C2'),      # B2 compare già nella colonna B
+    (None, 'B3'),      # valore mancante: saltata ma contata
+    (' A3 ', 'B3 '),   # spazi ai bordi
+    ('A4', 'A4'),      # stesso codice nelle due colonne
+    ('A5', 'B5'),
+    ('B5', 'A5'),      # coppia invertita
+    ('A6', None),
+    ('A7', 'B1'),      # B1 è già associato ad A1
+    ('C2', 'A8'),
+]
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _with_add(size):
+    builder = MapBuilder()
+    for chunk in _chunks(ROWS, size):
+        builder.add([a for a, _ in chunk], [b for _, b in chunk])
+    return builder.result()
+
+
+def _with_add_rows(size):
+    builder = MapBuilder()
+    for chunk in _chunks(ROWS, size):
+        builder.add_rows(chunk)
+    return builder.result()
+
+
+@pytest.mark.parametrize('size', [1, 3, len(ROWS)])
+def test_add_and_add_rows_agree(size):
+    expected = _with_add_rows(len(ROWS))
+    assert _with_add(size).mapping == expected.mapping
+    assert _with_add(size).duplicates == expected.duplicates
+    assert _with_add_rows(size).mapping == expected.mapping
+    assert _with_add_rows(size).duplicates == expected.duplicates
+
+
+def test_rejected_rows_keep_file_order_and_reason():
+    result = _with_add(4)
+    reasons = {(row.row, row.code_a, row.code_b): row.reason for row in result.duplicates}
+    assert reasons == {
+        (2, 'A1', 'B1'): REASON_DUPLICATE,
+        (3, 'A1', 'B9'): REASON_CONFLICT,
+        (4, 'B2', 'C2'): REASON_CROSS_COLUMN,
+        (9, 'B5', 'A5'): REASON_DUPLICATE,
+        (11, 'A7', 'B1'): REASON_CONFLICT,
+    }
+    assert result.mapping['A3'] == 'B3' and result.mapping['B3'] == 'A3'
+    assert result.mapping['A4'] == 'A4'
+    assert result.mapping['C2'] == 'A8'
+    assert 'A6' not in result.mapping
+
+
+def test_add_normalizes_numeric_codes():
+    result = build_bidirectional_map([123.0, 'X1', 7], ['P1', 4.5, 'P7'])
+    assert result.mapping['123'] == 'P1'
+    assert result.mapping['X1'] == '4.5'
+    assert result.mapping['7'] == 'P7'
+
+
+def test_add_rejects_columns_of_different_length():
+    with pytest.raises(ValueError):
+        MapBuilder().add(['A1', 'A2'], ['B1'])
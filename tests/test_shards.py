@@ -0,0 +1,134 @@
+"""Esecuzione a shard: N shard più il merge danno lo stesso output di un'esecuzione singola."""
+
+import os
+
+import pytest
+
+from renamer import shards
+from renamer.file_ops import ProcessOptions, process_images, run_sharded
+from renamer.shards import merge_shards, parse_shard
+
+from .helpers import read_tree, write_files
+
+
+def _catalog(tmp_path, explicit_suffixes=False):
+    """
+    30 immagini su 10 codici target (con conflitti _N); con explicit_suffixes
+    anche codici target uguali ai nomi _1 generati per gli altri.
+    """
+    input_dir = tmp_path / 'input'
+    mapping = {}
+    files = {}
+    for i in range(30):
+        files[f"p{i:02}.jpg"] = f"immagine {i}".encode()
+        mapping[f"p{i:02}"] = f"T{i % 10}"
+    if explicit_suffixes:
+        for i in range(10):
+            files[f"q{i}.jpg"] = f"esplicito {i}".encode()
+            mapping[f"q{i}"] = f"T{i}_1"
+    files['senza-codice.jpg'] = b'-'
+    write_files(input_dir, files)
+    return input_dir, mapping
+
+
+def _names(tree):
+    """Contenuti in output con il nome base (prima del suffisso _N) di ciascuno."""
+    return sorted((content, name.split('_')[0]) for name, content in tree.items())
+
+
+@pytest.mark.parametrize('count', [1, 3, 4])
+def test_shards_and_merge_match_single_run(tmp_path, count):
+    input_dir, mapping = _catalog(tmp_path)
+    options = ProcessOptions(exts=['jpg'])
+
+    single = tmp_path / 'single'
+    expected = process_images(mapping, str(input_dir), str(single), options)
+
+    sharded = tmp_path / 'sharded'
+    for index in range(1, count + 1):
+        process_images(mapping, str(input_dir), str(sharded), options,
+                       shard=(index, count), run_id='test')
+    merged = merge_shards(str(sharded), count, run_id='test')
+
+    assert tuple(merged) == tuple(expected)
+    assert not (sharded / shards.SHARDS_DIR).exists()
+    assert read_tree(sharded) == read_tree(single)
+    assert sorted(os.path.relpath(op.destination, sharded) for op in merged.operations) == \
+        sorted(read_tree(single))
+
+
+def test_target_equal_to_a_generated_name_is_renamed_on_merge(tmp_path):
+    input_dir, mapping = _catalog(tmp_path, explicit_suffixes=True)
+    count = 3
+    options = ProcessOptions(exts=['jpg'])
+
+    single = tmp_path / 'single'
+    expected = process_images(mapping, str(input_dir), str(single), options)
+
+    sharded = tmp_path / 'sharded'
+    for index in range(1, count + 1):
+        process_images(mapping, str(input_dir), str(sharded), options,
+                       shard=(index, count), run_id='test')
+    merged = merge_shards(str(sharded), count, run_id='test')
+
+    assert tuple(merged) == tuple(expected)
+    assert not (sharded / shards.SHARDS_DIR).exists()
+    # Stessi file, ciascuno sotto il proprio codice target: il suffisso dei
+    # nomi contesi tra shard diversi dipende dall'ordine del merge
+    assert _names(read_tree(sharded)) == _names(read_tree(single))
+    assert sorted(os.path.basename(op.destination) for op in merged.operations) == \
+        sorted(read_tree(sharded))
+
+
+def test_run_sharded_in_processes(tmp_path):
+    input_dir, mapping = _catalog(tmp_path)
+    single = tmp_path / 'single'
+    expected = process_images(mapping, str(input_dir), str(single), ProcessOptions(exts=['jpg']))
+
+    output = tmp_path / 'sharded'
+    report = run_sharded(2, mapping, str(input_dir), str(output), ProcessOptions(exts=['jpg']))
+    assert tuple(report) == tuple(expected)
+    assert read_tree(output) == read_tree(single)
+
+
+def test_interrupted_merge_reports_final_paths(tmp_path, monkeypatch):
+    # Con i codici espliciti alcuni file vengono rinominati durante il merge
+    input_dir, mapping = _catalog(tmp_path, explicit_suffixes=True)
+    output = tmp_path / 'output'
+    for index in (1, 2):
+        process_images(mapping, str(input_dir), str(output), ProcessOptions(exts=['jpg']),
+                       shard=(index, 2), run_id='test')
+
+    rename = os.rename
+    calls = []
+
+    def interrupted_rename(source, destination):
+        calls.append(destination)
+        if len(calls) == 25:
+            raise KeyboardInterrupt
+        rename(source, destination)
+
+    monkeypatch.setattr(shards.os, 'rename', interrupted_rename)
+    with pytest.raises(KeyboardInterrupt):
+        merge_shards(str(output), 2, run_id='test')
+    monkeypatch.setattr(shards.os, 'rename', rename)
+
+    report = merge_shards(str(output), 2, run_id='test')
+    destinations = [operation.destination for operation in report.operations]
+    assert len(set(destinations)) == len(destinations) == report.processed
+    assert sorted(os.path.basename(path) for path in destinations) == sorted(read_tree(output))
+
+
+def test_merge_requires_every_shard(tmp_path):
+    input_dir, mapping = _catalog(tmp_path)
+    output = tmp_path / 'output'
+    process_images(mapping, str(input_dir), str(output), ProcessOptions(exts=['jpg']),
+                   shard=(1, 2), run_id='test')
+    with pytest.raises(RuntimeError):
+        merge_shards(str(output), 2, run_id='test')
+
+
+@pytest.mark.parametrize('value', ['0/2', '3/2', '1-2', ''])
+def test_parse_shard_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
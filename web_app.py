@@ -5,32 +5,129 @@ Web App per Image Renamer - Interfaccia web semplice e funzionale.
 
 import os
 import shutil
-import zipfile
-import tempfile
+import time
+import uuid
+from functools import lru_cache
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, stream_with_context
 import logging
 
 # Import dei nostri moduli
-from renamer.csv_map import build_map_auto
-from renamer.file_ops import process_images
+from renamer.bloom import BloomFilter
+from renamer.file_ops import ProcessOptions, process_images
+from renamer.jobs import DEFAULT_JOB_WORKERS, DEFAULT_MAX_QUEUED, DONE, JobManager
+from renamer.map_registry import DEFAULT_MEMORY_BYTES, MappingRegistry
+from renamer.metrics import CONTENT_TYPE, MetricsRegistry
+from renamer.report import STAGES
+from renamer.uploads import DEFAULT_CHUNK_SIZE, DEFAULT_UPLOAD_TTL, UploadManager
+from renamer.zip_stream import iter_zip, write_zip
+
+DOWNLOAD_MODES = ('stream', 'file')
+SENDFILE_HEADERS = ('', 'X-Sendfile', 'X-Accel-Redirect')
+# Archivio dei risultati nella cartella del job (DOWNLOAD_MODE=file)
+RESULT_ZIP = 'immagini_rinominate.zip'
 
 # Configurazione Flask
 app = Flask(__name__)
+# Limite per singola richiesta: i lotti più grandi usano l'upload a blocchi
+# (/uploads), dove ogni richiesta porta un solo blocco
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max
+app.config['MAX_UPLOAD_SIZE'] = int(os.environ.get('MAX_UPLOAD_SIZE', 20 * 1024 ** 3))
+app.config['UPLOAD_TTL'] = int(os.environ.get('UPLOAD_TTL', DEFAULT_UPLOAD_TTL))
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'output'
+# Mappe registrate (una volta per catalogo) e memoria massima delle mappe
+# compilate; MAPPING_PERSIST=0 disattiva la cache su disco delle mappe
+app.config['MAPPINGS_FOLDER'] = 'mappings'
+app.config['MAPPING_MEMORY_BYTES'] = int(os.environ.get('MAPPING_MEMORY_BYTES', DEFAULT_MEMORY_BYTES))
+app.config['MAPPING_PERSIST'] = os.environ.get('MAPPING_PERSIST', '1') != '0'
+# Mappe compatte in mmap, condivise tra i processi del server (MAPPING_COMPACT=0
+# per usare dizionari in memoria)
+app.config['MAPPING_COMPACT'] = os.environ.get('MAPPING_COMPACT', '1') != '0'
+# Job eseguiti contemporaneamente e secondi dopo i quali un job terminato
+# (con il suo risultato) viene eliminato
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', DEFAULT_JOB_WORKERS))
+# Job non terminati ammessi (per processo: con gunicorn divisi tra i worker)
+app.config['JOB_MAX_QUEUED'] = int(os.environ.get('JOB_MAX_QUEUED', DEFAULT_MAX_QUEUED))
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 3600))
+# Download dei risultati: 'stream' genera lo ZIP durante l'invio, 'file' lo
+# scrive a fine job e lo invia con sendfile (default con gunicorn, vedi wsgi.py).
+# Con SENDFILE_HEADER (X-Sendfile per Apache/lighttpd, X-Accel-Redirect per
+# nginx, con SENDFILE_PREFIX come location interna che punta a OUTPUT_FOLDER)
+# l'invio del file è delegato al proxy.
+app.config['DOWNLOAD_MODE'] = os.environ.get('DOWNLOAD_MODE', 'stream')
+app.config['SENDFILE_HEADER'] = os.environ.get('SENDFILE_HEADER', '')
+app.config['SENDFILE_PREFIX'] = os.environ.get('SENDFILE_PREFIX', '/protected-output/')
+if app.config['DOWNLOAD_MODE'] not in DOWNLOAD_MODES:
+    raise ValueError(f"DOWNLOAD_MODE non valido: {app.config['DOWNLOAD_MODE']}. "
+                     f"Usa uno tra: {', '.join(DOWNLOAD_MODES)}")
+if app.config['SENDFILE_HEADER'] not in SENDFILE_HEADERS:
+    raise ValueError(f"SENDFILE_HEADER non valido: {app.config['SENDFILE_HEADER']}. "
+                     f"Usa uno tra: {', '.join(SENDFILE_HEADERS[1:])}")
 
 # Crea cartelle se non esistono
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
+# Ogni upload diventa un job con la sua cartella in OUTPUT_FOLDER
+jobs = JobManager(app.config['OUTPUT_FOLDER'], workers=app.config['JOB_WORKERS'],
+                  max_queued=app.config['JOB_MAX_QUEUED'], ttl=app.config['JOB_TTL'])
+# Registro delle mappe, condiviso da tutte le richieste del processo
+mappings = MappingRegistry(app.config['MAPPINGS_FOLDER'],
+                           max_memory_bytes=app.config['MAPPING_MEMORY_BYTES'],
+                           persist=app.config['MAPPING_PERSIST'],
+                           compact=app.config['MAPPING_COMPACT'])
+# Sessioni di upload a blocchi in UPLOAD_FOLDER
+uploads = UploadManager(app.config['UPLOAD_FOLDER'], ttl=app.config['UPLOAD_TTL'],
+                        max_bytes=app.config['MAX_UPLOAD_SIZE'])
+
+# Metriche esposte su /metrics: con METRICS_DIR (impostata da gunicorn.conf.py)
+# i valori di tutti i processi del server vengono sommati
+metrics = MetricsRegistry(os.environ.get('METRICS_DIR') or None)
+request_duration = metrics.histogram(
+    'renamer_http_request_duration_seconds', 'Durata delle richieste HTTP (fino alla risposta, '
+    'senza il corpo in streaming)', labels=('method', 'endpoint', 'status'))
+job_duration = metrics.histogram(
+    'renamer_job_duration_seconds', 'Durata dei job di rinomina', labels=('status',))
+stage_seconds = metrics.counter(
+    'renamer_stage_seconds_total', 'Secondi spesi per fase (scan, lookup, copy, zip)', labels=('stage',))
+files_total = metrics.counter(
+    'renamer_files_total', 'File esaminati dai job, per esito', labels=('outcome',))
+bytes_processed = metrics.counter(
+    'renamer_bytes_processed_total', 'Byte delle immagini rinominate dai job')
+zip_bytes = metrics.counter(
+    'renamer_zip_bytes_total', 'Byte degli archivi ZIP inviati')
+metrics.counter(
+    'renamer_mapping_cache_requests_total', 'Richieste alle cache delle mappe (memoria LRU e disco)',
+    labels=('cache', 'result'),
+    collector=lambda: {
+        ('memory', 'hit'): mappings.hits,
+        ('memory', 'miss'): mappings.misses,
+        ('disk', 'hit'): mappings.cache.hits if mappings.cache else 0,
+        ('disk', 'miss'): mappings.cache.misses if mappings.cache else 0,
+    })
+
 # Configurazione logging per produzione
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+@app.before_request
+def _start_timer():
+    metrics.start()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Etichetta con la regola (/jobs/<job_id>), non con l'URL: cardinalità limitata
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_duration.observe(time.perf_counter() - started, method=request.method,
+                                 endpoint=endpoint, status=str(response.status_code))
+    return response
+
 @app.route('/')
 def index():
     """Pagina principale dell'interfaccia."""
@@ -43,123 +140,382 @@ def test_page():
 
 @app.route('/upload', methods=['POST'])
 def upload_files():
-    """Gestisce l'upload dei file e il processamento."""
+    """
+    Riceve i file e avvia il processamento in background.
+    
+    Risponde subito con l'ID del job: lo stato si legge da /jobs/<id> e il
+    risultato si scarica da /jobs/<id>/download.
+    """
+    job = None
     try:
-        # Verifica che tutti i file necessari siano presenti
-        if 'mapping_file' not in request.files or 'images' not in request.files:
+        # Il mapping può essere un file oppure l'ID di una mappa registrata
+        mapping_id = request.form.get('mapping_id')
+        if ('mapping_file' not in request.files and not mapping_id) or 'images' not in request.files:
             logging.error("File mancanti nella richiesta")
             return jsonify({'error': 'File mancanti. Servono mapping file e immagini.'}), 400
         
-        mapping_file = request.files['mapping_file']
+        mapping_file = request.files.get('mapping_file')
         images_files = request.files.getlist('images')
         
-        logging.info(f"File mapping ricevuto: {mapping_file.filename}")
+        if mapping_id:
+            logging.info(f"Mappa registrata richiesta: {mapping_id}")
+            if mapping_id not in mappings:
+                return jsonify({'error': 'Mappa non trovata.'}), 404
+        else:
+            logging.info(f"File mapping ricevuto: {mapping_file.filename}")
         logging.info(f"Numero immagini ricevute: {len(images_files)}")
         
-        if not mapping_file.filename or not images_files:
+        if (not mapping_id and not mapping_file.filename) or not images_files:
             logging.error("Nessun file selezionato")
             return jsonify({'error': 'Nessun file selezionato.'}), 400
         
-        # Crea cartelle temporanee
-        temp_dir = tempfile.mkdtemp()
-        input_dir = os.path.join(temp_dir, 'input')
-        output_dir = os.path.join(temp_dir, 'output')
-        os.makedirs(input_dir, exist_ok=True)
-        os.makedirs(output_dir, exist_ok=True)
+        try:
+            job = jobs.create()
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 503
         
-        # Salva il file di mapping
-        mapping_path = os.path.join(temp_dir, mapping_file.filename)
-        mapping_file.save(mapping_path)
-        logging.info(f"File mapping salvato in: {mapping_path}")
+        # Salva il file di mapping (viene registrato dal job)
+        mapping_path = None
+        if not mapping_id:
+            mapping_path = str(job.directory / os.path.basename(mapping_file.filename))
+            mapping_file.save(mapping_path)
+            logging.info(f"File mapping salvato in: {mapping_path}")
         
         # Salva le immagini
         saved_images = []
         for img_file in images_files:
             if img_file.filename:
-                img_path = os.path.join(input_dir, img_file.filename)
+                img_path = os.path.join(job.input_dir, img_file.filename)
                 img_file.save(img_path)
                 saved_images.append(img_file.filename)
         
         logging.info(f"Immagini salvate: {len(saved_images)}")
         
         if not saved_images:
+            jobs.discard(job)
             return jsonify({'error': 'Nessuna immagine valida caricata.'}), 400
         
-        # Costruisci la mappa dal file
-        try:
-            logging.info(f"Tentativo di leggere file mapping: {mapping_path}")
-            mapping = build_map_auto(mapping_path)
-            logging.info(f"Mappa costruita con successo: {len(mapping)//2} coppie")
-        except Exception as e:
-            logging.error(f"Errore nel file di mapping: {str(e)}")
-            # Proviamo a leggere il file per vedere cosa contiene
-            try:
-                with open(mapping_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    logging.info(f"Contenuto del file CSV:\n{content[:500]}")
-            except:
-                pass
-            return jsonify({'error': f'Errore nel file di mapping: {str(e)}'}), 400
-        
-        # Processa le immagini
-        try:
-            processed, skipped, errors = process_images(
-                mapping=mapping,
-                input_dir=input_dir,
-                output_dir=output_dir,
-                exts=['png', 'jpg', 'jpeg', 'bmp', 'gif'],
-                dry_run=False
-            )
-            logging.info(f"Processamento completato: {processed} processati, {skipped} saltati, {errors} errori")
-        except Exception as e:
-            logging.error(f"Errore durante il processamento: {str(e)}")
-            return jsonify({'error': f'Errore durante il processamento: {str(e)}'}), 500
-        
-        # Crea ZIP con i risultati
-        zip_path = os.path.join(temp_dir, 'immagini_rinominate.zip')
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for file_path in Path(output_dir).iterdir():
-                if file_path.is_file():
-                    zipf.write(file_path, file_path.name)
-        
-        # Copia il ZIP nella cartella output per il download
-        final_zip_path = os.path.join(app.config['OUTPUT_FOLDER'], 'immagini_rinominate.zip')
-        shutil.copy2(zip_path, final_zip_path)
-        
-        # Pulisci file temporanei
-        shutil.rmtree(temp_dir)
-        
-        return jsonify({
-            'success': True,
-            'message': 'Processamento completato con successo!',
-            'stats': {
-                'processed': processed,
-                'skipped': skipped,
-                'errors': errors,
-                'total_uploaded': len(saved_images)
-            },
-            'download_url': '/download'
-        })
+        return _start_upload_job(job, len(saved_images), mapping_path=mapping_path, mapping_id=mapping_id)
         
     except Exception as e:
         logging.error(f"Errore nell'upload: {str(e)}")
+        if job is not None:
+            jobs.discard(job)
         return jsonify({'error': f'Errore interno: {str(e)}'}), 500
 
-@app.route('/download')
-def download_result():
-    """Permette di scaricare il file ZIP con i risultati."""
-    zip_path = os.path.join(app.config['OUTPUT_FOLDER'], 'immagini_rinominate.zip')
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Apre una sessione di upload a blocchi.
+    
+    Corpo JSON: {"mapping": {"name", "size"}, "images": [{"name", "size"}, ...],
+    "chunk_size": opzionale}. Il file di mapping ha indice 0, le immagini
+    seguono nell'ordine dato. Al posto di "mapping" si può indicare
+    "mapping_id" di una mappa registrata: in quel caso le immagini partono
+    dall'indice 0.
+    """
+    data = request.get_json(silent=True) or {}
+    mapping_id = data.get('mapping_id')
+    if mapping_id and mapping_id not in mappings:
+        return jsonify({'error': 'Mappa non trovata.'}), 404
+    try:
+        session = uploads.create(data.get('mapping'), data.get('images') or [],
+                                 data.get('chunk_size') or DEFAULT_CHUNK_SIZE,
+                                 mapping_id=mapping_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    logging.info(f"Upload {session.id} aperto: {session.image_count} immagini")
+    return jsonify(session.status()), 201
+
+@app.route('/uploads/<upload_id>')
+def upload_status(upload_id):
+    """Stato di una sessione, con i blocchi ancora mancanti per ogni file."""
+    session = uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload non trovato.'}), 404
+    return jsonify(session.status())
+
+@app.route('/uploads/<upload_id>/files/<int:file_index>/chunks/<int:chunk_index>', methods=['PUT'])
+def upload_chunk(upload_id, file_index, chunk_index):
+    """Riceve un blocco (corpo grezzo) e lo scrive al suo posto nel file."""
+    session = uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload non trovato.'}), 404
+    try:
+        session.write_chunk(file_index, chunk_index, request.stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'received': True})
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Chiude una sessione completa e avvia il job di processamento."""
+    session = uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload non trovato.'}), 404
+    
+    status = session.status()
+    if not status['complete']:
+        status['error'] = 'Upload incompleto: mancano alcuni blocchi.'
+        return jsonify(status), 409
+    
+    # Un retry o due finalize concorrenti (anche su worker diversi): solo una
+    # richiesta ottiene la sessione, le altre ricevono 409
+    session = uploads.claim(session)
+    if session is None:
+        return jsonify({'error': 'Upload già finalizzato.'}), 409
+    
+    try:
+        job = jobs.create()
+    except RuntimeError as e:
+        uploads.release(session)
+        return jsonify({'error': str(e)}), 503
+    
+    try:
+        # Spostamento (stesso filesystem): nessuna copia dei dati
+        mapping_path = None
+        if session.mapping_id is None:
+            mapping_path = str(job.directory / session.files[0]['name'])
+            shutil.move(str(session.file_path(0)), mapping_path)
+        job.input_dir.rmdir()
+        shutil.move(str(session.directory / 'images'), str(job.input_dir))
+    except OSError as e:
+        # La sessione riservata resta su disco fino alla scadenza (UPLOAD_TTL)
+        jobs.discard(job)
+        logging.error(f"Finalizzazione dell'upload {session.id} non riuscita: {str(e)}")
+        return jsonify({'error': 'Finalizzazione non riuscita.'}), 500
+    uploads.remove(session)
+    
+    return _start_upload_job(job, session.image_count, mapping_path=mapping_path,
+                             mapping_id=session.mapping_id)
+
+def _start_upload_job(job, total_images, mapping_path=None, mapping_id=None):
+    """Mette in coda il processamento di un job e risponde con il suo ID."""
+    jobs.start(job, lambda job: _timed_job(job, total_images, mapping_path, mapping_id))
+    logging.info(f"Job {job.id} in coda")
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': f'/jobs/{job.id}'
+    }), 202
+
+def _timed_job(job, total_images, mapping_path, mapping_id):
+    """_run_upload_job con la sua durata nelle metriche."""
+    started = time.perf_counter()
+    try:
+        stats = _run_upload_job(job, total_images, mapping_path, mapping_id)
+    except Exception:
+        job_duration.observe(time.perf_counter() - started, status='failed')
+        raise
+    job_duration.observe(time.perf_counter() - started, status='done')
+    return stats
+
+def _run_upload_job(job, total_images, mapping_path=None, mapping_id=None):
+    """Prepara la mappa e rinomina le immagini di un job (eseguita sul pool)."""
+    job.update(stage='Lettura file di mapping')
+    try:
+        # Un file caricato viene registrato: se lo stesso catalogo è già
+        # noto, la mappa compilata viene riusata senza rileggerlo
+        if mapping_path:
+            mapping_id = mappings.register_file(mapping_path, move=True)
+        mapping = mappings.get(mapping_id)
+        logging.info(f"Mappa {mapping_id} pronta: {len(mapping)//2} coppie")
+    except Exception as e:
+        logging.error(f"Errore nel file di mapping: {str(e)}")
+        raise ValueError(f'Errore nel file di mapping: {str(e)}')
+    
+    job.progress('Rinomina immagini', 0, total_images)
+    options = ProcessOptions(
+        exts=['png', 'jpg', 'jpeg', 'bmp', 'gif'],
+        dry_run=False,
+        # Input e output stanno nella cartella del job: un hardlink evita
+        # di duplicare ogni immagine
+        mode='hardlink',
+        # Nel log del server solo il riepilogo: il dettaglio è nel report del job
+        quiet=True
+    )
+    report = process_images(
+        mapping=mapping,
+        input_dir=str(job.input_dir),
+        output_dir=str(job.output_dir),
+        options=options,
+        progress=lambda done: job.progress('Rinomina immagini', done, total_images)
+    )
+    processed, skipped, errors = report
+    logging.info(f"Job {job.id} completato: {processed} processati, {skipped} saltati, {errors} errori")
+    for stage in STAGES:
+        stage_seconds.inc(report.timings[stage], stage=stage)
+    for outcome, count in (('processed', processed), ('skipped', skipped), ('errors', errors)):
+        files_total.inc(count, outcome=outcome)
+    bytes_processed.inc(report.bytes_processed)
+    
+    # Lo ZIP viene generato in streaming al download: restano solo le
+    # immagini rinominate (hardlink, quindi l'input si può già eliminare)
+    shutil.rmtree(job.input_dir)
+    if app.config['DOWNLOAD_MODE'] == 'file':
+        job.update(stage='Creazione archivio')
+        _write_result_zip(job)
+    
+    return {
+        'mapping_id': mapping_id,
+        'processed': processed,
+        'skipped': skipped,
+        'errors': errors,
+        'total_uploaded': total_images,
+        'report': report.summary()
+    }
+
+def _write_result_zip(job):
+    """Scrive lo ZIP dei risultati nella cartella del job, al posto delle immagini."""
+    started = time.perf_counter()
+    files = [(str(path), path.name) for path in sorted(job.output_dir.iterdir()) if path.is_file()]
+    size = write_zip(files, str(job.directory / RESULT_ZIP))
+    shutil.rmtree(job.output_dir)
+    stage_seconds.inc(time.perf_counter() - started, stage='zip')
+    logging.info(f"Job {job.id}: archivio di {size / 1e6:.1f} MB pronto")
+
+@app.route('/mappings', methods=['POST'])
+def register_mapping():
+    """
+    Registra un file di mapping e ne restituisce l'ID (hash del contenuto).
+    
+    Caricare di nuovo lo stesso file restituisce lo stesso ID senza
+    ricostruire la mappa.
+    """
+    mapping_file = request.files.get('mapping_file')
+    if mapping_file is None or not mapping_file.filename:
+        return jsonify({'error': 'File di mapping mancante.'}), 400
+    
+    # Salvato accanto al registro: la registrazione lo sposta senza copiarlo
+    extension = os.path.splitext(mapping_file.filename)[1].lower()
+    upload_path = os.path.join(app.config['MAPPINGS_FOLDER'], f".upload-{uuid.uuid4().hex}{extension}")
+    mapping_file.save(upload_path)
+    try:
+        mapping_id = mappings.register_file(upload_path, move=True)
+    except Exception as e:
+        logging.error(f"Errore nel file di mapping: {str(e)}")
+        return jsonify({'error': f'Errore nel file di mapping: {str(e)}'}), 400
+    finally:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+    
+    return jsonify(mappings.info(mapping_id)), 201
+
+@app.route('/mappings/<mapping_id>')
+def mapping_info(mapping_id):
+    """Informazioni su una mappa registrata."""
+    if mapping_id not in mappings:
+        return jsonify({'error': 'Mappa non trovata.'}), 404
+    return jsonify(mappings.info(mapping_id))
+
+@app.route('/mappings/<mapping_id>/keys')
+def mapping_keys(mapping_id):
+    """Tutti i codici di una mappa (entrambe le colonne)."""
+    if mapping_id not in mappings:
+        return jsonify({'error': 'Mappa non trovata.'}), 404
+    return _immutable(jsonify({'mapping_id': mapping_id, 'keys': list(mappings.get(mapping_id))}))
+
+@app.route('/mappings/<mapping_id>/bloom')
+def mapping_bloom(mapping_id):
+    """
+    Filtro di Bloom dei codici di una mappa (circa 1,2 byte per codice con
+    l'1% di falsi positivi): il browser lo usa per non caricare le immagini
+    il cui codice non è nella mappa.
+    """
+    if mapping_id not in mappings:
+        return jsonify({'error': 'Mappa non trovata.'}), 404
+    return _immutable(jsonify(_bloom_for(mapping_id)))
+
+@lru_cache(maxsize=16)
+def _bloom_for(mapping_id):
+    return dict(BloomFilter.from_keys(mappings.get(mapping_id)).to_dict(), mapping_id=mapping_id)
+
+def _immutable(response):
+    """Il contenuto di una mappa non cambia mai per lo stesso ID: il browser può tenerlo in cache."""
+    response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Stato e avanzamento di un job."""
+    state = jobs.get(job_id)
+    if state is None:
+        return jsonify({'error': 'Job non trovato.'}), 404
+    
+    if state['status'] == DONE:
+        state['download_url'] = f'/jobs/{job_id}/download'
+    return jsonify(state)
+
+@app.route('/jobs/<job_id>/download')
+def download_result(job_id):
+    """
+    Scarica il file ZIP con i risultati di un job.
     
-    if not os.path.exists(zip_path):
+    Con DOWNLOAD_MODE=stream l'archivio non viene mai scritto su disco: è
+    generato mentre viene inviato al client (JPEG/PNG/GIF senza
+    ricompressione). Con DOWNLOAD_MODE=file è già pronto nella cartella del
+    job e viene inviato con sendfile, o dal proxy (SENDFILE_HEADER).
+    """
+    state = jobs.get(job_id)
+    if state is None or state['status'] != DONE:
         return jsonify({'error': 'File di download non trovato.'}), 404
     
-    return send_file(
-        zip_path,
-        as_attachment=True,
-        download_name='immagini_rinominate.zip',
-        mimetype='application/zip'
+    # La cartella può essere eliminata da cleanup() in qualsiasi momento
+    job_dir = jobs.job_dir(job_id)
+    if job_dir is None:
+        return jsonify({'error': 'File di download non trovato.'}), 404
+    try:
+        zip_path = job_dir / RESULT_ZIP
+        if zip_path.exists():
+            return _send_result_zip(zip_path)
+        files = [(str(path), path.name) for path in sorted((job_dir / 'output').iterdir())
+                 if path.is_file()]
+    except FileNotFoundError:
+        return jsonify({'error': 'File di download non trovato.'}), 404
+    return Response(
+        stream_with_context(_measured_zip(files)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=immagini_rinominate.zip'}
     )
 
+def _send_result_zip(zip_path):
+    """Risposta con lo ZIP già scritto: sendfile (gunicorn) o header per il proxy."""
+    zip_bytes.inc(zip_path.stat().st_size)
+    header = app.config['SENDFILE_HEADER']
+    if not header:
+        # Con conditional=True anche le richieste Range: download riprendibili
+        return send_file(zip_path.resolve(), mimetype='application/zip', as_attachment=True,
+                         download_name=RESULT_ZIP, conditional=True, max_age=0)
+    
+    if header == 'X-Accel-Redirect':
+        relative = zip_path.resolve().relative_to(Path(app.config['OUTPUT_FOLDER']).resolve())
+        location = app.config['SENDFILE_PREFIX'].rstrip('/') + '/' + relative.as_posix()
+    else:
+        location = str(zip_path.resolve())
+    response = Response(mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename={RESULT_ZIP}'
+    response.headers[header] = location
+    return response
+
+def _measured_zip(files):
+    """iter_zip con durata (fase 'zip') e byte inviati nelle metriche."""
+    started = time.perf_counter()
+    sent = 0
+    try:
+        for chunk in iter_zip(files):
+            sent += len(chunk)
+            yield chunk
+    finally:
+        stage_seconds.inc(time.perf_counter() - started, stage='zip')
+        zip_bytes.inc(sent)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metriche del processo nel formato testo di Prometheus."""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
 @app.route('/download-example-csv')
 def download_example_csv():
     """Fornisce un file CSV di esempio corretto."""
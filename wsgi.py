@@ -0,0 +1,25 @@
+"""
+Entry point WSGI della web app per i server di produzione:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Rispetto a `python web_app.py` (server di sviluppo di Flask) gli ZIP dei
+risultati vengono scritti a fine job e inviati con sendfile
+(DOWNLOAD_MODE=file), e le mappe registrate più di recente vengono caricate
+subito: con preload_app una volta sola nel master, prima del fork dei worker.
+"""
+
+import logging
+import os
+
+os.environ.setdefault('DOWNLOAD_MODE', 'file')
+
+from web_app import app, mappings  # noqa: E402
+
+
+# Mappe caricate all'avvio (MAPPING_PRELOAD=0 per disattivare)
+preloaded = mappings.preload(int(os.environ.get('MAPPING_PRELOAD', 8)))
+if preloaded:
+    logging.info(f"Mappe precaricate: {preloaded}")
+
+application = app